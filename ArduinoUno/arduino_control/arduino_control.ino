@@ -11,49 +11,209 @@ Adafruit_DCMotor *linearActuator2 = AFMS.getMotor(2); // 2nd linear actuator for
 Adafruit_DCMotor *motorX = AFMS.getMotor(3); // DC motor for moving in the X axis
 Adafruit_DCMotor *motorY = AFMS.getMotor(4); // DC motor for moving in the Y axis
 
-// command received over serial port
-String command = "";
+// binary protocol, see PC/common/binary_protocol.py
+// frame: SYNC | VERSION << 4 | OPCODE | PAYLOAD | CRC8 (polynomial 0x07 over version/opcode byte and payload)
+#define SYNC 0xA5
+#define PROTOCOL_VERSION 1
+#define OPCODE_MOTOR 0x1        // payload: int16 X motor speed, int16 Y motor speed (little-endian)
+#define OPCODE_GUN_ON 0x2
+#define OPCODE_GUN_OFF 0x3
+#define OPCODE_TRIGGER 0x4
+#define OPCODE_SET_BAUD 0x5     // payload: uint32 baud rate (little-endian), acknowledged before switching
+#define OPCODE_ACK 0xF          // payload: uint8 acknowledged opcode
+#define MAX_FRAME_LENGTH 7
 
+#define DEFAULT_BAUD_RATE 9600
+const uint32_t SUPPORTED_BAUD_RATES[] = {9600, 19200, 38400, 57600, 115200, 250000, 500000, 1000000};
 
-void parse_and_execute_command(String command) {
+// ASCII command received over serial port
+#define MAX_COMMAND_LENGTH 32
+char command[MAX_COMMAND_LENGTH + 1];
+uint8_t command_length = 0;
 
-    if (command == "TRG") {
+// binary frame received over serial port, frame_length = 0 means waiting for SYNC
+uint8_t frame[MAX_FRAME_LENGTH];
+uint8_t frame_length = 0;
+uint8_t payload_length = 0;
+
+// set once the motor shield is configured in setup()
+bool motor_shield_found = false;
+
+// command LED is turned off in loop() instead of blocking the command processing
+#define LED_ON_TIME_IN_MS 100
+unsigned long led_on_time = 0;
+
+
+void parse_and_execute_command(const char *command) {
+
+    if (strcmp(command, "TRG") == 0) {
         Serial.println("FIRE!!!");
         // pull_trigger();
     }
-    else if (command == "GUN_ON") {
+    else if (strcmp(command, "GUN_ON") == 0) {
         Serial.println("Turn on gun motor");
         gun_on();
     }
-    else if (command == "GUN_OFF") {
+    else if (strcmp(command, "GUN_OFF") == 0) {
         Serial.println("Turn off gun motor");
         gun_off();
     }
+    else if (strncmp(command, "DC ", 3) == 0 && strchr(command + 3, ' ') != NULL) {
+        Serial.println("Motor control");
+
+        // motor control command "DC <motor_speed_x> <motor_speed_y>"
+        const char *motor_speed_x_str = command + 3;
+        const char *motor_speed_y_str = strchr(motor_speed_x_str, ' ') + 1;
+
+        int motor_speed_x = atoi(motor_speed_x_str);
+        int motor_speed_y = atoi(motor_speed_y_str);
+
+        Serial.println(motor_speed_x);
+        Serial.println(motor_speed_y);
+
+        set_motor_x_y_speed(motor_speed_x, motor_speed_y);
+    }
     else {
-        String tmp = command.substring(0, command.indexOf("_"));
+        // other commands are not supported
+        Serial.println("CMD unknown");
+    }
 
-        if (tmp == "DC") {
-            Serial.println("Motor control");
+    return;
+}
 
-            String tmp2 = command.substring(command.indexOf("_") + 1);
-            String motor_speed_x_str = tmp2.substring(0, tmp2.indexOf("_"));
-            String motor_speed_y_str = tmp2.substring(tmp2.indexOf("_") + 1);
 
-            Serial.println(motor_speed_x_str);
-            Serial.println(motor_speed_y_str);
+uint8_t crc8(const uint8_t *data, uint8_t length) {
+    uint8_t crc = 0;
 
-            // motor control command
-            int motor_speed_x = motor_speed_x_str.toInt();
-            int motor_speed_y = motor_speed_y_str.toInt();
+    for (uint8_t i = 0; i < length; i++) {
+        crc ^= data[i];
+        for (uint8_t bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
         }
-        else {
-            Serial.println("CMD unknown");
+    }
+
+    return crc;
+}
+
+
+int8_t get_payload_length(uint8_t opcode) {
+    switch (opcode) {
+        case OPCODE_MOTOR: return 4;
+        case OPCODE_GUN_ON: return 0;
+        case OPCODE_GUN_OFF: return 0;
+        case OPCODE_TRIGGER: return 0;
+        case OPCODE_SET_BAUD: return 4;
+        default: return -1;
+    }
+}
+
+
+void send_ack(uint8_t opcode) {
+    uint8_t ack[4] = {SYNC, (PROTOCOL_VERSION << 4) | OPCODE_ACK, opcode, 0};
+    ack[3] = crc8(ack + 1, 2);
+    Serial.write(ack, sizeof(ack));
+}
+
+
+bool is_baud_rate_supported(uint32_t baud_rate) {
+    for (uint8_t i = 0; i < sizeof(SUPPORTED_BAUD_RATES) / sizeof(SUPPORTED_BAUD_RATES[0]); i++) {
+        if (SUPPORTED_BAUD_RATES[i] == baud_rate) {
+            return true;
         }
+    }
+    return false;
+}
 
-        // other commands are not supported
+
+void execute_frame(uint8_t opcode, const uint8_t *payload) {
+
+    if (opcode == OPCODE_MOTOR) {
+        int16_t motor_speed_x = (int16_t)(payload[0] | (payload[1] << 8));
+        int16_t motor_speed_y = (int16_t)(payload[2] | (payload[3] << 8));
+        set_motor_x_y_speed(motor_speed_x, motor_speed_y);
+    }
+    else if (opcode == OPCODE_GUN_ON) {
+        gun_on();
+    }
+    else if (opcode == OPCODE_GUN_OFF) {
+        gun_off();
     }
+    else if (opcode == OPCODE_TRIGGER) {
+        // pull_trigger();
+    }
+    else if (opcode == OPCODE_SET_BAUD) {
+        uint32_t baud_rate = (uint32_t)payload[0] | ((uint32_t)payload[1] << 8) | ((uint32_t)payload[2] << 16) |
+            ((uint32_t)payload[3] << 24);
 
-    return;
+        if (is_baud_rate_supported(baud_rate)) {
+            // acknowledge at the old baud rate and switch after the acknowledgement is transmitted
+            send_ack(OPCODE_SET_BAUD);
+            Serial.flush();
+            Serial.end();
+            Serial.begin(baud_rate);
+        }
+    }
+}
+
+
+void parse_frame_byte(uint8_t c) {
+    frame[frame_length++] = c;
+
+    if (frame_length == 2) {
+        // version and opcode
+        int8_t length = get_payload_length(c & 0x0F);
+        if ((c >> 4) != PROTOCOL_VERSION || length < 0) {
+            frame_length = 0;
+            return;
+        }
+        payload_length = length;
+        return;
+    }
+
+    if (frame_length < 3 + payload_length) {
+        return;
+    }
+
+    frame_length = 0;
+
+    // reject corrupted frames
+    if (crc8(frame + 1, 1 + payload_length) != frame[2 + payload_length]) {
+        return;
+    }
+
+    execute_frame(frame[1] & 0x0F, frame + 2);
+    signal_command();
+}
+
+
+void signal_command() {
+    // signal receiving of the command
+    digitalWrite(13, HIGH);
+    led_on_time = millis();
+}
+
+
+void set_motor_speed(Adafruit_DCMotor *motor, int speed) {
+    if (!motor_shield_found) {
+        return;
+    }
+
+    motor->setSpeed(constrain(abs(speed), 0, 255));
+    if (speed > 0) {
+        motor->run(FORWARD);
+    }
+    else if (speed < 0) {
+        motor->run(BACKWARD);
+    }
+    else {
+        motor->run(RELEASE);
+    }
+}
+
+
+void set_motor_x_y_speed(int motor_speed_x, int motor_speed_y) {
+    set_motor_speed(motorX, motor_speed_x);
+    set_motor_speed(motorY, motor_speed_y);
 }
 
 
@@ -103,39 +263,44 @@ void setup() {
     //     linearActuator2->run(RELEASE);
     //     motorX->run(RELEASE);
     //     motorY->run(RELEASE);
+    //
+    //     motor_shield_found = true;
     // }
     // else {
     //     return;
     // }
 
     // configure serial port
-    // set up Serial library at 9600 bps
-    Serial.begin(9600);
+    // set up Serial library at 9600 bps, the PC can switch to a higher baud rate with binary protocol
+    Serial.begin(DEFAULT_BAUD_RATE);
 }
 
 void loop() {
 
-    if (Serial.available()) {
+    while (Serial.available()) {
 
-        // read a single character from serial port
-        char c = Serial.read();
+        // read a single byte from serial port
+        uint8_t c = Serial.read();
 
-        if (c == '\n') {
+        // binary frames start with SYNC which is never part of an ASCII command
+        if (frame_length > 0 || (c == SYNC && command_length == 0)) {
+            parse_frame_byte(c);
+        }
+        else if (c == '\n') {
+            command[command_length] = '\0';
             Serial.println("CMD received");
             Serial.println(command);
             parse_and_execute_command(command);
-            command = "";
-
-            // signal receiving of the command
-            digitalWrite(13, HIGH);
-            delay(500);
-            digitalWrite(13, LOW);
-            delay(500);
+            command_length = 0;
+            signal_command();
         }
-        else {
-            command += c;
+        else if (command_length < MAX_COMMAND_LENGTH) {
+            command[command_length++] = c;
         }
     }
 
-    // TODO: Support other commands
+    if (led_on_time != 0 && millis() - led_on_time >= LED_ON_TIME_IN_MS) {
+        digitalWrite(13, LOW);
+        led_on_time = 0;
+    }
 }
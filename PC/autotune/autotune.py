@@ -0,0 +1,289 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2.aruco as aruco
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.markers import create_detector, get_detector_parameters, save_detector_parameters
+from common.session_recorder import RECORDS_FILE, SessionReader
+from common.synthetic_camera import create_default_scene
+from replay.replay import read_frames, split_into_tasks
+
+
+# candidate values of the searched detector parameters, the number of adaptive thresholding passes
+# ((max - min) / step + 1) has the largest effect on the detection time
+PARAMETER_SPACE = {
+    'adaptiveThreshWinSizeMin': (3, 5, 7, 11),
+    'adaptiveThreshWinSizeMax': (7, 11, 15, 23, 35),
+    'adaptiveThreshWinSizeStep': (4, 6, 10, 20),
+    'minMarkerPerimeterRate': (0.01, 0.02, 0.03, 0.05, 0.08),
+    'maxMarkerPerimeterRate': (1.0, 2.0, 4.0),
+    'polygonalApproxAccuracyRate': (0.02, 0.03, 0.05, 0.08),
+    'cornerRefinementMethod': (aruco.CORNER_REFINE_NONE, aruco.CORNER_REFINE_SUBPIX),
+}
+
+DEFAULT_MIN_RECALL = 0.98
+DEFAULT_NUM_CANDIDATES = 40
+
+# a labelled marker is detected if a marker with its ID is found with corners at most this far away on average
+MAX_CORNER_ERROR_IN_PIXELS = 3.0
+
+DEFAULT_OUTPUT_PATH = 'detector_params.json'
+
+
+# set root logger log level
+logging.getLogger().setLevel(logging.INFO)
+
+
+def load_synthetic_frames(num_frames, seed=0, **kwargs):
+    '''
+    Returns:
+        frames (list): tuples of video frame and labels (list of marker ID and corners, shape (4, 2)) from the
+            ground truth of the synthetic scene
+    '''
+
+    synthetic_camera = create_default_scene(seed=seed, **kwargs)
+    frames = []
+    for i in range(num_frames):
+        ret, video_frame = synthetic_camera.read()
+        frames.append((video_frame, [(marker_id, np.asarray(corners)) for marker_id, corners
+                                     in synthetic_camera.ground_truth]))
+    return frames
+
+
+def load_session_frames(path, max_frames=None):
+    '''
+    Returns:
+        frames (list): tuples of recorded video frame and labels (list of marker ID and corners) from the markers
+            detected during the recording
+    '''
+
+    frames = []
+    with SessionReader(path) as session:
+        for record, video_frame in session:
+            if video_frame is None:
+                continue
+            labels = [(int(marker_id), np.asarray(corners).reshape(4, 2))
+                      for marker_id, corners in zip(record['marker_ids'], record['marker_corners'])]
+            frames.append((video_frame, labels))
+            if max_frames is not None and len(frames) >= max_frames:
+                break
+    return frames
+
+
+def load_unlabelled_frames(source, max_frames=None, detection_scale=1.0):
+    '''
+    Reads frames of a video file, image directory or raw frame log and labels them with the markers found by the
+    detector with default parameters, so the recall of a candidate is relative to the defaults
+
+    Returns:
+        frames (list): tuples of video frame and labels (list of marker ID and corners)
+    '''
+
+    detect_markers = create_detector(detection_scale)
+    frames = []
+    for task in split_into_tasks([source], chunk_size=max_frames or sys.maxsize):
+        for video_frame in read_frames(*task):
+            marker_corners, marker_ids = detect_markers(video_frame)
+            labels = [] if marker_ids is None else [
+                (int(marker_id), corners.reshape(4, 2)) for marker_id, corners in zip(marker_ids.ravel(), marker_corners)]
+            frames.append((np.array(video_frame), labels))
+            if max_frames is not None and len(frames) >= max_frames:
+                return frames
+    return frames
+
+
+def load_frames(source, max_frames=None, detection_scale=1.0):
+    '''
+    Loads labelled frames of a recorded session or labels frames of any other source, see load_unlabelled_frames()
+    '''
+
+    if os.path.isfile(os.path.join(source, RECORDS_FILE)):
+        return load_session_frames(source, max_frames)
+
+    return load_unlabelled_frames(source, max_frames, detection_scale)
+
+
+def count_detected(labels, marker_corners, marker_ids):
+    '''
+    Returns:
+        true_positives (int): number of labelled markers which were detected at their position
+        false_positives (int): number of detections not matching any labelled marker
+    '''
+
+    detections = [] if marker_ids is None else [
+        (int(marker_id), corners.reshape(4, 2)) for marker_id, corners in zip(marker_ids.ravel(), marker_corners)]
+
+    true_positives = 0
+    for label_id, label_corners in labels:
+        for i, (marker_id, corners) in enumerate(detections):
+            if marker_id == label_id and \
+                    np.linalg.norm(corners - label_corners, axis=1).mean() <= MAX_CORNER_ERROR_IN_PIXELS:
+                true_positives += 1
+                del detections[i]
+                break
+
+    return true_positives, len(detections)
+
+
+def evaluate(frames, detector_parameters, detection_scale=1.0, min_recall=0.0):
+    '''
+    Measures detection time and recall of the detector parameters
+
+    Parameters:
+        frames (list): tuples of video frame and labels
+        detector_parameters (dict): detector parameters, see create_detector()
+        detection_scale (float): scale factor of the frame used for detection, see create_detector()
+        min_recall (float): evaluation stops as soon as the recall cannot reach it any more
+
+    Returns:
+        result (dict): parameters, recall, false positives, mean detection time per frame in seconds and whether
+            the evaluation was stopped early (pruned)
+    '''
+
+    detect_markers = create_detector(detection_scale, detector_parameters)
+    num_labels = sum(len(labels) for video_frame, labels in frames)
+    max_missed = int((1 - min_recall) * num_labels + 1e-9)
+
+    detected = missed = false_positives = 0
+    detection_time = 0.0
+    for video_frame, labels in frames:
+        start_time = time.perf_counter()
+        marker_corners, marker_ids = detect_markers(video_frame)
+        detection_time += time.perf_counter() - start_time
+
+        true_positives, frame_false_positives = count_detected(labels, marker_corners, marker_ids)
+        detected += true_positives
+        missed += len(labels) - true_positives
+        false_positives += frame_false_positives
+        if missed > max_missed:
+            break
+
+    return {
+        'parameters': detector_parameters,
+        'recall': detected / num_labels if num_labels > 0 else 1.0,
+        'false_positives': false_positives,
+        'time_per_frame': detection_time / len(frames),
+        'pruned': missed > max_missed,
+    }
+
+
+def generate_candidates(num_candidates, seed=0):
+    '''
+    Returns:
+        candidates (list): detector parameters (dict), the defaults first, followed by random valid combinations of
+            the PARAMETER_SPACE values
+    '''
+
+    rng = np.random.default_rng(seed)
+    candidates = [get_detector_parameters()]
+    seen = {tuple(candidates[0].items())}
+
+    # the space is large enough, but give up on duplicates at some point
+    for attempt in range(num_candidates * 100):
+        if len(candidates) >= num_candidates:
+            break
+
+        candidate = {name: values[rng.integers(len(values))] for name, values in PARAMETER_SPACE.items()}
+        candidate = {name: value.item() if isinstance(value, np.generic) else value for name, value in candidate.items()}
+        if candidate['adaptiveThreshWinSizeMin'] > candidate['adaptiveThreshWinSizeMax']:
+            continue
+        if tuple(candidate.items()) in seen:
+            continue
+
+        seen.add(tuple(candidate.items()))
+        candidates.append(candidate)
+
+    return candidates
+
+
+def autotune(frames, min_recall=DEFAULT_MIN_RECALL, num_candidates=DEFAULT_NUM_CANDIDATES, detection_scale=1.0,
+             seed=0):
+    '''
+    Searches the detector parameters for the fastest set keeping the recall at or above min_recall
+
+    Returns:
+        best (dict): result of the fastest candidate meeting the recall, as returned by evaluate(), or of the one
+            with the highest recall if none meets it
+        results (list): results of all candidates, the defaults first
+    '''
+
+    results = []
+    for i, candidate in enumerate(generate_candidates(num_candidates, seed)):
+        result = evaluate(frames, candidate, detection_scale, min_recall)
+        results.append(result)
+        logging.info(f'Candidate {i + 1}/{num_candidates}: recall {result["recall"]:.3f}'
+                     f'{" (pruned)" if result["pruned"] else ""}, {result["time_per_frame"] * 1000:.2f} ms')
+
+    passing = [result for result in results if not result['pruned'] and result['recall'] >= min_recall]
+    if not passing:
+        logging.warning(f'No candidate reached a recall of {min_recall}, using the one with the highest recall')
+        return max(results, key=lambda result: (result['recall'], -result['time_per_frame'])), results
+
+    return min(passing, key=lambda result: result['time_per_frame']), results
+
+
+def main():
+
+    logging.info('Detector Autotune App')
+
+    # input arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="*",
+                    help="recorded sessions (labelled by the recorded detections), video files, image directories "
+                         "and/or raw frame logs (labelled by the detector with default parameters)")
+    parser.add_argument("--synthetic", default=0, type=int,
+                    help="number of synthetic frames labelled by the ground truth of the synthetic scene")
+    parser.add_argument("--seed", default=0, type=int,
+                    help="random seed of the synthetic scene and of the search")
+    parser.add_argument("--max_frames", default=200, type=int,
+                    help="max. number of frames used from each source")
+    parser.add_argument("--min_recall", default=DEFAULT_MIN_RECALL, type=float,
+                    help="min. fraction of labelled markers the parameters have to detect")
+    parser.add_argument("--candidates", default=DEFAULT_NUM_CANDIDATES, type=int,
+                    help="number of evaluated parameter sets including the defaults")
+    parser.add_argument("-s", "--detection_scale", default=1.0, type=float,
+                    help="scale of the frame used for marker detection in range (0, 1], 0 = automatic")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_PATH,
+                    help="detector parameter file to write, loaded by pc_control/dummy_camera --detector_params")
+    args = parser.parse_args()
+
+    frames = []
+    if args.synthetic > 0:
+        frames += load_synthetic_frames(args.synthetic, args.seed)
+    for source in args.sources:
+        frames += load_frames(source, args.max_frames, args.detection_scale)
+
+    if not frames:
+        logging.error('No frames to tune on, give sources or --synthetic')
+        return
+
+    logging.info(f'Tuning on {len(frames)} frames with {sum(len(labels) for frame, labels in frames)} labelled '
+                 f'markers')
+    best, results = autotune(frames, args.min_recall, args.candidates, args.detection_scale, args.seed)
+    default = results[0]
+
+    logging.info(f'Default parameters: recall {default["recall"]:.3f}, {default["time_per_frame"] * 1000:.2f} ms')
+    logging.info(f'Best parameters: recall {best["recall"]:.3f}, {best["time_per_frame"] * 1000:.2f} ms')
+    logging.info(f'{best["parameters"]}')
+
+    save_detector_parameters(args.output, best['parameters'], {
+        'recall': best['recall'],
+        'time_per_frame': best['time_per_frame'],
+        'default_recall': default['recall'],
+        'default_time_per_frame': default['time_per_frame'],
+        'min_recall': args.min_recall,
+        'detection_scale': args.detection_scale,
+        'frames': len(frames),
+        'candidates': len(results),
+    })
+    logging.info(f'Wrote detector parameters to {args.output}')
+    logging.info('DONE')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+import serial
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.annotation import draw_markers, draw_targeting, draw_text
+from common.markers import create_detector, get_marker_center
+from common.overlay import OverlayAsset, composite_overlay
+from pc_control.pc_control import send_motor_x_y_speed
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+RESOLUTIONS = {
+    'VGA': (640, 480),
+    'HD': (1280, 720),
+    'FHD': (1920, 1080),
+    '4K': (3840, 2160),
+}
+
+MARKER_COUNTS = (1, 4, 16)
+
+STAGES = ('acquire', 'detect', 'overlay', 'annotate', 'command')
+
+# stage is considered regressed if it is slower than baseline by more than the tolerance...
+DEFAULT_TOLERANCE = 0.5
+# ... and by more than this absolute time, so that very fast stages do not fail on timer noise
+MIN_REGRESSION_IN_MS = 0.05
+
+DEFAULT_REPEATS = 20
+
+
+# set root logger log level
+logging.getLogger().setLevel(logging.INFO)
+
+
+def create_synthetic_frame(width, height, num_markers, seed=0):
+    '''
+    Creates a frame with DICT_4X4_250 markers laid out on a grid over a smooth noisy background
+
+    Returns:
+        video_frame (numpy.ndarray): BGR frame
+    '''
+
+    rng = np.random.default_rng(seed)
+    dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+
+    # smooth background with mild sensor noise
+    background = rng.integers(60, 200, size=(9, 16, 3), dtype=np.uint8)
+    video_frame = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+    video_frame = cv2.add(video_frame, rng.integers(0, 8, size=(height, width, 3), dtype=np.uint8))
+
+    grid_size = int(np.ceil(np.sqrt(num_markers)))
+    cell_w, cell_h = width // grid_size, height // grid_size
+    marker_size = int(min(cell_w, cell_h) * 0.5)
+
+    for i in range(num_markers):
+        marker = cv2.cvtColor(aruco.drawMarker(dictionary, i % 2, marker_size), cv2.COLOR_GRAY2BGR)
+        # white quiet zone around the marker
+        border = marker_size // 6
+        marker = cv2.copyMakeBorder(marker, border, border, border, border, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+        x = (i % grid_size) * cell_w + (cell_w - marker.shape[1]) // 2
+        y = (i // grid_size) * cell_h + (cell_h - marker.shape[0]) // 2
+        video_frame[y:y + marker.shape[0], x:x + marker.shape[1]] = marker
+
+    return video_frame
+
+
+def time_stage(function, repeats):
+    '''
+    Returns:
+        time (float): median time of a single call in milliseconds
+    '''
+
+    # warm up
+    function()
+
+    times = []
+    for i in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    return float(np.median(times) * 1000)
+
+
+def benchmark_configuration(width, height, num_markers, repeats):
+    '''
+    Times every stage of the frame loop on a synthetic frame
+
+    Returns:
+        results (dict): key = stage name, value = median time in milliseconds
+    '''
+
+    video_frame = create_synthetic_frame(width, height, num_markers)
+    frame_center = (int(width/2), int(height/2))
+
+    # cameras deliver MJPG compressed frames which have to be decoded
+    encoded_frame = cv2.imencode('.jpg', video_frame)[1]
+
+    detect_markers = create_detector()
+    marker_corners, marker_ids = detect_markers(video_frame)
+    assert marker_ids is not None and len(marker_ids) == num_markers, \
+        f'Expected {num_markers} markers, detected {0 if marker_ids is None else len(marker_ids)}'
+
+    ar_img = cv2.imread(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'images', 'foe.png'))
+    w, h = ar_img.shape[0:2][::-1]
+    asset = OverlayAsset(ar_img, np.array([[0, 0], [w, 0], [w, h], [0, h]]))
+
+    control = {
+        'target': get_marker_center(marker_corners[0]),
+        'error_x': 100,
+        'error_y': -100,
+        'motor_speed_x': 100,
+        'motor_speed_y': -100,
+    }
+
+    def overlay():
+        display_frame = video_frame.copy()
+        for corners in marker_corners:
+            composite_overlay(display_frame, asset, corners)
+
+    def annotate():
+        display_frame = video_frame.copy()
+        display_frame = draw_text(display_frame, 'Time left: 10.00', line=0)
+        display_frame = draw_markers(display_frame, marker_corners, marker_ids, {})
+        draw_targeting(display_frame, frame_center, 50, control)
+
+    serial_port = serial.serial_for_url('loop://')
+
+    def command():
+        send_motor_x_y_speed(serial_port, control['motor_speed_x'], control['motor_speed_y'])
+        serial_port.reset_input_buffer()
+
+    results = {
+        'acquire': time_stage(lambda: cv2.imdecode(encoded_frame, cv2.IMREAD_COLOR), repeats),
+        'detect': time_stage(lambda: detect_markers(video_frame), repeats),
+        'overlay': time_stage(overlay, repeats),
+        'annotate': time_stage(annotate, repeats),
+        'command': time_stage(command, repeats),
+    }
+
+    serial_port.close()
+    return results
+
+
+def run_benchmarks(repeats=DEFAULT_REPEATS, resolutions=RESOLUTIONS, marker_counts=MARKER_COUNTS):
+    '''
+    Returns:
+        benchmark (dict): machine description and results, key = configuration name, value = stage times in ms
+    '''
+
+    results = {}
+    for resolution_name, (width, height) in resolutions.items():
+        for num_markers in marker_counts:
+            name = f'{resolution_name} {num_markers} markers'
+            results[name] = benchmark_configuration(width, height, num_markers, repeats)
+            logging.info(f'{name}: ' + ', '.join(f'{stage} {results[name][stage]:.3f} ms' for stage in STAGES))
+
+    return {
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+        },
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(benchmark, path=BASELINE_PATH):
+    with open(path, 'w') as baseline_file:
+        json.dump(benchmark, baseline_file, indent=4)
+        baseline_file.write('\n')
+
+
+def find_regressions(benchmark, baseline, tolerance=DEFAULT_TOLERANCE):
+    '''
+    Compares benchmark results against the baseline
+
+    Parameters:
+        benchmark (dict): as returned by run_benchmarks()
+        baseline (dict): as returned by load_baseline()
+        tolerance (float): allowed relative slow down, e.g. 0.5 = 50 %
+
+    Returns:
+        regressions (list): descriptions of all regressed stages
+    '''
+
+    regressions = []
+
+    for name, stages in benchmark['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        for stage, current_time in stages.items():
+            baseline_time = baseline['results'][name].get(stage)
+            if baseline_time is None:
+                continue
+
+            if current_time > baseline_time * (1 + tolerance) and current_time - baseline_time > MIN_REGRESSION_IN_MS:
+                regressions.append(f'{name} {stage}: {current_time:.3f} ms, baseline {baseline_time:.3f} ms')
+
+    return regressions
+
+
+def main():
+
+    logging.info('Frame Loop Benchmark')
+
+    # input arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--update", action="store_true",
+                    help="store results as the new baseline instead of comparing against it")
+    parser.add_argument("-r", "--repeats", default=DEFAULT_REPEATS, type=int,
+                    help="number of timed repetitions of every stage")
+    parser.add_argument("--tolerance", default=DEFAULT_TOLERANCE, type=float,
+                    help="allowed relative slow down against the baseline, e.g. 0.5 = 50 %%")
+    args = parser.parse_args()
+
+    benchmark = run_benchmarks(args.repeats)
+
+    if args.update:
+        save_baseline(benchmark)
+        logging.info(f'Baseline written to {BASELINE_PATH}')
+        return
+
+    regressions = find_regressions(benchmark, load_baseline(), args.tolerance)
+    for regression in regressions:
+        logging.error(f'Regression: {regression}')
+
+    if regressions:
+        exit(1)
+
+    logging.info('No regressions found')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2
+import cv2.aruco as aruco
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.annotation import draw_text
+from common.calibration import (DEFAULT_MARKER_LENGTH, DEFAULT_SQUARE_LENGTH, DEFAULT_SQUARES_X, DEFAULT_SQUARES_Y,
+                                calibrate_charuco, create_charuco_board, detect_charuco_corners, draw_charuco_board,
+                                get_calibration_path)
+from replay.replay import get_image_paths
+
+
+# printed board image size in pixels per square
+BOARD_PIXELS_PER_SQUARE = 200
+
+DEFAULT_NUM_VIEWS = 25
+
+# min. time between two collected camera views, so that the board can be moved to a new pose in between
+DEFAULT_VIEW_INTERVAL_IN_SECONDS = 1.0
+
+
+# set root logger log level
+logging.getLogger().setLevel(logging.INFO)
+
+
+def collect_camera_views(video_capture, board, num_views, interval, headless=False):
+    '''
+    Collects views of the board from the camera, at most one every interval seconds
+
+    Parameters:
+        video_capture (cv2.VideoCapture): opened video capture
+        board (cv2.aruco.CharucoBoard): calibration board
+        num_views (int): number of views to collect
+        interval (float): min. time between two views in seconds
+        headless (bool): do not show the detected corners
+
+    Returns:
+        all_charuco_corners, all_charuco_ids (list): ChArUco corners and IDs of every view
+        width, height (int): frame size in pixels
+    '''
+
+    all_charuco_corners, all_charuco_ids = [], []
+    width = height = None
+    last_view_time = 0.0
+    while len(all_charuco_corners) < num_views:
+        ret, video_frame = video_capture.read()
+        if not ret:
+            logging.error('No video frame received')
+            break
+
+        height, width = video_frame.shape[0:2]
+        charuco_corners, charuco_ids = detect_charuco_corners(video_frame, board)
+        if charuco_corners is not None and time.monotonic() - last_view_time > interval:
+            last_view_time = time.monotonic()
+            all_charuco_corners.append(charuco_corners)
+            all_charuco_ids.append(charuco_ids)
+            logging.info(f'View {len(all_charuco_corners)}/{num_views}: {len(charuco_ids)} corners')
+
+        if headless:
+            continue
+
+        if charuco_corners is not None:
+            aruco.drawDetectedCornersCharuco(video_frame, charuco_corners, charuco_ids)
+        draw_text(video_frame, f'Views: {len(all_charuco_corners)}/{num_views}, move the board, q = stop', line=0)
+        cv2.imshow('Calibration', video_frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    return all_charuco_corners, all_charuco_ids, width, height
+
+
+def collect_image_views(image_paths, board):
+    '''
+    Returns:
+        all_charuco_corners, all_charuco_ids (list): ChArUco corners and IDs of every image showing the board
+        width, height (int): image size in pixels
+    '''
+
+    all_charuco_corners, all_charuco_ids = [], []
+    width = height = None
+    for path in image_paths:
+        image = cv2.imread(path)
+        if image is None:
+            logging.warning(f'{path} could not be read')
+            continue
+
+        height, width = image.shape[0:2]
+        charuco_corners, charuco_ids = detect_charuco_corners(image, board)
+        if charuco_corners is None:
+            logging.info(f'{path}: board not found')
+            continue
+
+        all_charuco_corners.append(charuco_corners)
+        all_charuco_ids.append(charuco_ids)
+
+    return all_charuco_corners, all_charuco_ids, width, height
+
+
+def main():
+
+    logging.info('Camera Calibration')
+
+    # input arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--camera_index", default=None, type=int,
+                    help="camera to calibrate, the calibration is cached for it unless an output is given")
+    parser.add_argument("--images", default=None,
+                    help="directory of board images to calibrate from instead of live camera views")
+    parser.add_argument("--board", default=None,
+                    help="write a printable image of the ChArUco board to this file and exit")
+    parser.add_argument("-o", "--output", default=None,
+                    help="calibration file, default = calibration cache of the camera")
+    parser.add_argument("--views", default=DEFAULT_NUM_VIEWS, type=int,
+                    help="number of camera views to collect")
+    parser.add_argument("--interval", default=DEFAULT_VIEW_INTERVAL_IN_SECONDS, type=float,
+                    help="min. time between two collected camera views in seconds")
+    parser.add_argument("--squares_x", default=DEFAULT_SQUARES_X, type=int,
+                    help="number of board squares in X direction")
+    parser.add_argument("--squares_y", default=DEFAULT_SQUARES_Y, type=int,
+                    help="number of board squares in Y direction")
+    parser.add_argument("--square_length", default=DEFAULT_SQUARE_LENGTH, type=float,
+                    help="side length of the printed squares in meters")
+    parser.add_argument("--marker_length", default=DEFAULT_MARKER_LENGTH, type=float,
+                    help="side length of the printed markers in meters")
+    parser.add_argument("--headless", action="store_true",
+                    help="do not show the camera views")
+    args = parser.parse_args()
+
+    board = create_charuco_board(args.squares_x, args.squares_y, args.square_length, args.marker_length)
+
+    if args.board is not None:
+        cv2.imwrite(args.board, draw_charuco_board(board, args.squares_x * BOARD_PIXELS_PER_SQUARE,
+                                                   args.squares_y * BOARD_PIXELS_PER_SQUARE))
+        logging.info(f'Wrote board image to {args.board}')
+        return
+
+    if args.output is None and args.camera_index is None:
+        logging.error('Either a camera index or an output file is required')
+        return
+
+    if args.images is not None:
+        all_charuco_corners, all_charuco_ids, width, height = collect_image_views(get_image_paths(args.images), board)
+    else:
+        video_capture = cv2.VideoCapture(args.camera_index, cv2.CAP_DSHOW)
+        all_charuco_corners, all_charuco_ids, width, height = collect_camera_views(video_capture, board, args.views,
+            args.interval, args.headless)
+        video_capture.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
+
+    if len(all_charuco_corners) < 3:
+        logging.error(f'Not enough views of the board ({len(all_charuco_corners)}) for calibration')
+        return
+
+    calibration = calibrate_charuco(all_charuco_corners, all_charuco_ids, board, width, height)
+    output = args.output or get_calibration_path(args.camera_index, width, height)
+    calibration.save(output)
+    logging.info(f'Camera matrix:\n{calibration.camera_matrix}')
+    logging.info(f'Distortion coefficients: {calibration.dist_coeffs}')
+    logging.info(f'Wrote calibration to {output}')
+    logging.info('DONE')
+
+
+if __name__ == "__main__":
+    main()
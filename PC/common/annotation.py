@@ -0,0 +1,172 @@
+import time
+
+import cv2
+
+from common.markers import get_marker_center
+from common.overlay import composite_overlay
+
+
+class RenderThrottle:
+    '''
+    Decides which frames are annotated and displayed
+
+    Targeting does not depend on rendering, so frames which are not rendered skip all annotation and GUI work.
+    '''
+
+    def __init__(self, headless=False, render_every=1, render_fps=0):
+        '''
+        Parameters:
+            headless (bool): never render
+            render_every (int): render every N-th frame
+            render_fps (float): max. number of rendered frames per second, 0 = unlimited
+        '''
+
+        assert render_every >= 1, 'Render every N frames has to be at least 1'
+
+        self.headless = headless
+        self.render_every = render_every
+        self.render_period = 1 / render_fps if render_fps > 0 else 0
+        # additional skip factor set at runtime (e.g. by FrameGovernor)
+        self.render_skip = 1
+        self.frame_idx = -1
+        self.last_render_time = None
+        self.frames_rendered = 0
+
+    def should_render(self):
+        '''
+        Has to be called once per processed frame
+
+        Returns:
+            render (bool): True if the current frame is to be annotated and displayed
+        '''
+
+        self.frame_idx += 1
+
+        if self.headless or self.frame_idx % (self.render_every * self.render_skip) != 0:
+            return False
+
+        current_time = time.monotonic()
+        if self.last_render_time is not None and current_time - self.last_render_time < self.render_period:
+            return False
+
+        self.last_render_time = current_time
+        self.frames_rendered += 1
+        return True
+
+
+def draw_text(display_frame, text, line, color=(0, 255, 0)):
+    '''
+    Draws a line of status text in the top-left corner of the frame
+
+    Parameters:
+        display_frame (numpy.ndarray): frame to draw on
+        text (str): text to draw
+        line (int): line number, starting from 0
+        color (tuple): BGR color
+
+    Returns:
+        display_frame (numpy.ndarray)
+    '''
+
+    return cv2.putText(display_frame,
+        text,
+        org=(10, 20 + 20 * line),
+        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+        fontScale=0.5,
+        color=color)
+
+
+def draw_markers(display_frame, marker_corners, marker_ids, ar_images, overlay_buffers=None, max_overlays=None):
+    '''
+    Draws detected ArUco markers: AR image warped onto the marker, marker ID, marker center and marker corners
+
+    Parameters:
+        display_frame (numpy.ndarray): frame to draw on
+        marker_corners (list): marker corners as returned by detectMarkers()
+        marker_ids (numpy.ndarray): marker IDs as returned by detectMarkers()
+        ar_images (dict): key = marker ID, value = AR image (OverlayAsset)
+        overlay_buffers (OverlayBuffers): scratch buffers for warping the AR images, None = allocate them
+        max_overlays (int): max. number of AR images composited, the other markers are only outlined, None = all
+
+    Returns:
+        display_frame (numpy.ndarray)
+    '''
+
+    if marker_ids is None:
+        return draw_text(display_frame, 'No ArUco markers found', line=1)
+
+    display_frame = draw_text(display_frame, f'Found {len(marker_ids)} ArUco markers', line=1)
+
+    overlays = 0
+    for i, marker_id in enumerate(marker_ids):
+        # reshape the corners array to fit findHomography()
+        marker_corners_for_current_id = marker_corners[i].reshape(-1, 2)
+
+        if marker_id[0] in ar_images and (max_overlays is None or overlays < max_overlays):
+            overlays += 1
+            # transform the friendly/foe image to fit the ArUco marker
+            display_frame = composite_overlay(display_frame, ar_images[marker_id[0]], marker_corners_for_current_id,
+                overlay_buffers)
+
+        # display ArUco marker ID in the top-left corner of the marker
+        display_frame = cv2.putText(display_frame,
+            f'ID: {marker_id[0]}',
+            org=(int(marker_corners[i][0, 0, 0] + 10), int(marker_corners[i][0, 0, 1] + 10)),
+            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale=0.5,
+            color=(0, 0, 255))
+
+        # draw center of ArUco marker as cross
+        display_frame = cv2.drawMarker(display_frame,
+            position=get_marker_center(marker_corners_for_current_id),
+            color=(0, 0, 255),
+            markerSize=50)
+
+        # draw all 4 corners of the ArUco marker
+        for j, marker_corner in enumerate(marker_corners_for_current_id):
+            display_frame = cv2.drawMarker(display_frame,
+                position=(int(marker_corner[0]),
+                int(marker_corner[1])),
+                color=(0, 0, 255),
+                markerSize=10,
+                markerType=int(j % 4))
+
+    return display_frame
+
+
+def draw_targeting(display_frame, frame_center, deadzone_radius, control):
+    '''
+    Draws deadzone radius and, if a target is being tracked, error vector with X & Y error and motor speed
+
+    Parameters:
+        display_frame (numpy.ndarray): frame to draw on
+        frame_center (tuple): x, y position of the camera's image frame center in pixels
+        deadzone_radius (int): deadzone radius in pixels
+        control (dict): control output as returned by calculate_control() or None, target in frame pixels
+
+    Returns:
+        display_frame (numpy.ndarray)
+    '''
+
+    # draw deadzone radius
+    display_frame = cv2.circle(display_frame,
+        center=frame_center,
+        radius=deadzone_radius,
+        color=(0, 255, 0),
+        thickness=2)
+
+    if control is None:
+        return display_frame
+
+    # draw error vector
+    display_frame = cv2.line(display_frame, pt1=control['target'], pt2=frame_center, color=(0, 255, 0))
+
+    # display error (in pixels or, with a camera calibration, in degrees) and motor speed
+    if control.get('error_unit') == 'deg':
+        error_x, error_y = f'{control["error_x"]:.1f} deg', f'{control["error_y"]:.1f} deg'
+    else:
+        error_x, error_y = control['error_x'], control['error_y']
+    display_frame = draw_text(display_frame, f'Error X: {error_x}, Speed X: {control["motor_speed_x"]}', line=2)
+    display_frame = draw_text(display_frame, f'Error Y: {error_y}, Speed Y: {control["motor_speed_y"]}', line=3)
+
+    return display_frame
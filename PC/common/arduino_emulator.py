@@ -0,0 +1,156 @@
+import os
+import select
+import struct
+import threading
+import time
+import tty
+
+from common.binary_protocol import (DEFAULT_BAUD_RATE, OPCODE_ACK, OPCODE_GUN_OFF, OPCODE_GUN_ON, OPCODE_MOTOR,
+    OPCODE_SET_BAUD, OPCODE_TRIGGER, SUPPORTED_BAUD_RATES, SYNC, FrameDecoder, decode_motor_x_y_speed, encode_frame)
+
+
+class ArduinoEmulator:
+    '''
+    Emulates arduino_control.ino behind a pseudo-terminal (Linux and macOS only)
+
+    The PC side opens the emulator with serial.Serial(emulator.port) like a real Arduino. ASCII commands are echoed
+    and answered the same way as by the sketch, binary frames are executed silently except for the baud rate change
+    which is acknowledged. Executed commands are recorded in the ASCII form, e.g. 'DC 120 -255'.
+
+    Commands are processed one after another, each one takes processing_delay seconds before it is answered and
+    executed, so a backlog builds up if commands arrive faster.
+    '''
+
+    def __init__(self, processing_delay=0.0):
+        '''
+        Parameters:
+            processing_delay (float): time in seconds the emulated Arduino spends on each command
+        '''
+
+        self.processing_delay = processing_delay
+        self.master_fd, self.slave_fd = os.openpty()
+        # no echo and no line editing until the serial port is configured by the PC side
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.decoder = FrameDecoder()
+        self.command = bytearray()
+
+        self.baud_rate = DEFAULT_BAUD_RATE
+        self.motor_speed_x = 0
+        self.motor_speed_y = 0
+        self.gun_on = False
+        self.commands = []
+        self.bytes_received = 0
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def frames_rejected(self):
+        return self.decoder.frames_rejected
+
+    def run(self):
+        while self.running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.01)
+            if not readable:
+                continue
+
+            data = os.read(self.master_fd, 1024)
+            self.bytes_received += len(data)
+            for byte in data:
+                self.receive(byte)
+
+    def receive(self, byte):
+        '''
+        Same dispatch as loop() in the sketch: bytes belonging to a binary frame go to the frame decoder, everything
+        else is collected into an ASCII command
+        '''
+
+        if self.decoder.in_frame or (byte == SYNC and not self.command):
+            frame = self.decoder.push(byte)
+            if frame is not None:
+                self.execute_frame(*frame)
+            return
+
+        if byte == ord('\n'):
+            self.execute_command(self.command.decode(errors='replace').strip())
+            self.command.clear()
+        else:
+            self.command.append(byte)
+
+    def reply(self, line):
+        os.write(self.master_fd, f'{line}\r\n'.encode())
+
+    def execute_command(self, command):
+        if self.processing_delay > 0:
+            time.sleep(self.processing_delay)
+
+        self.reply('CMD received')
+        self.reply(command)
+
+        if command == 'TRG':
+            self.reply('FIRE!!!')
+            self.commands.append(command)
+        elif command == 'GUN_ON':
+            self.reply('Turn on gun motor')
+            self.gun_on = True
+            self.commands.append(command)
+        elif command == 'GUN_OFF':
+            self.reply('Turn off gun motor')
+            self.gun_on = False
+            self.commands.append(command)
+        elif command.startswith('DC ') and len(command.split()) == 3:
+            self.reply('Motor control')
+            motor_speed_x, motor_speed_y = (int(float(speed)) for speed in command.split()[1:])
+            self.reply(motor_speed_x)
+            self.reply(motor_speed_y)
+            self.set_motor_x_y_speed(motor_speed_x, motor_speed_y)
+        else:
+            self.reply('CMD unknown')
+
+    def execute_frame(self, opcode, payload):
+        if self.processing_delay > 0:
+            time.sleep(self.processing_delay)
+
+        if opcode == OPCODE_MOTOR:
+            self.set_motor_x_y_speed(*decode_motor_x_y_speed(payload))
+        elif opcode == OPCODE_GUN_ON:
+            self.gun_on = True
+            self.commands.append('GUN_ON')
+        elif opcode == OPCODE_GUN_OFF:
+            self.gun_on = False
+            self.commands.append('GUN_OFF')
+        elif opcode == OPCODE_TRIGGER:
+            self.commands.append('TRG')
+        elif opcode == OPCODE_SET_BAUD:
+            baud_rate = struct.unpack('<I', payload)[0]
+            if baud_rate in SUPPORTED_BAUD_RATES:
+                os.write(self.master_fd, encode_frame(OPCODE_ACK, bytes([OPCODE_SET_BAUD])))
+                self.baud_rate = baud_rate
+                self.commands.append(f'BAUD {baud_rate}')
+
+    def set_motor_x_y_speed(self, motor_speed_x, motor_speed_y):
+        self.motor_speed_x = max(-255, min(255, motor_speed_x))
+        self.motor_speed_y = max(-255, min(255, motor_speed_y))
+        self.commands.append(f'DC {motor_speed_x} {motor_speed_y}')
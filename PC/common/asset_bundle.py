@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+from common.overlay import OverlayAsset
+
+
+DEFAULT_BUNDLE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'dronekiller', 'overlay_assets.bundle')
+
+BUNDLE_MAGIC = b'DKAB'
+BUNDLE_VERSION = 1
+
+# arrays are aligned so that the memory-mapped views can be used without copying
+ARRAY_ALIGNMENT = 64
+
+
+def get_source_stamps(source_paths):
+    '''
+    Returns:
+        stamps (dict): key = absolute source path, value = [modification time in ns, size in bytes]
+    '''
+
+    stamps = {}
+    for path in source_paths:
+        stat = os.stat(path)
+        stamps[os.path.abspath(path)] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def align(offset):
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+
+def build_asset_bundle(ar_images, source_paths, bundle_path=DEFAULT_BUNDLE_PATH):
+    '''
+    Writes the AR images together with their masks and corners into a single memory-mappable file
+
+    Layout: magic, little-endian uint32 header length, JSON header, arrays at aligned offsets relative to the end of
+    the header.
+
+    Parameters:
+        ar_images (dict): key = marker ID, value = OverlayAsset
+        source_paths (list): image files the assets were loaded from, the bundle is rebuilt if any of them changes
+        bundle_path (str): path of the bundle file
+    '''
+
+    offset = 0
+    arrays = []
+    assets = {}
+    for marker_id, asset in ar_images.items():
+        assets[str(marker_id)] = {}
+        for name in ('img', 'mask', 'corners'):
+            array = np.ascontiguousarray(getattr(asset, name))
+            offset = align(offset)
+            assets[str(marker_id)][name] = {'offset': offset, 'shape': array.shape, 'dtype': array.dtype.str}
+            arrays.append((offset, array))
+            offset += array.nbytes
+
+    header = json.dumps({
+        'version': BUNDLE_VERSION,
+        'sources': get_source_stamps(source_paths),
+        'assets': assets,
+    }).encode()
+    # data starts aligned after the header
+    header += b' ' * (align(len(BUNDLE_MAGIC) + 4 + len(header)) - len(BUNDLE_MAGIC) - 4 - len(header))
+
+    os.makedirs(os.path.dirname(os.path.abspath(bundle_path)), exist_ok=True)
+    temp_path = bundle_path + '.tmp'
+    with open(temp_path, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_MAGIC + struct.pack('<I', len(header)) + header)
+        data_start = bundle_file.tell()
+        for array_offset, array in arrays:
+            bundle_file.seek(data_start + array_offset)
+            bundle_file.write(array.tobytes())
+    # readers never see a partially written bundle
+    os.replace(temp_path, bundle_path)
+
+
+def load_asset_bundle(bundle_path=DEFAULT_BUNDLE_PATH, source_paths=None):
+    '''
+    Memory-maps the asset bundle, the arrays are read-only views of the file
+
+    Parameters:
+        bundle_path (str): path of the bundle file
+        source_paths (list): image files the bundle must have been built from, None = no check
+
+    Returns:
+        ar_images (dict): key = marker ID, value = OverlayAsset or None if the bundle is missing, invalid or stale
+    '''
+
+    if not os.path.isfile(bundle_path):
+        return None
+
+    data = np.memmap(bundle_path, dtype=np.uint8, mode='r')
+    if bytes(data[:len(BUNDLE_MAGIC)]) != BUNDLE_MAGIC:
+        logging.warning(f'Invalid asset bundle {bundle_path}')
+        return None
+
+    header_length, = struct.unpack('<I', bytes(data[len(BUNDLE_MAGIC):len(BUNDLE_MAGIC) + 4]))
+    data_start = len(BUNDLE_MAGIC) + 4 + header_length
+    header = json.loads(bytes(data[len(BUNDLE_MAGIC) + 4:data_start]))
+
+    if header['version'] != BUNDLE_VERSION:
+        return None
+    if source_paths is not None:
+        try:
+            if header['sources'] != get_source_stamps(source_paths):
+                return None
+        except OSError:
+            return None
+
+    ar_images = {}
+    for marker_id, arrays in header['assets'].items():
+        views = {}
+        for name, layout in arrays.items():
+            dtype = np.dtype(layout['dtype'])
+            start = data_start + layout['offset']
+            stop = start + int(np.prod(layout['shape'])) * dtype.itemsize
+            views[name] = data[start:stop].view(dtype).reshape(layout['shape'])
+        ar_images[int(marker_id)] = OverlayAsset(views['img'], views['corners'], mask=views['mask'])
+
+    return ar_images
+
+
+def load_or_build_asset_bundle(load_ar_images, source_paths, bundle_path=DEFAULT_BUNDLE_PATH):
+    '''
+    Loads the AR images from the bundle, (re)building it first if it is missing or stale
+
+    Parameters:
+        load_ar_images (function): loads the AR images from the source files, returns dict as load_asset_bundle()
+        source_paths (list): image files loaded by load_ar_images
+        bundle_path (str): path of the bundle file
+
+    Returns:
+        ar_images (dict): key = marker ID, value = OverlayAsset
+    '''
+
+    ar_images = load_asset_bundle(bundle_path, source_paths)
+    if ar_images is not None:
+        return ar_images
+
+    logging.info(f'Building asset bundle {bundle_path}...')
+    ar_images = load_ar_images()
+    try:
+        build_asset_bundle(ar_images, source_paths, bundle_path)
+    except OSError:
+        logging.warning(f'Asset bundle {bundle_path} could not be written')
+
+    return ar_images
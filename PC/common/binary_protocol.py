@@ -0,0 +1,269 @@
+import logging
+import struct
+import time
+
+
+# Binary frame format (version 1):
+#
+#   SYNC | VERSION << 4 | OPCODE | PAYLOAD | CRC8
+#
+# SYNC is never a printable character, so binary frames and ASCII commands can be told apart by the first byte.
+# Payload length is given by the opcode, CRC8 (polynomial 0x07) covers the version/opcode byte and the payload.
+# All multi-byte values are little-endian.
+
+SYNC = 0xA5
+PROTOCOL_VERSION = 1
+
+OPCODE_MOTOR = 0x1      # payload: int16 X motor speed, int16 Y motor speed
+OPCODE_GUN_ON = 0x2
+OPCODE_GUN_OFF = 0x3
+OPCODE_TRIGGER = 0x4
+OPCODE_SET_BAUD = 0x5   # payload: uint32 baud rate, acknowledged before switching
+OPCODE_ACK = 0xF        # payload: uint8 acknowledged opcode (sent by the Arduino)
+
+PAYLOAD_LENGTHS = {
+    OPCODE_MOTOR: 4,
+    OPCODE_GUN_ON: 0,
+    OPCODE_GUN_OFF: 0,
+    OPCODE_TRIGGER: 0,
+    OPCODE_SET_BAUD: 4,
+    OPCODE_ACK: 1,
+}
+
+# baud rates supported by the Arduino Uno (16 MHz) with low error
+SUPPORTED_BAUD_RATES = (9600, 19200, 38400, 57600, 115200, 250000, 500000, 1000000)
+
+DEFAULT_BAUD_RATE = 9600
+
+
+def make_crc8_table(polynomial=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = make_crc8_table()
+
+
+def crc8(data):
+    '''
+    Calculates CRC-8 (polynomial 0x07, initial value 0)
+    '''
+
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(opcode, payload=b''):
+    '''
+    Parameters:
+        opcode (int): one of the OPCODE_* constants
+        payload (bytes): payload of the length required by the opcode
+
+    Returns:
+        frame (bytes)
+    '''
+
+    assert len(payload) == PAYLOAD_LENGTHS[opcode], f'Invalid payload length for opcode {opcode}'
+
+    body = bytes([(PROTOCOL_VERSION << 4) | opcode]) + payload
+    return bytes([SYNC]) + body + bytes([crc8(body)])
+
+
+def encode_motor_x_y_speed(motor_speed_x, motor_speed_y):
+    '''
+    Returns:
+        frame (bytes): 7 byte motor command frame, speeds are saturated to the PWM range [-255, 255]
+    '''
+
+    motor_speed_x = max(-255, min(255, int(motor_speed_x)))
+    motor_speed_y = max(-255, min(255, int(motor_speed_y)))
+    return encode_frame(OPCODE_MOTOR, struct.pack('<hh', motor_speed_x, motor_speed_y))
+
+
+def decode_motor_x_y_speed(payload):
+    '''
+    Returns:
+        motor_speed_x, motor_speed_y (int)
+    '''
+
+    return struct.unpack('<hh', payload)
+
+
+class FrameDecoder:
+    '''
+    Byte by byte decoder of binary frames, same state machine as in arduino_control.ino
+
+    Frames with unknown version or opcode or with invalid CRC are rejected and the decoder waits for the next SYNC.
+    '''
+
+    def __init__(self):
+        self.frame = bytearray()
+        self.payload_length = 0
+        self.frames_decoded = 0
+        self.frames_rejected = 0
+
+    @property
+    def in_frame(self):
+        return len(self.frame) > 0
+
+    def push(self, byte):
+        '''
+        Parameters:
+            byte (int): received byte
+
+        Returns:
+            opcode, payload (tuple) if the byte completed a valid frame, otherwise None
+        '''
+
+        if not self.frame:
+            if byte == SYNC:
+                self.frame.append(byte)
+            return None
+
+        self.frame.append(byte)
+
+        if len(self.frame) == 2:
+            version, opcode = byte >> 4, byte & 0x0F
+            if version != PROTOCOL_VERSION or opcode not in PAYLOAD_LENGTHS:
+                self.reject()
+                return None
+            self.payload_length = PAYLOAD_LENGTHS[opcode]
+            return None
+
+        if len(self.frame) < 3 + self.payload_length:
+            return None
+
+        body = bytes(self.frame[1:-1])
+        if crc8(body) != self.frame[-1]:
+            self.reject()
+            return None
+
+        self.frame.clear()
+        self.frames_decoded += 1
+        return body[0] & 0x0F, body[1:]
+
+    def feed(self, data):
+        '''
+        Returns:
+            frames (list): opcode, payload tuples of all valid frames completed by the data
+        '''
+
+        frames = []
+        for byte in data:
+            frame = self.push(byte)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+    def reject(self):
+        self.frame.clear()
+        self.frames_rejected += 1
+
+
+def encode_text_command(command):
+    '''
+    Translates ASCII command (without new line) to binary frame
+
+    Returns:
+        frame (bytes) or None if the command is not known
+    '''
+
+    if command == 'GUN_ON':
+        return encode_frame(OPCODE_GUN_ON)
+    if command == 'GUN_OFF':
+        return encode_frame(OPCODE_GUN_OFF)
+    if command == 'TRG':
+        return encode_frame(OPCODE_TRIGGER)
+
+    fields = command.split()
+    if len(fields) == 3 and fields[0] == 'DC':
+        return encode_motor_x_y_speed(float(fields[1]), float(fields[2]))
+
+    return None
+
+
+class BinaryProtocolPort:
+    '''
+    Serial port wrapper which sends the ASCII commands written to it as binary frames
+
+    Can be used wherever the serial port is used (send_motor_x_y_speed() etc.), everything else is passed through to
+    the wrapped serial port.
+    '''
+
+    def __init__(self, serial_port):
+        self.serial_port = serial_port
+        self.buffer = b''
+
+    def write(self, data):
+        '''
+        Returns:
+            num_bytes (int): number of bytes written to the serial port
+        '''
+
+        self.buffer += bytes(data)
+
+        frames = b''
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            frame = encode_text_command(line.decode().strip())
+            if frame is None:
+                logging.warning(f'Command {line} not supported by binary protocol. Dropped.')
+                continue
+            frames += frame
+
+        if frames:
+            self.serial_port.write(frames)
+        return len(frames)
+
+    def __getattr__(self, name):
+        return getattr(self.serial_port, name)
+
+
+def negotiate_baud_rate(serial_port, baud_rate, timeout=1.0):
+    '''
+    Asks the Arduino to switch to a higher baud rate and switches the serial port after it is acknowledged
+
+    Parameters:
+        serial_port (serial.Serial): open serial port
+        baud_rate (int): one of SUPPORTED_BAUD_RATES
+        timeout (float): max. time in seconds to wait for the acknowledgement
+
+    Returns:
+        success (bool): True if the Arduino acknowledged and the port was switched
+    '''
+
+    assert baud_rate in SUPPORTED_BAUD_RATES, f'Baud rate {baud_rate} not supported'
+
+    serial_port.reset_input_buffer()
+    serial_port.write(encode_frame(OPCODE_SET_BAUD, struct.pack('<I', baud_rate)))
+    serial_port.flush()
+
+    # poll for the acknowledgement without blocking past the timeout
+    read_timeout = serial_port.timeout
+    serial_port.timeout = 0.01
+
+    decoder = FrameDecoder()
+    acknowledged = False
+    end_time = time.monotonic() + timeout
+    while not acknowledged and time.monotonic() < end_time:
+        data = serial_port.read(max(1, serial_port.in_waiting))
+        for opcode, payload in decoder.feed(data):
+            if opcode == OPCODE_ACK and payload[0] == OPCODE_SET_BAUD:
+                acknowledged = True
+
+    serial_port.timeout = read_timeout
+
+    if not acknowledged:
+        logging.warning(f'Baud rate {baud_rate} not acknowledged. Staying at {serial_port.baudrate} bps.')
+        return False
+
+    serial_port.baudrate = baud_rate
+    logging.info(f'Serial port switched to {baud_rate} bps')
+    return True
@@ -0,0 +1,317 @@
+import json
+import logging
+import math
+import os
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+
+DEFAULT_CALIBRATION_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dronekiller', 'calibration')
+
+# board markers come from a different dictionary than the DICT_4X4_250 foe and friendly markers, so that they are
+# never mistaken for targets
+CHARUCO_DICTIONARY = aruco.DICT_5X5_250
+
+# default ChArUco board: 7 x 5 squares of 40 mm with 30 mm markers (fits on an A4 sheet)
+DEFAULT_SQUARES_X = 7
+DEFAULT_SQUARES_Y = 5
+DEFAULT_SQUARE_LENGTH = 0.04
+DEFAULT_MARKER_LENGTH = 0.03
+
+# min. number of ChArUco corners of a view used for calibration
+MIN_CHARUCO_CORNERS = 6
+
+# iterations of the corner undistortion, the default of cv2.undistortPoints() is not accurate near the edges of
+# strongly distorted frames
+UNDISTORT_CRITERIA = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 20, 1e-6)
+
+CALIBRATION_VERSION = 1
+
+
+def create_charuco_board(squares_x=DEFAULT_SQUARES_X, squares_y=DEFAULT_SQUARES_Y,
+                         square_length=DEFAULT_SQUARE_LENGTH, marker_length=DEFAULT_MARKER_LENGTH):
+    '''
+    Parameters:
+        squares_x, squares_y (int): number of chessboard squares in X and Y direction
+        square_length, marker_length (float): side length of the squares and of the markers in meters
+
+    Returns:
+        board (cv2.aruco.CharucoBoard)
+    '''
+
+    dictionary = aruco.Dictionary_get(CHARUCO_DICTIONARY)
+    return aruco.CharucoBoard_create(squares_x, squares_y, square_length, marker_length, dictionary)
+
+
+def draw_charuco_board(board, width, height, margin=0):
+    '''
+    Returns:
+        board_image (numpy.ndarray): grayscale image of the board for printing
+    '''
+
+    return board.draw((width, height), marginSize=margin)
+
+
+def detect_charuco_corners(video_frame, board):
+    '''
+    Detects the board markers and interpolates the chessboard corners between them
+
+    Returns:
+        charuco_corners (numpy.ndarray), charuco_ids (numpy.ndarray): corners and their IDs or None, None if less
+            than MIN_CHARUCO_CORNERS corners were found
+    '''
+
+    if video_frame.ndim == 3:
+        video_frame = cv2.cvtColor(video_frame, cv2.COLOR_BGR2GRAY)
+
+    marker_corners, marker_ids, rejected_candidates = aruco.detectMarkers(video_frame, board.dictionary)
+    if marker_ids is None:
+        return None, None
+
+    num_corners, charuco_corners, charuco_ids = aruco.interpolateCornersCharuco(marker_corners, marker_ids,
+                                                                                 video_frame, board)
+    if num_corners < MIN_CHARUCO_CORNERS:
+        return None, None
+
+    return charuco_corners, charuco_ids
+
+
+def calibrate_charuco(all_charuco_corners, all_charuco_ids, board, width, height):
+    '''
+    Calibrates the camera from views of a ChArUco board
+
+    Parameters:
+        all_charuco_corners (list): ChArUco corners of every view as returned by detect_charuco_corners()
+        all_charuco_ids (list): ChArUco IDs of every view as returned by detect_charuco_corners()
+        board (cv2.aruco.CharucoBoard): calibration board
+        width, height (int): frame size in pixels
+
+    Returns:
+        calibration (CameraCalibration)
+    '''
+
+    rms, camera_matrix, dist_coeffs, rvecs, tvecs = aruco.calibrateCameraCharuco(all_charuco_corners, all_charuco_ids,
+                                                                                  board, (width, height), None, None)
+    logging.info(f'Calibrated from {len(all_charuco_corners)} views, RMS reprojection error: {rms:.3f} px')
+    return CameraCalibration(camera_matrix, dist_coeffs, width, height, rms)
+
+
+class CameraCalibration:
+    '''
+    Camera intrinsics and lens distortion coefficients
+
+    Marker corners are undistorted into the pixel coordinates of an ideal pinhole camera with the same camera matrix,
+    in which the angle of a point to the optical axis follows directly from the focal length. Undistorting whole
+    frames is only needed for the preview, its remap tables are computed once.
+    '''
+
+    def __init__(self, camera_matrix, dist_coeffs, width, height, rms=None):
+        '''
+        Parameters:
+            camera_matrix (numpy.ndarray): 3x3 camera matrix
+            dist_coeffs (numpy.ndarray): distortion coefficients (k1, k2, p1, p2[, k3...])
+            width, height (int): frame size in pixels the calibration is valid for
+            rms (float): RMS reprojection error of the calibration in pixels
+        '''
+
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64).reshape(3, 3)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.width = int(width)
+        self.height = int(height)
+        self.rms = rms
+        self.preview_maps = None
+
+    @property
+    def focal_length(self):
+        return self.camera_matrix[0, 0], self.camera_matrix[1, 1]
+
+    @property
+    def principal_point(self):
+        return self.camera_matrix[0, 2], self.camera_matrix[1, 2]
+
+    def scaled(self, width, height):
+        '''
+        Returns:
+            calibration (CameraCalibration): calibration for frames of another resolution of the same sensor area
+        '''
+
+        if (width, height) == (self.width, self.height):
+            return self
+
+        if abs(width / height - self.width / self.height) > 0.01:
+            logging.warning(f'Calibration for {self.width} x {self.height} used for {width} x {height} frames with '
+                            f'a different aspect ratio')
+
+        scale = np.diag([width / self.width, height / self.height, 1.0])
+        return CameraCalibration(scale @ self.camera_matrix, self.dist_coeffs, width, height, self.rms)
+
+    def undistort_points(self, points):
+        '''
+        Parameters:
+            points (numpy.ndarray): pixel coordinates in the distorted frame, shape (N, 2)
+
+        Returns:
+            undistorted_points (numpy.ndarray): pixel coordinates of an ideal pinhole camera, shape (N, 2)
+        '''
+
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.undistortPointsIter(points, self.camera_matrix, self.dist_coeffs, None, self.camera_matrix,
+                                       UNDISTORT_CRITERIA).reshape(-1, 2)
+
+    def distort_points(self, points):
+        '''
+        Inverse of undistort_points()
+
+        Returns:
+            distorted_points (numpy.ndarray): pixel coordinates in the distorted frame, shape (N, 2)
+        '''
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        normalized = (points - self.principal_point) / self.focal_length
+        rays = np.hstack([normalized, np.ones((len(normalized), 1))])
+        distorted_points, jacobian = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), self.camera_matrix,
+                                                       self.dist_coeffs)
+        return distorted_points.reshape(-1, 2)
+
+    def undistort_corners(self, marker_corners):
+        '''
+        Undistorts all marker corners of a frame at once
+
+        Parameters:
+            marker_corners (list): marker corners as returned by detectMarkers()
+
+        Returns:
+            marker_corners (tuple): undistorted marker corners in the same format
+        '''
+
+        if len(marker_corners) == 0:
+            return marker_corners
+
+        corners = self.undistort_points(np.concatenate(marker_corners))
+        return tuple(corners.reshape(-1, 1, 4, 2))
+
+    def get_angles(self, points):
+        '''
+        Parameters:
+            points (numpy.ndarray): undistorted pixel coordinates, shape (N, 2)
+
+        Returns:
+            angles (numpy.ndarray): horizontal and vertical angles to the optical axis in degrees, shape (N, 2)
+        '''
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return np.degrees(np.arctan((points - self.principal_point) / self.focal_length))
+
+    def get_angular_error(self, target, aim_point):
+        '''
+        Parameters:
+            target (tuple): undistorted pixel position of the target
+            aim_point (tuple): undistorted pixel position the turret aims at
+
+        Returns:
+            error_x, error_y (float): horizontal and vertical angle from the aim point to the target in degrees
+        '''
+
+        target_angles, aim_angles = self.get_angles([target, aim_point])
+        error_x, error_y = target_angles - aim_angles
+        return float(error_x), float(error_y)
+
+    def angle_to_pixels(self, angle):
+        '''
+        Returns:
+            pixels (int): horizontal distance from the principal point of a point at the angle in degrees
+        '''
+
+        return int(round(self.focal_length[0] * math.tan(math.radians(angle))))
+
+    def get_preview_maps(self):
+        '''
+        Returns:
+            map1, map2 (numpy.ndarray): remap tables undistorting a frame, computed on the first call
+        '''
+
+        if self.preview_maps is None:
+            self.preview_maps = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None,
+                self.camera_matrix, (self.width, self.height), cv2.CV_16SC2)
+        return self.preview_maps
+
+    def undistort_preview(self, video_frame, dst=None):
+        '''
+        Parameters:
+            video_frame (numpy.ndarray): distorted frame
+            dst (numpy.ndarray): buffer of the frame's shape and dtype the undistorted frame is written to, None =
+                allocate it
+
+        Returns:
+            undistorted_frame (numpy.ndarray)
+        '''
+
+        map1, map2 = self.get_preview_maps()
+        return cv2.remap(video_frame, map1, map2, cv2.INTER_LINEAR, dst=dst)
+
+    def to_dict(self):
+        return {
+            'version': CALIBRATION_VERSION,
+            'width': self.width,
+            'height': self.height,
+            'camera_matrix': self.camera_matrix.tolist(),
+            'dist_coeffs': self.dist_coeffs.tolist(),
+            'rms': self.rms,
+        }
+
+    def save(self, path):
+        '''
+        Writes the calibration as JSON (replaced atomically)
+        '''
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as calibration_file:
+            json.dump(self.to_dict(), calibration_file, indent=4)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path):
+        with open(path) as calibration_file:
+            data = json.load(calibration_file)
+
+        return CameraCalibration(data['camera_matrix'], data['dist_coeffs'], data['width'], data['height'],
+                                 data.get('rms'))
+
+
+def get_calibration_path(camera_idx, width, height, calibration_dir=DEFAULT_CALIBRATION_DIR):
+    '''
+    Returns:
+        path (str): path of the cached calibration of the camera at the resolution
+    '''
+
+    return os.path.join(calibration_dir, f'camera{camera_idx}_{int(width)}x{int(height)}.json')
+
+
+def load_camera_calibration(path=None, camera_idx=None, width=None, height=None,
+                            calibration_dir=DEFAULT_CALIBRATION_DIR):
+    '''
+    Loads the calibration file or, if none is given, the cached calibration of the camera
+
+    Parameters:
+        path (str): calibration file, None = cached calibration of the camera
+        camera_idx (int): camera index, None = no cached calibration (e.g. synthetic scene)
+        width, height (int): frame size in pixels
+        calibration_dir (str): directory of the cached calibrations
+
+    Returns:
+        calibration (CameraCalibration): calibration for the frame size or None if there is none
+    '''
+
+    if path is None:
+        if camera_idx is None:
+            return None
+        path = get_calibration_path(camera_idx, width, height, calibration_dir)
+        if not os.path.isfile(path):
+            return None
+
+    calibration = CameraCalibration.load(path)
+    logging.info(f'Loaded camera calibration {path}, focal length: {calibration.focal_length[0]:.1f} px')
+    return calibration.scaled(int(width), int(height))
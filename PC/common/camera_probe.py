@@ -0,0 +1,253 @@
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import cv2
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'dronekiller', 'cameras.json')
+
+# max. time in seconds to open a camera and read its first frame
+DEFAULT_PROBE_TIMEOUT_IN_SECONDS = 3.0
+
+
+def get_device_list():
+    '''
+    Lists video devices of the system, used to check whether the cached probing results are still valid
+
+    Returns:
+        devices (list): device names or None if the devices cannot be listed on this platform
+    '''
+
+    if sys.platform.startswith('linux'):
+        devices = []
+        for device in sorted(glob.glob('/dev/video*')):
+            name_path = os.path.join('/sys/class/video4linux', os.path.basename(device), 'name')
+            try:
+                with open(name_path) as name_file:
+                    devices.append(f'{device}: {name_file.read().strip()}')
+            except OSError:
+                devices.append(device)
+        return devices
+
+    if sys.platform == 'win32':
+        try:
+            from pygrabber.dshow_graph import FilterGraph
+        except ImportError:
+            return None
+        return FilterGraph().get_input_devices()
+
+    return None
+
+
+def probe_camera(open_capture, camera_idx):
+    '''
+    Opens camera and reads a single frame
+
+    Returns:
+        video_capture (cv2.VideoCapture): opened video capture or None if the camera is not available
+        width, height (int): camera's image frame width and height
+    '''
+
+    video_capture = open_capture(camera_idx)
+    if not video_capture.read()[0]:
+        video_capture.release()
+        return None, 0, 0
+
+    width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    return video_capture, width, height
+
+
+def release_late_capture(future):
+    '''
+    Releases the video capture of a probe which finished after its timeout
+    '''
+
+    if future.exception() is None and future.result()[0] is not None:
+        future.result()[0].release()
+
+
+class CameraManager:
+    '''
+    Enumerates cameras quickly and hands out the capture handles opened during probing
+
+    All camera indices are probed in parallel, each with a timeout, so that a missing or hanging camera does not
+    delay the startup. Results are cached on disk together with the list of video devices of the system and reused
+    while the device list does not change. The handles opened by probing are kept open and handed out by open(), so
+    the selected camera is not closed and reopened.
+    '''
+
+    def __init__(self, open_capture, cache_path=DEFAULT_CACHE_PATH, list_devices=get_device_list,
+                 timeout=DEFAULT_PROBE_TIMEOUT_IN_SECONDS):
+        '''
+        Parameters:
+            open_capture (function): takes camera index and returns video capture
+            cache_path (str): path of the cache file, None = no caching
+            list_devices (function): returns list of video devices or None if they cannot be listed
+            timeout (float): max. time in seconds to probe a camera
+        '''
+
+        self.open_capture = open_capture
+        self.cache_path = cache_path
+        self.list_devices = list_devices
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.captures = {}
+        self.probe_time = 0.0
+        self.from_cache = False
+
+    def _load_cache(self, devices, max_idx):
+        if self.cache_path is None or devices is None or not os.path.isfile(self.cache_path):
+            return None
+
+        try:
+            with open(self.cache_path) as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            logging.warning(f'Camera cache {self.cache_path} could not be read')
+            return None
+
+        if cache.get('devices') != devices or cache.get('max_idx', -1) < max_idx:
+            return None
+
+        return {int(idx): tuple(size) for idx, size in cache['cameras'].items() if int(idx) <= max_idx}
+
+    def _save_cache(self, devices, max_idx, cameras):
+        if self.cache_path is None or devices is None:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w') as cache_file:
+                json.dump({'devices': devices, 'max_idx': max_idx, 'cameras': cameras}, cache_file, indent=4)
+        except OSError:
+            logging.warning(f'Camera cache {self.cache_path} could not be written')
+
+    def probe(self, camera_indices):
+        '''
+        Probes cameras in parallel
+
+        Parameters:
+            camera_indices (list): camera indices to probe
+
+        Returns:
+            cameras (dict): key = camera index, value = tuple: camera's image frame width and height
+        '''
+
+        start_time = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=len(camera_indices))
+        futures = {camera_idx: executor.submit(probe_camera, self.open_capture, camera_idx)
+                   for camera_idx in camera_indices}
+        # do not wait for hanging probes, their handles are released when they finish
+        executor.shutdown(wait=False)
+
+        cameras = {}
+        deadline = time.monotonic() + self.timeout
+        for camera_idx, future in futures.items():
+            try:
+                video_capture, width, height = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logging.warning(f'Camera idx {camera_idx} timed out')
+                future.add_done_callback(release_late_capture)
+                continue
+            except Exception as e:
+                logging.warning(f'Camera idx {camera_idx} could not be probed: {e}')
+                continue
+
+            if video_capture is None:
+                logging.info(f'Camera idx {camera_idx} not available')
+                continue
+
+            logging.info(f'Camera idx {camera_idx} available, width: {width}, height: {height}')
+            cameras[camera_idx] = (width, height)
+            with self.lock:
+                self.release(camera_idx)
+                self.captures[camera_idx] = video_capture
+
+        logging.debug(f'Probing cameras {camera_indices} took {time.perf_counter() - start_time:.3f} s')
+        return cameras
+
+    def get_cameras(self, max_idx=10, rescan=False):
+        '''
+        Gets a dictionary of camera indices and image parameters (width and height), from the cache if the video
+        devices did not change since it was written
+
+        Parameters:
+            max_idx (int): up to what camera index to enumerate
+            rescan (bool): ignore the cache
+
+        Returns:
+            cameras (dict): key = camera index, value = tuple: camera's image frame width and height
+        '''
+
+        start_time = time.perf_counter()
+        devices = self.list_devices()
+
+        cameras = None if rescan else self._load_cache(devices, max_idx)
+        self.from_cache = cameras is not None
+        if cameras is None:
+            logging.info('Enumerating cameras...')
+            cameras = self.probe(list(range(max_idx + 1)))
+            self._save_cache(devices, max_idx, cameras)
+
+        self.probe_time = time.perf_counter() - start_time
+        logging.info(f'Camera enumeration took {self.probe_time:.3f} s' + (' (cached)' if self.from_cache else ''))
+        return cameras
+
+    def get_width_height(self, camera_idx):
+        '''
+        Gets camera's image frame width and height, the probed handle is kept for open()
+
+        Returns:
+            width, height (int) or None if the camera is not available
+        '''
+
+        with self.lock:
+            video_capture = self.captures.get(camera_idx)
+        if video_capture is not None:
+            return int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        start_time = time.perf_counter()
+        width_height = self.probe([camera_idx]).get(camera_idx)
+        self.probe_time = time.perf_counter() - start_time
+        return width_height
+
+    def open(self, camera_idx):
+        '''
+        Handles of the other probed cameras are released.
+
+        Returns:
+            video_capture (cv2.VideoCapture): handle opened during probing or a newly opened one
+        '''
+
+        with self.lock:
+            video_capture = self.captures.pop(camera_idx, None)
+            for idx in list(self.captures):
+                self.release(idx)
+
+        if video_capture is not None:
+            logging.info(f'Reusing capture handle of camera idx {camera_idx}')
+            return video_capture
+
+        return self.open_capture(camera_idx)
+
+    def release(self, camera_idx):
+        '''
+        Releases the probed handle of a camera, must be called with the lock held
+        '''
+
+        video_capture = self.captures.pop(camera_idx, None)
+        if video_capture is not None:
+            video_capture.release()
+
+    def release_all(self):
+        with self.lock:
+            for camera_idx in list(self.captures):
+                self.release(camera_idx)
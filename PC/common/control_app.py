@@ -0,0 +1,525 @@
+import argparse
+import cv2
+import logging
+import numpy as np
+import os
+import time
+from functools import partial
+
+from common.annotation import RenderThrottle, draw_markers, draw_targeting
+from common.asset_bundle import load_or_build_asset_bundle
+from common.calibration import load_camera_calibration
+from common.camera_probe import CameraManager
+from common.frame_engine import FrameEngine
+from common.frame_governor import FrameGovernor
+from common.frame_grabber import LatestFrameGrabber
+from common.frame_log import FrameLog, FrameLogCapture
+from common.frame_profiler import create_profiler
+from common.markers import create_detector, load_detector_parameters
+from common.multi_camera import DEFAULT_HORIZONTAL_FOV_IN_DEGREES, CameraGeometry, run_multi_camera
+from common.multi_target_tracker import TARGET_POLICIES
+from common.overlay import OverlayAsset
+from common.pipeline import run_pipeline
+from common.roi_tracker import RoiTracker, create_roi_tracking_detector
+from common.session_recorder import FRAME_ENCODINGS, SessionRecorder
+from common.startup import StartupTimer, run_startup_steps
+from common.synthetic_camera import SYNTHETIC_HEIGHT, SYNTHETIC_WIDTH, create_default_scene
+from common.target_predictor import MOTION_MODELS
+from common.targeting import DEADZONE_RADIUS_IN_DEGREES, DEADZONE_RADIUS_IN_PIXELS, FOE_ID, FRIENDLY_ID, \
+    calculate_angle_control, create_control_calculator
+
+
+# AR images directory (independent of the working directory)
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'images')
+
+
+def load_ar_image(path):
+    img = cv2.imread(path)
+    w, h = img.shape[0:2][::-1]
+    corners = np.array([[0, 0], [w, 0], [w, h], [0, h]]).astype(int)
+    return img, w, h, corners
+
+
+def load_friendly():
+    return load_ar_image(os.path.join(IMAGES_DIR, 'friendly.png'))
+
+
+def load_foe():
+    return load_ar_image(os.path.join(IMAGES_DIR, 'foe.png'))
+
+
+def load_ar_images():
+    '''
+    Returns:
+        ar_images (dict): key = marker ID, value = AR image (OverlayAsset)
+    '''
+
+    # load friendly image
+    friendly_img, friendly_w, friendly_h, friendly_corners = load_friendly()
+    logging.info(f'Friendly W x H: {friendly_w} x {friendly_h} ')
+    foe_img, foe_w, foe_h, foe_corners = load_foe()
+    logging.info(f'Foe W x H: {foe_w} x {foe_h} ')
+
+    return {
+        FOE_ID: OverlayAsset(foe_img, foe_corners),
+        FRIENDLY_ID: OverlayAsset(friendly_img, friendly_corners),
+    }
+
+
+def load_ar_images_from_bundle():
+    '''
+    Memory-maps AR images with their masks and corners from the asset bundle, which is (re)built from the images if
+    it is missing or stale
+
+    Returns:
+        ar_images (dict): key = marker ID, value = AR image (OverlayAsset)
+    '''
+
+    return load_or_build_asset_bundle(load_ar_images,
+        [os.path.join(IMAGES_DIR, 'friendly.png'), os.path.join(IMAGES_DIR, 'foe.png')])
+
+
+def create_marker_detector(roi_tracking, detection_scale, detector_parameters=None):
+    '''
+    Parameters:
+        roi_tracking (bool): detect markers only in a window around the locked foe target
+        detection_scale (float): scale factor of the frame used for detection, see create_detector()
+        detector_parameters (dict): tuned detector parameters, None = defaults
+
+    Returns:
+        detect_markers (function): takes frame, returns marker corners and IDs
+        roi_tracker (RoiTracker): None if ROI tracking is disabled
+    '''
+
+    if not roi_tracking:
+        return create_detector(detection_scale, detector_parameters), None
+
+    # scan only a window around the locked foe target
+    roi_tracker = RoiTracker(create_detector(detection_scale, detector_parameters), FOE_ID)
+    return roi_tracker.detect, roi_tracker
+
+
+def open_camera(camera_idx):
+    return cv2.VideoCapture(camera_idx, cv2.CAP_DSHOW)
+
+
+def create_multi_camera_sources(cameras, synthetic=False, seed=0, horizontal_fovs=None, yaw_offsets=None,
+                                pitch_offsets=None):
+    '''
+    Parameters:
+        cameras (dict): key = camera index, value = tuple: camera's image frame width and height
+        synthetic (bool): use a synthetic scene instead of every camera
+        seed (int): random seed of the synthetic scenes
+        horizontal_fovs (list): horizontal field of view of every camera in degrees, used for cameras without a
+            cached calibration, None = DEFAULT_HORIZONTAL_FOV_IN_DEGREES
+        yaw_offsets, pitch_offsets (list): angles of every camera's optical axis relative to the turret boresight
+            in degrees, None = aligned with the boresight
+
+    Returns:
+        sources (dict): key = camera index, value = tuple: capture factory, CameraGeometry
+    '''
+
+    sources = {}
+    for i, (camera_idx, (width, height)) in enumerate(cameras.items()):
+        calibration = None if synthetic else load_camera_calibration(None, camera_idx, width, height)
+        geometry = CameraGeometry(width, height,
+            horizontal_fov=horizontal_fovs[i] if horizontal_fovs else DEFAULT_HORIZONTAL_FOV_IN_DEGREES,
+            calibration=calibration,
+            yaw_offset=yaw_offsets[i] if yaw_offsets else 0.0,
+            pitch_offset=pitch_offsets[i] if pitch_offsets else 0.0)
+        capture_factory = partial(create_default_scene, seed=seed) if synthetic else partial(open_camera, camera_idx)
+        sources[camera_idx] = (capture_factory, geometry)
+
+    return sources
+
+
+def create_pipeline_controller(frame_center, prediction='none', target_policy='boresight', calibration=None,
+                               sink_factory=None):
+    '''
+    Creates control stage of the multi-process pipeline. Runs inside the control process which owns the control sink.
+    '''
+
+    sink = None
+    if sink_factory is not None:
+        # the sink is opened (which resets an Arduino) and started only here, never in the main process
+        sink = sink_factory()
+        sink.start()
+    calculate = create_control_calculator(frame_center, prediction, target_policy,
+        link_latency=None if sink is None else sink.get_link_latency, calibration=calibration)
+
+    def control(marker_corners, marker_ids, timestamp):
+        if calibration is not None:
+            marker_corners = calibration.undistort_corners(marker_corners)
+        control_output = calculate(marker_corners, marker_ids, timestamp)
+        if control_output is not None and sink is not None:
+            sink.send_control(control_output)
+        return control_output
+
+    def close():
+        if sink is not None:
+            sink.close()
+            sink.log_stats()
+
+    control.close = close
+    return control
+
+
+def create_pipeline_renderer(frame_center, render_every=1, render_fps=0):
+    '''
+    Creates render stage of the multi-process pipeline. Runs inside the render process.
+    '''
+
+    ar_images = load_ar_images()
+    render_throttle = RenderThrottle(render_every=render_every, render_fps=render_fps)
+
+    def render(video_frame, marker_corners, marker_ids, control_output):
+        if not render_throttle.should_render():
+            return
+
+        display_frame = draw_markers(video_frame.copy(), marker_corners, marker_ids, ar_images)
+        display_frame = draw_targeting(display_frame, frame_center, DEADZONE_RADIUS_IN_PIXELS, control_output)
+
+        # display modified augmented frame
+        cv2.imshow(f'Camera Live Feed', display_frame)
+        cv2.waitKey(1)
+
+    return render
+
+
+def create_argument_parser():
+    '''
+    Returns:
+        parser (argparse.ArgumentParser): arguments shared by pc_control and dummy_camera
+    '''
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--camera_index", default=-1, type=int,
+                    help="camera index")
+    parser.add_argument("--cameras", default=None, type=int, nargs="+",
+                    help="stream all of the camera indices at once, each in its own capture and detection process, "
+                         "and fuse their detections into a single target")
+    parser.add_argument("--camera_fov", default=None, type=float, nargs="+",
+                    help="horizontal field of view in degrees of every camera of --cameras, used for cameras "
+                         "without a cached calibration")
+    parser.add_argument("--camera_yaw", default=None, type=float, nargs="+",
+                    help="horizontal angle in degrees of the optical axis of every camera of --cameras relative to "
+                         "the turret boresight (positive = right)")
+    parser.add_argument("--camera_pitch", default=None, type=float, nargs="+",
+                    help="vertical angle in degrees of the optical axis of every camera of --cameras relative to "
+                         "the turret boresight (positive = down)")
+    parser.add_argument("-t", "--time", default=-1, type=int,
+                    help="time of operation in seconds")
+    parser.add_argument("-p", "--pipeline", action="store_true",
+                    help="run capture, detection, control and rendering in separate processes")
+    parser.add_argument("-r", "--roi_tracking", action="store_true",
+                    help="detect markers only in a window around the locked foe target")
+    parser.add_argument("-s", "--detection_scale", default=1.0, type=float,
+                    help="scale of the frame used for marker detection in range (0, 1], 0 = automatic")
+    parser.add_argument("--detector_params", default=None,
+                    help="detector parameter file written by autotune/autotune.py, default = default parameters")
+    parser.add_argument("--headless", action="store_true",
+                    help="skip all annotation and GUI work")
+    parser.add_argument("--render_every", "--render-every", default=1, type=int,
+                    help="annotate and display only every N-th frame")
+    parser.add_argument("--render_fps", "--render-fps", default=0, type=float,
+                    help="max. number of annotated and displayed frames per second, 0 = unlimited")
+    parser.add_argument("--frame_budget", default=0, type=float,
+                    help="target processing time per frame in milliseconds, rendering, AR overlays and detection "
+                         "resolution are stepped down while it is exceeded and back up when there is headroom, "
+                         "0 = full quality")
+    parser.add_argument("--profile", action="store_true",
+                    help="measure the time of every frame processing stage and show a summary on the overlay")
+    parser.add_argument("--profile_output", default=None,
+                    help="file to periodically write the stage timing stats to, Prometheus text format if it ends "
+                         "with .prom, JSON otherwise (enables --profile)")
+    parser.add_argument("--profile_trace", default=None,
+                    help="file to write Chrome trace events of the frame processing stages to (enables --profile)")
+    parser.add_argument("--record", default=None,
+                    help="directory to record the session (frames and control telemetry) to")
+    parser.add_argument("--record_encoding", default="jpg", choices=FRAME_ENCODINGS,
+                    help="encoding of the recorded frames, none = record only the telemetry")
+    parser.add_argument("--fast_startup", action="store_true",
+                    help="initialize concurrently with the camera enumeration and memory-map AR images from a bundle")
+    parser.add_argument("--rescan_cameras", action="store_true",
+                    help="enumerate cameras even if the cached enumeration results are valid")
+    parser.add_argument("--synthetic", action="store_true",
+                    help="use synthetic ArUco scene instead of a camera")
+    parser.add_argument("--seed", default=0, type=int,
+                    help="random seed of the synthetic scene")
+    parser.add_argument("--frame_log", default=None,
+                    help="replay raw frame log (see common/frame_log.py) instead of a camera")
+    parser.add_argument("--frame_log_start", default=0, type=int,
+                    help="index of the first frame replayed from the frame log")
+    parser.add_argument("--prediction", default="none", choices=("none",) + MOTION_MODELS,
+                    help="aim at the foe position predicted at the end-to-end latency by a constant velocity (cv) or "
+                         "constant acceleration (ca) Kalman filter")
+    parser.add_argument("--target_policy", default="boresight", choices=("none",) + TARGET_POLICIES,
+                    help="track all foes and engage the one closest to the frame center (boresight), the largest one "
+                         "(size) or the one seen first (first_seen), none = abort targeting if there is more than one")
+    parser.add_argument("--calibration", default=None,
+                    help="camera calibration file (see calibration/calibrate.py) to undistort the marker corners and "
+                         "aim in degrees, default = cached calibration of the selected camera if there is one")
+    parser.add_argument("--undistort_preview", action="store_true",
+                    help="display undistorted frames (requires a camera calibration)")
+
+    return parser
+
+
+def run_control_app(app_name, add_arguments=None, create_sink_factory=None):
+    '''
+    Parses the arguments and runs the targeting on a camera, synthetic scene or frame log in a single process, in the
+    multi-process pipeline or on several cameras at once
+
+    Parameters:
+        app_name (str): name logged at the start
+        add_arguments (function): takes the argument parser and adds the app specific arguments, None = no arguments
+        create_sink_factory (function): takes the argument parser and the parsed arguments and returns the control
+            sink factory, None = the control is only calculated. The factory has to be picklable (it is called in
+            the pipeline's control process) and returns an opened sink with start() (called before the targeting
+            starts), send_control(control), get_link_latency(), close() and log_stats().
+    '''
+
+    # measure the time from the start to the first processed frame
+    startup_start_time = time.perf_counter()
+
+    logging.info(app_name)
+
+    # input arguments parser
+    parser = create_argument_parser()
+    if add_arguments is not None:
+        add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.cameras is not None and args.frame_log is not None:
+        parser.error('--cameras can not be used with --frame_log')
+    for name in ('camera_fov', 'camera_yaw', 'camera_pitch'):
+        values = getattr(args, name)
+        if values is not None and (args.cameras is None or len(values) != len(args.cameras)):
+            parser.error(f'--{name} requires one value per camera of --cameras')
+    if args.pipeline:
+        # the pipeline stages do not record, profile, govern the frame budget or undistort the preview
+        for name in ('record', 'profile', 'profile_output', 'profile_trace', 'frame_budget', 'undistort_preview'):
+            if getattr(args, name):
+                parser.error(f'--{name} can not be used with --pipeline')
+
+    sink_factory = None if create_sink_factory is None else create_sink_factory(parser, args)
+
+    startup_timer = StartupTimer(startup_start_time)
+
+    # tuned ArUco detector parameters
+    detector_parameters = None
+    if args.detector_params is not None:
+        detector_parameters = load_detector_parameters(args.detector_params)
+        logging.info(f'Detector parameters: {detector_parameters}')
+
+    # detector created inside the pipeline and camera worker processes
+    detector_factory = partial(create_roi_tracking_detector, FOE_ID, args.detection_scale, detector_parameters) \
+        if args.roi_tracking else partial(create_detector, args.detection_scale, detector_parameters)
+
+    # independent initialization steps, they run in background threads while the cameras are enumerated in the fast
+    # startup mode
+    startup_steps = {
+        'detector': partial(create_marker_detector, args.roi_tracking, args.detection_scale, detector_parameters),
+        'ar_images': load_ar_images_from_bundle if args.fast_startup else load_ar_images,
+    }
+    if sink_factory is not None and (args.cameras is not None or not args.pipeline):
+        # opens the control sink, e.g. the Arduino serial port, in the pipeline it is opened by the control process
+        startup_steps['sink'] = sink_factory
+    init_steps = run_startup_steps(startup_steps, startup_timer, concurrent=args.fast_startup)
+
+    # enumerates cameras in parallel and keeps the probed capture handles for streaming
+    camera_manager = CameraManager(open_camera)
+
+    # frames come from a camera unless a synthetic scene or a frame log is used
+    use_camera = not args.synthetic and args.frame_log is None
+
+    # enumerate the cameras or probe the selected one
+    with startup_timer.measure('cameras'):
+        if not use_camera:
+            cameras = None
+        elif args.cameras is not None:
+            cameras = {camera_idx: camera_manager.get_width_height(camera_idx) for camera_idx in args.cameras}
+        elif args.camera_index == -1:
+            cameras = camera_manager.get_cameras(max_idx=3, rescan=args.rescan_cameras)
+        else:
+            cameras = {args.camera_index: camera_manager.get_width_height(args.camera_index)}
+
+    if args.cameras is not None:
+        camera_idx = None
+        logging.info(f'Streaming cameras {args.cameras} at once')
+    elif args.synthetic:
+        camera_idx = None
+        logging.info(f'Using synthetic scene with seed {args.seed}')
+    elif args.frame_log is not None:
+        camera_idx = None
+        logging.info(f'Using frame log {args.frame_log} from frame {args.frame_log_start}')
+    elif args.camera_index == -1:
+        if not cameras:
+            logging.error('No cameras found')
+            return
+
+        logging.info(f'Found {len(cameras)} camera(s)')
+        for key, value in cameras.items():
+            logging.info(f'Camera idx: {key}, resolution: {value[0]} x {value[1]}')
+
+        camera_idx = int(input('Select camera index: '))
+        logging.info(f'You have selected: {camera_idx}')
+    else:
+        camera_idx = args.camera_index
+
+    if args.time == -1:
+        desired_time = int(input('Enter desired operating time in seconds: '))
+    else:
+        desired_time = args.time
+
+    sink = None
+    if 'sink' in init_steps:
+        try:
+            sink = init_steps['sink'].result()
+        except Exception as e:
+            logging.error(f'Control sink could not be opened: {e}. Exiting.')
+            return
+
+    # ArUco marker detector and friendly and foe images
+    detect_markers, roi_tracker = init_steps['detector'].result()
+    ar_images = init_steps['ar_images'].result()
+
+    if args.cameras is not None:
+        if args.synthetic:
+            cameras = {camera_idx: (SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT) for camera_idx in args.cameras}
+        elif any(cameras.get(camera_idx) is None for camera_idx in args.cameras):
+            logging.error(f'Not all of the cameras {args.cameras} are available')
+            return
+
+        if not args.headless:
+            logging.warning('There is no preview in the multi-camera mode')
+        # the fused target is the foe closest to the boresight, aimed at by its observed angles
+        if args.prediction != 'none':
+            logging.warning('There is no prediction in the multi-camera mode, --prediction is ignored')
+        if args.target_policy != 'boresight':
+            logging.warning('The foe closest to the boresight is engaged in the multi-camera mode, --target_policy is '
+                            'ignored')
+        for name in ('pipeline', 'record', 'profile', 'profile_output', 'profile_trace', 'frame_budget'):
+            if getattr(args, name):
+                logging.warning(f'--{name} is not supported in the multi-camera mode and is ignored')
+
+        if sink is not None:
+            sink.start()
+
+        # the camera workers open their own camera handles
+        camera_manager.release_all()
+        startup_timer.log()
+        # the camera workers only detect, the fused control is calculated and sent by this process
+        run_multi_camera(create_multi_camera_sources(cameras, args.synthetic, args.seed, args.camera_fov,
+                                                     args.camera_yaw, args.camera_pitch),
+            detector_factory, calculate_angle_control, desired_time,
+            send_control=None if sink is None else sink.send_control,
+            target_id=FOE_ID, threaded_capture=use_camera)
+        if sink is not None:
+            sink.close()
+            sink.log_stats()
+        logging.info('DONE')
+        return
+
+    # get desired damera's image frame width and height
+    if args.synthetic:
+        width, height = SYNTHETIC_WIDTH, SYNTHETIC_HEIGHT
+    elif args.frame_log is not None:
+        frame_log = FrameLog(args.frame_log)
+        width, height = frame_log.width, frame_log.height
+        logging.info(f'Frame log: {len(frame_log)} frames, {width} x {height}, {frame_log.fps} FPS')
+    elif cameras.get(camera_idx) is None:
+        logging.error(f'Camera idx {camera_idx} not available')
+        return
+    else:
+        width, height = cameras[camera_idx]
+
+    # calculate camera's image frame center in pixels
+    frame_center = (int(width/2), int(height/2))
+
+    # camera intrinsics and lens distortion, the error is an angle if the camera is calibrated
+    calibration = load_camera_calibration(args.calibration, camera_idx if use_camera else None, width, height)
+    if calibration is None:
+        deadzone_radius = DEADZONE_RADIUS_IN_PIXELS
+        if args.undistort_preview:
+            logging.warning('Preview is not undistorted, there is no camera calibration')
+    else:
+        deadzone_radius = calibration.angle_to_pixels(DEADZONE_RADIUS_IN_DEGREES)
+
+    if args.synthetic:
+        capture_factory = partial(create_default_scene, seed=args.seed)
+    elif args.frame_log is not None:
+        capture_factory = partial(FrameLogCapture, args.frame_log, args.frame_log_start)
+    else:
+        capture_factory = partial(open_camera, camera_idx)
+
+    if sink is not None:
+        sink.start()
+
+    if args.pipeline:
+        # the capture process opens its own camera handle and the control process the sink
+        camera_manager.release_all()
+        startup_timer.log()
+        run_pipeline(capture_factory=capture_factory,
+            controller_factory=partial(create_pipeline_controller, frame_center, args.prediction, args.target_policy,
+                calibration, sink_factory),
+            renderer_factory=None if args.headless
+                else partial(create_pipeline_renderer, frame_center, args.render_every, args.render_fps),
+            frame_shape=(int(height), int(width), 3),
+            desired_time=desired_time,
+            detector_factory=detector_factory)
+        if not args.headless:
+            cv2.destroyAllWindows()
+        logging.info('DONE')
+        return
+
+    # open video stream
+    logging.info(f'Opening video stream for camera {camera_idx}...')
+    # read frames in a background thread so that the loop always processes the newest frame (synthetic and frame
+    # log frames are read one by one so that the run is deterministic)
+    with startup_timer.measure('stream_open'):
+        video_capture = LatestFrameGrabber(camera_manager.open(camera_idx) if use_camera else capture_factory(),
+                                           threaded=use_camera).start()
+
+    # calculate control on the observed or on the predicted foe position
+    calculate = create_control_calculator(frame_center, args.prediction, args.target_policy,
+        link_latency=None if sink is None else sink.get_link_latency, calibration=calibration)
+
+    # targeting runs for every frame, annotation and display only for some (or none) of them
+    render_throttle = RenderThrottle(args.headless, args.render_every, args.render_fps)
+
+    # adapts the processing quality to the frame budget
+    governor = None
+    if args.frame_budget > 0:
+        governor = FrameGovernor(args.frame_budget / 1000,
+            set_detection_scale=(detect_markers if roi_tracker is None else roi_tracker).set_scale_factor)
+
+    # per-frame stage timing, no-op unless enabled
+    profiler = create_profiler(args.profile, args.profile_output, args.profile_trace,
+                               get_frames_dropped=lambda: video_capture.frames_dropped, governor=governor)
+
+    # record frames and control telemetry in a background thread
+    recorder = None
+    if args.record is not None:
+        recorder = SessionRecorder(os.path.join(args.record, time.strftime('session_%Y%m%d_%H%M%S')),
+                                   args.record_encoding, metadata={'args': vars(args)}).start()
+        recorder.record_event('session_start', frame_center=frame_center)
+
+    # the control is sent to the sink if there is one
+    engine = FrameEngine(video_capture, detect_markers, calculate, frame_center, deadzone_radius, ar_images,
+        send_control=None if sink is None else sink.send_control,
+        render_throttle=render_throttle, profiler=profiler, recorder=recorder, roi_tracker=roi_tracker,
+        startup_timer=startup_timer, calibration=calibration, undistort_preview=args.undistort_preview,
+        governor=governor)
+    engine.run(desired_time)
+
+    engine.close()
+    if sink is not None:
+        sink.close()
+    engine.log_stats()
+    if sink is not None:
+        sink.log_stats()
+
+    if not args.headless:
+        cv2.destroyAllWindows()
+    logging.info('DONE')
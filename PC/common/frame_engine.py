@@ -0,0 +1,270 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from common.annotation import RenderThrottle, draw_markers, draw_targeting, draw_text
+from common.frame_profiler import NullProfiler
+from common.overlay import OverlayBuffers
+
+
+class FrameEngine:
+    '''
+    Frame processing loop shared by pc_control and dummy_camera: capture, marker detection, control calculation,
+    control sink (e.g. Arduino serial port), session recording, annotation and display
+
+    No frame-sized arrays are allocated in steady state. Frames are read into the buffer pool of the frame grabber,
+    annotation is drawn in place into a preallocated display frame and AR images are warped into preallocated
+    scratch buffers.
+    '''
+
+    def __init__(self, video_capture, detect_markers, calculate, frame_center, deadzone_radius, ar_images,
+                 send_control=None, render_throttle=None, profiler=None, recorder=None, roi_tracker=None,
+                 startup_timer=None, calibration=None, undistort_preview=False, governor=None,
+                 window_name='Camera Live Feed'):
+        '''
+        Parameters:
+            video_capture (LatestFrameGrabber): started frame grabber
+            detect_markers (function): takes video frame, returns marker corners and IDs as returned by detectMarkers()
+            calculate (function): takes marker corners, marker IDs, the frame capture timestamp and the capture time
+                (keyword capture_time) and returns control (dict) or None, as created by create_control_calculator()
+            frame_center (tuple): position of the camera's image frame center in pixels
+            deadzone_radius (int): deadzone radius in pixels
+            ar_images (dict): key = marker ID, value = AR image (OverlayAsset)
+            send_control (function): control sink, called with the control (dict) of every frame with a target,
+                None = no sink
+            render_throttle (RenderThrottle): decides which frames are annotated and displayed, None = all
+            profiler (FrameProfiler): per-frame stage timing, None = disabled
+            recorder (SessionRecorder): records frames and control telemetry, None = disabled
+            roi_tracker (RoiTracker): ROI tracking stats are shown and logged, None = ROI tracking disabled
+            startup_timer (StartupTimer): logged at the first processed frame, None = not measured
+            calibration (CameraCalibration): the detected marker corners are undistorted before the control is
+                calculated, None = uncalibrated camera
+            undistort_preview (bool): display undistorted frames, requires calibration
+            governor (FrameGovernor): steps rendering, overlay compositing (and detection resolution through the
+                detector) down when the frame budget is exceeded, None = full quality
+            window_name (str): name of the display window
+        '''
+
+        self.video_capture = video_capture
+        self.detect_markers = detect_markers
+        self.calculate = calculate
+        self.frame_center = frame_center
+        self.deadzone_radius = deadzone_radius
+        self.ar_images = ar_images
+        self.send_control = send_control
+        self.render_throttle = RenderThrottle() if render_throttle is None else render_throttle
+        self.profiler = NullProfiler() if profiler is None else profiler
+        self.recorder = recorder
+        self.roi_tracker = roi_tracker
+        self.startup_timer = startup_timer
+        self.calibration = calibration
+        self.undistort_preview = undistort_preview and calibration is not None
+        self.governor = governor
+        self.window_name = window_name
+
+        # aim point drawn on the (undistorted) preview
+        self.preview_center = frame_center
+        if self.undistort_preview:
+            preview_center = calibration.undistort_points([frame_center])[0]
+            self.preview_center = (int(round(preview_center[0])), int(round(preview_center[1])))
+
+        # max. number of composited AR images, None = all
+        self.max_overlays = None
+
+        # allocated for the first rendered frame and reused afterwards
+        self.display_frame = None
+        self.overlay_buffers = None
+
+        self.frames_processed = 0
+
+    def process_frame(self, time_left=None):
+        '''
+        Reads the newest frame and processes it: detection, control, sink, recording and (if not throttled) rendering
+
+        Parameters:
+            time_left (float): remaining operating time in seconds shown on the overlay, None = not shown
+
+        Returns:
+            ret (bool): False if no video frame was received
+        '''
+
+        self.profiler.start_frame()
+
+        # get newest video frame (older frames which were not processed in time are dropped)
+        ret, video_frame = self.video_capture.read()
+        if not ret:
+            return False
+        self.mark('capture')
+
+        if self.startup_timer is not None and self.startup_timer.mark_first_frame():
+            self.startup_timer.log()
+
+        # detect the markers in the image
+        marker_corners, marker_ids = self.detect_markers(video_frame)
+
+        # only the detected corners are undistorted, not the frame
+        undistorted_corners = marker_corners
+        if self.calibration is not None:
+            undistorted_corners = self.calibration.undistort_corners(marker_corners)
+        self.mark('detect')
+
+        # calculate X & Y motor speed for the foe target
+        timestamp = self.video_capture.last_frame_timestamp
+        control = self.calculate(undistorted_corners, marker_ids, timestamp,
+                                 capture_time=self.video_capture.last_capture_time)
+        self.mark('control')
+
+        if self.send_control is not None:
+            if control is not None:
+                self.send_control(control)
+            self.mark('serial')
+
+        if self.recorder is not None:
+            self.recorder.record_frame(video_frame, timestamp, marker_corners, marker_ids, control)
+        self.mark('record')
+
+        self.frames_processed += 1
+
+        if self.render_throttle.should_render():
+            self.render(video_frame, marker_corners, marker_ids, control, time_left, undistorted_corners)
+
+        if self.governor is not None and self.governor.end_frame():
+            self.apply_quality(self.governor.quality)
+
+        return True
+
+    def mark(self, stage):
+        self.profiler.mark(stage)
+        if self.governor is not None:
+            self.governor.mark(stage)
+
+    def apply_quality(self, quality):
+        '''
+        Applies the rendering settings of a FrameGovernor quality level, the detection resolution is set by the
+        governor itself
+        '''
+
+        self.render_throttle.render_skip = quality['render_skip']
+        self.max_overlays = quality['max_overlays']
+
+    def get_display_frame(self, video_frame):
+        '''
+        Returns:
+            display_frame (numpy.ndarray): preallocated frame holding a copy (or the undistorted preview) of the
+                video frame to draw on
+        '''
+
+        if self.display_frame is None or self.display_frame.shape != video_frame.shape:
+            self.display_frame = np.empty_like(video_frame)
+            self.overlay_buffers = OverlayBuffers(video_frame.shape)
+
+        if self.undistort_preview:
+            self.calibration.undistort_preview(video_frame, dst=self.display_frame)
+        else:
+            np.copyto(self.display_frame, video_frame)
+        return self.display_frame
+
+    def render(self, video_frame, marker_corners, marker_ids, control, time_left=None, undistorted_corners=None):
+        '''
+        Annotates a copy of the video frame in place and displays it
+
+        Parameters:
+            marker_corners (list): detected marker corners
+            undistorted_corners (list): undistorted marker corners, drawn on the undistorted preview
+        '''
+
+        display_frame = self.get_display_frame(video_frame)
+
+        if self.undistort_preview:
+            marker_corners = undistorted_corners
+        elif self.calibration is not None and control is not None:
+            # the target is in undistorted coordinates, draw it where it is in the frame
+            target_x, target_y = self.calibration.distort_points([control['target']])[0]
+            control = dict(control, target=(int(round(target_x)), int(round(target_y))))
+
+        # apply time left
+        if time_left is not None:
+            draw_text(display_frame, f'Time left: {time_left:.2f}', line=0)
+
+        # apply frame age and number of dropped frames
+        draw_text(display_frame,
+            f'Frame age: {self.video_capture.last_frame_age * 1000:.0f} ms, dropped: {self.video_capture.frames_dropped}',
+            line=4)
+
+        if self.roi_tracker is not None:
+            # apply ROI tracking hit rate
+            roi_stats = self.roi_tracker.get_stats()
+            draw_text(display_frame,
+                f'ROI hit rate: {roi_stats["roi_hit_rate"] * 100:.0f} %, saved: {roi_stats["time_saved_per_frame"] * 1000:.1f} ms',
+                line=5)
+
+        # apply AR images, ArUco IDs and corners
+        draw_markers(display_frame, marker_corners, marker_ids, self.ar_images, self.overlay_buffers,
+                     self.max_overlays)
+
+        # draw deadzone radius and error vector
+        draw_targeting(display_frame, self.preview_center, self.deadzone_radius, control)
+
+        # apply quality level and stage timing summary
+        summary = self.profiler.get_summary()
+        if self.governor is not None:
+            summary = [self.governor.get_summary()] + summary
+        for i, text in enumerate(summary):
+            draw_text(display_frame, text, line=6 + i)
+        self.mark('overlay')
+
+        # display modified augmented frame
+        cv2.imshow(self.window_name, display_frame)
+        cv2.waitKey(1)
+        self.mark('display')
+
+    def run(self, desired_time):
+        '''
+        Processes the video stream for the desired time or until no frame is received
+
+        Parameters:
+            desired_time (float): time of operation in seconds
+        '''
+
+        logging.info(f'Processing video stream for {desired_time} seconds...')
+        start_time = time.time()
+        while True:
+            elapsed_time = time.time() - start_time
+            if elapsed_time > desired_time:
+                break
+
+            if not self.process_frame(desired_time - elapsed_time):
+                logging.error('No video frame received. Exiting.')
+                break
+
+    def close(self):
+        '''
+        Releases the video capture and writes the profiler outputs and the recorded session
+        '''
+
+        self.video_capture.release()
+        self.profiler.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def log_stats(self):
+        logging.info(f'Capture stats: {self.video_capture.get_stats()}')
+        self.profiler.log_stats()
+        if self.governor is not None:
+            self.governor.log_stats()
+        if self.recorder is not None:
+            logging.info(f'Session recorder stats: {self.recorder.get_stats()}')
+        if self.roi_tracker is not None:
+            logging.info(f'ROI tracking stats: {self.roi_tracker.get_stats()}')
+
+        foe_tracker = getattr(self.calculate, 'foe_tracker', None)
+        if foe_tracker is not None:
+            logging.info(f'Target tracking stats: {foe_tracker.get_stats()}')
+        tracker = getattr(self.calculate, 'tracker', None)
+        if tracker is not None:
+            logging.info(f'Prediction stats: {tracker.get_stats()}, '
+                         f'latency: {self.calculate.latency_estimator.latency * 1000:.1f} ms')
+
+        logging.info(f'Rendered {self.render_throttle.frames_rendered} of {self.render_throttle.frame_idx + 1} frames')
@@ -0,0 +1,182 @@
+import logging
+import time
+
+
+# quality levels from full to lowest quality, work is stepped down in this order: rendering is skipped first (the
+# control does not depend on it), then the number of composited AR overlays is limited and only then the detection
+# resolution (which the aim does depend on) is reduced
+QUALITY_LEVELS = (
+    {'render_skip': 1, 'max_overlays': None, 'detection_scale': 1.0},
+    {'render_skip': 2, 'max_overlays': None, 'detection_scale': 1.0},
+    {'render_skip': 4, 'max_overlays': 1, 'detection_scale': 1.0},
+    {'render_skip': 4, 'max_overlays': 0, 'detection_scale': 0.75},
+    {'render_skip': 8, 'max_overlays': 0, 'detection_scale': 0.5},
+)
+
+# number of frames the work time is averaged over before the quality level is changed
+DEFAULT_WINDOW_IN_FRAMES = 15
+
+# quality is stepped up only if the work time is below this fraction of the frame budget
+HEADROOM_FRACTION = 0.7
+
+# max. factor the step up window grows by when stepping up exceeded the budget again
+MAX_BACKOFF = 16
+
+# smoothing factor of the per-stage time estimates
+STAGE_SMOOTHING = 0.1
+
+
+class FrameGovernor:
+    '''
+    Holds the frame processing time within a frame budget by stepping the processing quality down and up
+
+    The work time of a frame is measured from the end of the capture (waiting for the camera is not work) to the
+    end of the frame. After every window of frames the quality is stepped down if the mean work time exceeded the
+    budget or stepped up if it was below HEADROOM_FRACTION of it. If a step up exceeds the budget again, the next
+    step up waits twice as long, so the quality does not oscillate between two levels.
+
+    Usage in the processing loop: mark(stage) after every stage, starting with 'capture', and end_frame() at the end.
+    '''
+
+    def __init__(self, frame_budget, set_detection_scale=None, levels=QUALITY_LEVELS,
+                 window=DEFAULT_WINDOW_IN_FRAMES, headroom=HEADROOM_FRACTION):
+        '''
+        Parameters:
+            frame_budget (float): target work time per frame in seconds
+            set_detection_scale (function): takes the detection scale factor of the quality level (relative to the
+                configured detection scale), None = detection resolution is not changed
+            levels (tuple): quality levels (dict with render_skip, max_overlays and detection_scale) from full to
+                lowest quality
+            window (int): number of frames the work time is averaged over
+            headroom (float): fraction of the budget the work time has to be below to step the quality up
+        '''
+
+        assert frame_budget > 0, 'Frame budget has to be positive'
+
+        self.frame_budget = frame_budget
+        self.set_detection_scale = set_detection_scale
+        self.levels = levels
+        self.window = window
+        self.headroom = headroom
+
+        self.level = 0
+        self.backoff = 1
+        self.stepped_up = False
+
+        self.work_start_time = None
+        self.last_mark_time = None
+        self.window_frames = 0
+        self.window_time = 0.0
+        self.last_window_time = None
+        self.stage_times = {}
+
+        self.frames = 0
+        self.budget_misses = 0
+        self.steps_down = 0
+        self.steps_up = 0
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def mark(self, stage):
+        '''
+        Records the time since the previous mark as the duration of the stage, the work time starts at 'capture'
+        '''
+
+        now = time.perf_counter()
+        if stage == 'capture':
+            self.work_start_time = now
+        else:
+            duration = now - self.last_mark_time
+            stage_time = self.stage_times.get(stage)
+            self.stage_times[stage] = duration if stage_time is None else \
+                stage_time + STAGE_SMOOTHING * (duration - stage_time)
+        self.last_mark_time = now
+
+    def end_frame(self):
+        '''
+        Returns:
+            changed (bool): True if the quality level was changed
+        '''
+
+        if self.work_start_time is None:
+            return False
+
+        work_time = time.perf_counter() - self.work_start_time
+        self.work_start_time = None
+        self.frames += 1
+        if work_time > self.frame_budget:
+            self.budget_misses += 1
+
+        self.window_frames += 1
+        self.window_time += work_time
+        mean_work_time = self.window_time / self.window_frames
+
+        # a step down is decided after a window, a step up after the backed off window
+        has_headroom = mean_work_time < self.headroom * self.frame_budget
+        if self.window_frames < self.window * (self.backoff if has_headroom else 1):
+            return False
+
+        self.last_window_time = mean_work_time
+        self.window_frames = 0
+        self.window_time = 0.0
+
+        if mean_work_time > self.frame_budget and self.level < len(self.levels) - 1:
+            if self.stepped_up:
+                # the higher quality does not fit the budget, wait longer before trying it again
+                self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+            self.set_level(self.level + 1)
+            self.steps_down += 1
+            self.stepped_up = False
+            return True
+
+        if has_headroom and self.level > 0:
+            self.set_level(self.level - 1)
+            self.steps_up += 1
+            self.stepped_up = True
+            return True
+
+        if self.stepped_up:
+            # the step up fits the budget
+            self.backoff = 1
+            self.stepped_up = False
+        return False
+
+    def set_level(self, level):
+        logging.debug(f'Frame governor quality level {self.level} -> {level}: {self.levels[level]}')
+        self.level = level
+        if self.set_detection_scale is not None:
+            self.set_detection_scale(self.quality['detection_scale'])
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats (dict): frame budget, quality level and its settings, number of frames over budget, level changes
+                and the mean work time of the last window and smoothed stage times in seconds
+        '''
+
+        return {
+            'frame_budget': self.frame_budget,
+            'level': self.level,
+            'max_level': len(self.levels) - 1,
+            'quality': dict(self.quality),
+            'frames': self.frames,
+            'budget_misses': self.budget_misses,
+            'budget_miss_rate': self.budget_misses / self.frames if self.frames > 0 else 0.0,
+            'steps_down': self.steps_down,
+            'steps_up': self.steps_up,
+            'work_time': self.last_window_time,
+            'stages': dict(self.stage_times),
+        }
+
+    def get_summary(self):
+        '''
+        Returns:
+            summary (str): text line for the overlay
+        '''
+
+        return f'Quality level: {self.level}/{len(self.levels) - 1}, budget misses: {self.budget_misses}/{self.frames}'
+
+    def log_stats(self):
+        logging.info(f'Frame governor stats: {self.get_stats()}')
@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+from collections import deque
+
+
+class LatestFrameGrabber:
+    '''
+    Reads frames from a video capture in a background thread and always hands out the newest one
+
+    Frames which were captured but never handed out (because the processing loop was slower than the camera)
+    are dropped and counted. Each delivered frame carries its capture timestamp so that its age can be reported.
+
+    If threaded is False, every read() reads the next frame directly from the video capture, so that sources which
+    are not paced by a camera (e.g. SyntheticCamera) are processed frame by frame and deterministically.
+
+    Frames are read into a pool of reused buffers (read(image=...)) instead of newly allocated arrays. The pool holds
+    the frames in the ring buffer, the delivered frame and the frame being captured, so a delivered frame stays valid
+    (and may be modified) until the next read(). Captures whose read() takes no image buffer get new arrays as before.
+    '''
+
+    def __init__(self, video_capture, buffer_size=2, threaded=True, reuse_buffers=True):
+        '''
+        Parameters:
+            video_capture (cv2.VideoCapture): opened video capture (or any object with read()/get()/release())
+            buffer_size (int): number of most recent frames kept in the ring buffer
+            threaded (bool): read frames in a background thread
+            reuse_buffers (bool): read frames into a pool of preallocated buffers
+        '''
+
+        assert buffer_size >= 1, 'Buffer size has to be at least 1'
+
+        self.video_capture = video_capture
+        self.threaded = threaded
+        self.frame_buffer = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        # frame buffer pool, frames in the ring buffer refer to their buffer by index
+        self.reuse_buffers = reuse_buffers
+        self.buffers = []
+        self.free_buffers = deque()
+        self.delivered_buffer = None
+
+        # sequence number of the last captured and of the last delivered frame
+        self.captured_seq = -1
+        self.delivered_seq = -1
+
+        self.frames_captured = 0
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self.last_frame_timestamp = None
+        self.last_frame_age = None
+        # time.monotonic() at which the last frame was captured, differs from the timestamp for recorded frames
+        self.last_capture_time = None
+
+    def start(self):
+        '''
+        Starts the background capture thread
+
+        Returns:
+            self (LatestFrameGrabber): to allow chaining with the constructor
+        '''
+
+        self.running = True
+        if not self.threaded:
+            return self
+
+        self.thread = threading.Thread(target=self._capture_loop, name='LatestFrameGrabber', daemon=True)
+        self.thread.start()
+        return self
+
+    def _read_capture(self, image):
+        if image is None:
+            return self.video_capture.read()
+
+        try:
+            return self.video_capture.read(image)
+        except TypeError:
+            # read() of the capture takes no image buffer
+            logging.info('Video capture does not read into buffers, frame buffers are not reused')
+            self.reuse_buffers = False
+            return self.video_capture.read()
+
+    def _adopt_buffer(self, frame, buffer_idx=None):
+        '''
+        Makes the frame returned by the capture a pool buffer, either a new one (pool not fully allocated yet) or a
+        replacement of the buffer which the capture did not read into (e.g. after a resolution change)
+
+        Returns:
+            buffer_idx (int): index of the frame's buffer or None if buffers are not reused
+        '''
+
+        if not self.reuse_buffers:
+            return None
+
+        # read-only frames (e.g. memory-mapped) cannot be read into
+        buffer = frame if frame.flags.writeable else frame.copy()
+        if buffer_idx is None:
+            self.buffers.append(buffer)
+            return len(self.buffers) - 1
+
+        self.buffers[buffer_idx] = buffer
+        return buffer_idx
+
+    def _release_buffer(self, buffer_idx):
+        '''
+        Returns the buffer to the pool unless the frame in it is still in the ring buffer or delivered
+        '''
+
+        if buffer_idx is None or buffer_idx == self.delivered_buffer:
+            return
+        if any(entry[3] == buffer_idx for entry in self.frame_buffer):
+            return
+
+        self.free_buffers.append(buffer_idx)
+
+    def _capture_loop(self):
+        while self.running:
+            with self.condition:
+                buffer_idx = self.free_buffers.popleft() if self.reuse_buffers and self.free_buffers else None
+            image = self.buffers[buffer_idx] if buffer_idx is not None else None
+
+            ret, frame = self._read_capture(image)
+            timestamp = time.monotonic()
+
+            if not ret:
+                logging.warning('Video capture returned no frame. Capture thread stopped.')
+                with self.condition:
+                    self.running = False
+                    self.condition.notify_all()
+                break
+
+            with self.condition:
+                if frame is not image:
+                    buffer_idx = self._adopt_buffer(frame, buffer_idx)
+                    if buffer_idx is not None:
+                        frame = self.buffers[buffer_idx]
+
+                evicted = self.frame_buffer[0] if len(self.frame_buffer) == self.frame_buffer.maxlen else None
+                self.captured_seq += 1
+                self.frames_captured += 1
+                self.frame_buffer.append((self.captured_seq, timestamp, frame, buffer_idx))
+                if evicted is not None:
+                    self._release_buffer(evicted[3])
+                self.condition.notify_all()
+
+    def read(self, timeout=1.0):
+        '''
+        Waits for a frame newer than the previously returned one and returns the newest frame available
+
+        Parameters:
+            timeout (float): max. time in seconds to wait for a new frame
+
+        Returns:
+            ret (bool): True if a new frame was returned
+            frame (numpy.ndarray): newest video frame or None
+        '''
+
+        if not self.threaded:
+            return self.read_next()
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.captured_seq > self.delivered_seq or not self.running,
+                timeout=timeout)
+
+            if self.captured_seq <= self.delivered_seq:
+                return False, None
+
+            seq, timestamp, frame, buffer_idx = self.frame_buffer[-1]
+
+            # the previously delivered frame is not used any more
+            previous_buffer, self.delivered_buffer = self.delivered_buffer, buffer_idx
+            self._release_buffer(previous_buffer)
+
+            # every frame between the previously delivered and the current one is never going to be processed
+            self.frames_dropped += seq - self.delivered_seq - 1
+            self.frames_delivered += 1
+            self.delivered_seq = seq
+
+        self.last_frame_timestamp = timestamp
+        self.last_capture_time = timestamp
+        self.last_frame_age = time.monotonic() - timestamp
+        return True, frame
+
+    def read_next(self):
+        # every frame is read into the same buffer, the previous frame is not used any more
+        image = self.buffers[0] if self.reuse_buffers and self.buffers else None
+        ret, frame = self._read_capture(image)
+        if not ret:
+            return False, None
+
+        if frame is not image and self._adopt_buffer(frame, 0 if self.buffers else None) is not None:
+            frame = self.buffers[0]
+
+        self.frames_captured += 1
+        self.frames_delivered += 1
+        # sources replaying a recording provide the original capture timestamp, which is on a different clock than
+        # the capture time used for the latency
+        timestamp = getattr(self.video_capture, 'frame_timestamp', None)
+        self.last_capture_time = time.monotonic()
+        self.last_frame_timestamp = self.last_capture_time if timestamp is None else timestamp
+        self.last_frame_age = 0.0
+        return True, frame
+
+    def get(self, prop_id):
+        '''
+        Forwards property queries to the underlying video capture
+        '''
+
+        return self.video_capture.get(prop_id)
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats (dict): frames captured, delivered and dropped and the age of the last delivered frame in seconds
+        '''
+
+        with self.condition:
+            return {
+                'frames_captured': self.frames_captured,
+                'frames_delivered': self.frames_delivered,
+                'frames_dropped': self.frames_dropped,
+                'last_frame_age': self.last_frame_age,
+            }
+
+    def stop(self):
+        '''
+        Stops the background capture thread
+        '''
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def release(self):
+        '''
+        Stops the background capture thread and releases the underlying video capture
+        '''
+
+        self.stop()
+        self.video_capture.release()
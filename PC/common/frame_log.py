@@ -0,0 +1,314 @@
+import json
+import os
+import struct
+import time
+
+import cv2
+import numpy as np
+
+
+FRAME_LOG_MAGIC = b'DKFL'
+FRAME_LOG_VERSION = 1
+
+# the file header is padded to a page so that the records are page aligned
+HEADER_SIZE = 4096
+
+# records are padded to a multiple of this size
+RECORD_ALIGNMENT = 64
+
+# metadata stored in front of every frame, padded to RECORD_ALIGNMENT bytes
+RECORD_METADATA_FIELDS = [('timestamp', '<f8'), ('frame_idx', '<i8'), ('wall_time', '<f8')]
+
+
+def get_record_dtype(shape, dtype):
+    '''
+    Returns:
+        record_dtype (numpy.dtype): structured dtype of a single fixed-size record (metadata + frame)
+    '''
+
+    metadata_dtype = np.dtype(RECORD_METADATA_FIELDS)
+    frame_dtype = np.dtype((np.dtype(dtype), tuple(shape)))
+    frame_offset = -(-metadata_dtype.itemsize // RECORD_ALIGNMENT) * RECORD_ALIGNMENT
+    record_size = -(-(frame_offset + frame_dtype.itemsize) // RECORD_ALIGNMENT) * RECORD_ALIGNMENT
+
+    return np.dtype({
+        'names': [name for name, _ in RECORD_METADATA_FIELDS] + ['frame'],
+        'formats': [fmt for _, fmt in RECORD_METADATA_FIELDS] + [frame_dtype],
+        'offsets': [metadata_dtype.fields[name][1] for name, _ in RECORD_METADATA_FIELDS] + [frame_offset],
+        'itemsize': record_size,
+    })
+
+
+def is_frame_log(path):
+    '''
+    Returns:
+        frame_log (bool): True if the file is a raw frame log
+    '''
+
+    if not os.path.isfile(path):
+        return False
+
+    with open(path, 'rb') as log_file:
+        return log_file.read(len(FRAME_LOG_MAGIC)) == FRAME_LOG_MAGIC
+
+
+class FrameLogWriter:
+    '''
+    Appends frames of a fixed resolution and dtype as fixed-size raw records to a frame log file
+
+    Layout: magic, little-endian uint32 header length and JSON header (resolution, dtype, fps, record size) padded to
+    HEADER_SIZE, followed by the records. Every record holds the capture timestamp, frame index and wall time in front
+    of the raw frame, so the log stays readable up to the last complete record even if writing is interrupted.
+    '''
+
+    def __init__(self, path, width, height, channels=3, dtype=np.uint8, fps=30.0, metadata=None):
+        '''
+        Parameters:
+            path (str): path of the frame log file
+            width, height (int): frame size in pixels
+            channels (int): number of channels, 1 = grayscale frames of shape (height, width)
+            dtype (numpy.dtype): frame dtype
+            fps (float): frame rate of the recording
+            metadata (dict): additional metadata stored in the header
+        '''
+
+        self.shape = (height, width) if channels == 1 else (height, width, channels)
+        self.record_dtype = get_record_dtype(self.shape, dtype)
+        self.record = np.zeros(1, dtype=self.record_dtype)
+        self.frames_written = 0
+
+        header = json.dumps({
+            'version': FRAME_LOG_VERSION,
+            'width': width,
+            'height': height,
+            'channels': channels,
+            'dtype': np.dtype(dtype).str,
+            'fps': fps,
+            'record_size': self.record_dtype.itemsize,
+            'metadata': metadata or {},
+        }).encode()
+        assert len(header) + len(FRAME_LOG_MAGIC) + 4 <= HEADER_SIZE, 'Frame log header too long'
+
+        self.log_file = open(path, 'wb')
+        self.log_file.write(FRAME_LOG_MAGIC + struct.pack('<I', len(header)) + header)
+        self.log_file.write(b'\0' * (HEADER_SIZE - self.log_file.tell()))
+
+    def write(self, frame, timestamp, frame_idx=None, wall_time=None):
+        '''
+        Parameters:
+            frame (numpy.ndarray): frame of the log's resolution and dtype
+            timestamp (float): capture timestamp in seconds
+            frame_idx (int): source frame index, None = sequential index
+            wall_time (float): wall clock time of the capture, None = now
+        '''
+
+        record = self.record[0]
+        record['timestamp'] = timestamp
+        record['frame_idx'] = self.frames_written if frame_idx is None else frame_idx
+        record['wall_time'] = time.time() if wall_time is None else wall_time
+        record['frame'] = frame
+        self.log_file.write(self.record.tobytes())
+        self.frames_written += 1
+
+    def close(self):
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameLog:
+    '''
+    Memory-mapped frame log with random access, frames and index fields are views into the mapping (no copies)
+    '''
+
+    def __init__(self, path):
+        '''
+        Parameters:
+            path (str): path of the frame log file
+        '''
+
+        with open(path, 'rb') as log_file:
+            if log_file.read(len(FRAME_LOG_MAGIC)) != FRAME_LOG_MAGIC:
+                raise ValueError(f'{path} is not a frame log')
+            header_length, = struct.unpack('<I', log_file.read(4))
+            self.header = json.loads(log_file.read(header_length))
+
+        self.width = self.header['width']
+        self.height = self.header['height']
+        self.fps = self.header['fps']
+        channels = self.header['channels']
+        self.shape = (self.height, self.width) if channels == 1 else (self.height, self.width, channels)
+        self.record_dtype = get_record_dtype(self.shape, self.header['dtype'])
+        assert self.record_dtype.itemsize == self.header['record_size'], 'Frame log record size mismatch'
+
+        # an incomplete last record (interrupted writing) is ignored
+        num_records = (os.path.getsize(path) - HEADER_SIZE) // self.record_dtype.itemsize
+        if num_records > 0:
+            self.records = np.memmap(path, dtype=self.record_dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(num_records,))
+        else:
+            self.records = np.zeros(0, dtype=self.record_dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, frame_idx):
+        '''
+        Returns:
+            frame (numpy.ndarray): read-only view of the frame (or frames for a slice)
+        '''
+
+        return self.records['frame'][frame_idx]
+
+    @property
+    def timestamps(self):
+        return self.records['timestamp']
+
+    @property
+    def frame_idxs(self):
+        return self.records['frame_idx']
+
+    @property
+    def wall_times(self):
+        return self.records['wall_time']
+
+    def find(self, timestamp):
+        '''
+        Returns:
+            frame_idx (int): index of the last frame captured at or before the timestamp
+        '''
+
+        return max(int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1, 0)
+
+    def close(self):
+        # the mapping is closed when the last view of it is released
+        self.records = None
+
+
+class FrameLogCapture:
+    '''
+    Frame log as a frame source with the read()/get()/set()/release() interface of cv2.VideoCapture
+
+    read() returns read-only views into the mapping, or copies into the image buffer if one is given. The capture
+    timestamp of the last read frame is available as frame_timestamp.
+    '''
+
+    def __init__(self, path, start=0, loop=False, real_time=False):
+        '''
+        Parameters:
+            path (str): path of the frame log file
+            start (int): index of the first frame
+            loop (bool): start over after the last frame
+            real_time (bool): pace read() to the recorded timestamps
+        '''
+
+        self.frame_log = FrameLog(path)
+        self.frame_idx = start
+        self.loop = loop
+        self.real_time = real_time
+        self.frame_timestamp = None
+        self.start_time = None
+        self.opened = True
+
+    def read(self, image=None):
+        '''
+        Returns:
+            ret (bool): False if the capture is released or all frames were read
+            video_frame (numpy.ndarray): next frame or None
+        '''
+
+        if self.opened and self.loop and self.frame_idx >= len(self.frame_log) > 0:
+            self.frame_idx = 0
+            self.start_time = None
+
+        if not self.opened or self.frame_idx >= len(self.frame_log):
+            return False, None
+
+        record = self.frame_log.records[self.frame_idx]
+        if self.real_time:
+            if self.start_time is None:
+                self.start_time = time.monotonic() - record['timestamp']
+            delay = self.start_time + record['timestamp'] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.frame_timestamp = float(record['timestamp'])
+        self.frame_idx += 1
+
+        if image is None:
+            return True, record['frame']
+        np.copyto(image, record['frame'])
+        return True, image
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_log.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_log.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.frame_log.fps)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_idx)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.frame_log))
+        return 0.0
+
+    def set(self, prop_id, value):
+        '''
+        Jumps to the frame index (cv2.CAP_PROP_POS_FRAMES), no decoding from the start is needed
+        '''
+
+        if prop_id != cv2.CAP_PROP_POS_FRAMES:
+            return False
+
+        self.frame_idx = int(value)
+        self.start_time = None
+        return True
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+
+def convert_to_frame_log(video_capture, path, fps=None, max_frames=None):
+    '''
+    Writes all frames of a video capture (video file, camera, SyntheticCamera, ...) to a frame log
+
+    Parameters:
+        video_capture (cv2.VideoCapture): opened video capture
+        path (str): path of the frame log file
+        fps (float): frame rate, None = reported by the video capture
+        max_frames (int): max. number of frames, None = until the capture ends
+
+    Returns:
+        frames_written (int)
+    '''
+
+    fps = fps or video_capture.get(cv2.CAP_PROP_FPS) or 30.0
+    writer = None
+    frame_idx = 0
+    while max_frames is None or frame_idx < max_frames:
+        ret, video_frame = video_capture.read()
+        if not ret:
+            break
+
+        if writer is None:
+            height, width = video_frame.shape[0:2]
+            channels = 1 if video_frame.ndim == 2 else video_frame.shape[2]
+            writer = FrameLogWriter(path, width, height, channels, video_frame.dtype, fps)
+
+        # timestamps of the recording, not of the conversion
+        writer.write(video_frame, frame_idx / fps, frame_idx)
+        frame_idx += 1
+
+    if writer is None:
+        return 0
+
+    writer.close()
+    return writer.frames_written
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+
+# processing stages of a frame in the order they are marked
+STAGES = ('capture', 'detect', 'control', 'serial', 'record', 'overlay', 'display')
+
+# number of most recent frames used for the percentiles
+DEFAULT_WINDOW = 1000
+
+PERCENTILES = (50, 95, 99)
+
+# period of the snapshot file updates and of the overlay summary refresh
+SNAPSHOT_PERIOD_IN_SECONDS = 1.0
+SUMMARY_PERIOD_IN_SECONDS = 0.5
+
+# trace events kept for the Chrome trace (about 100 bytes each)
+MAX_TRACE_EVENTS = 1000000
+
+PROMETHEUS_PREFIX = 'dronekiller'
+
+
+class RollingHistogram:
+    '''
+    Ring buffer of the most recent samples with cumulative count and sum
+    '''
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+        self.sum += value
+
+    def get_window(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def get_percentiles(self):
+        '''
+        Returns:
+            percentiles (dict): key = 'p50', 'p95', 'p99', value = percentile of the window
+        '''
+
+        values = np.percentile(self.get_window(), PERCENTILES)
+        return {f'p{p}': float(value) for p, value in zip(PERCENTILES, values)}
+
+
+class FrameProfiler:
+    '''
+    Timestamps the processing stages of every frame and keeps rolling latency histograms
+
+    Usage in the processing loop: start_frame() at the top, mark(stage) after every stage. The duration of a stage is
+    the time since the previous mark, the frame period (and so the FPS) is the time between start_frame() calls.
+    Stages which are skipped for a frame (e.g. display of frames which are not rendered) are just not marked.
+    '''
+
+    def __init__(self, window=DEFAULT_WINDOW, output_path=None, trace_path=None, get_frames_dropped=None,
+                 governor=None):
+        '''
+        Parameters:
+            window (int): number of most recent samples used for the percentiles
+            output_path (str): file the snapshots are periodically written to, Prometheus text format if the
+                extension is .prom, JSON otherwise, None = no snapshots
+            trace_path (str): file the Chrome trace events are written to by close(), None = no tracing
+            get_frames_dropped (function): returns number of frames dropped by the capture
+            governor (FrameGovernor): its quality level and budget misses are included in the stats, None = none
+        '''
+
+        self.window = window
+        self.output_path = output_path
+        self.trace_path = trace_path
+        self.get_frames_dropped = get_frames_dropped
+        self.governor = governor
+
+        self.histograms = {stage: RollingHistogram(window) for stage in STAGES}
+        self.frame_periods = RollingHistogram(window)
+        self.trace_events = []
+
+        self.start_time = time.perf_counter()
+        self.frame_start_time = None
+        self.last_mark_time = None
+        self.frames = 0
+
+        self.last_snapshot_time = self.start_time
+        self.last_summary_time = 0.0
+        self.summary = []
+
+    def start_frame(self):
+        now = time.perf_counter()
+        if self.frame_start_time is not None:
+            self.frame_periods.add(now - self.frame_start_time)
+        self.frame_start_time = self.last_mark_time = now
+        self.frames += 1
+
+        if self.output_path is not None and now - self.last_snapshot_time > SNAPSHOT_PERIOD_IN_SECONDS:
+            self.last_snapshot_time = now
+            self.write_snapshot()
+
+    def mark(self, stage):
+        '''
+        Records the time since the previous mark as the duration of the stage
+        '''
+
+        now = time.perf_counter()
+        self.histograms[stage].add(now - self.last_mark_time)
+        if self.trace_path is not None and len(self.trace_events) < MAX_TRACE_EVENTS:
+            self.trace_events.append((stage, self.last_mark_time, now))
+        self.last_mark_time = now
+
+    def get_fps(self):
+        window = self.frame_periods.get_window()
+        return len(window) / window.sum() if window.sum() > 0 else 0.0
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats (dict): frames, FPS, dropped frames and p50/p95/p99, mean and count of every marked stage in seconds
+                (plus the FrameGovernor stats if there is one)
+        '''
+
+        stats = {
+            'frames': self.frames,
+            'fps': self.get_fps(),
+            'frames_dropped': self.get_frames_dropped() if self.get_frames_dropped is not None else 0,
+            'stages': {},
+        }
+
+        for stage, histogram in list(self.histograms.items()) + [('frame', self.frame_periods)]:
+            if histogram.count == 0:
+                continue
+            stats['stages'][stage] = {
+                **histogram.get_percentiles(),
+                'mean': float(histogram.get_window().mean()),
+                'count': histogram.count,
+                'sum': histogram.sum,
+            }
+
+        if self.governor is not None:
+            stats['governor'] = self.governor.get_stats()
+
+        return stats
+
+    def get_summary(self):
+        '''
+        Returns:
+            summary (list): compact text lines for the overlay, refreshed every SUMMARY_PERIOD_IN_SECONDS
+        '''
+
+        now = time.perf_counter()
+        if now - self.last_summary_time > SUMMARY_PERIOD_IN_SECONDS:
+            self.last_summary_time = now
+            stats = self.get_stats()
+            stages = stats['stages']
+            self.summary = [
+                f'FPS: {stats["fps"]:.1f}, dropped: {stats["frames_dropped"]}, frame p95: '
+                f'{stages.get("frame", {}).get("p95", 0) * 1000:.1f} ms',
+                'p95 ms: ' + ', '.join(f'{stage} {stages[stage]["p95"] * 1000:.1f}' for stage in STAGES
+                                       if stage in stages),
+            ]
+
+        return self.summary
+
+    def log_stats(self):
+        stats = self.get_stats()
+        logging.info(f'Frame timing: {stats["frames"]} frames, {stats["fps"]:.1f} FPS, '
+                     f'{stats["frames_dropped"]} dropped')
+        for stage, stage_stats in stats['stages'].items():
+            logging.info(f'    {stage}: ' + ', '.join(f'p{p} {stage_stats[f"p{p}"] * 1000:.2f} ms' for p in PERCENTILES))
+
+    def format_prometheus(self, stats):
+        '''
+        Returns:
+            text (str): stats in the Prometheus text exposition format
+        '''
+
+        lines = [
+            f'# TYPE {PROMETHEUS_PREFIX}_frames_total counter',
+            f'{PROMETHEUS_PREFIX}_frames_total {stats["frames"]}',
+            f'# TYPE {PROMETHEUS_PREFIX}_frames_dropped_total counter',
+            f'{PROMETHEUS_PREFIX}_frames_dropped_total {stats["frames_dropped"]}',
+            f'# TYPE {PROMETHEUS_PREFIX}_fps gauge',
+            f'{PROMETHEUS_PREFIX}_fps {stats["fps"]:.3f}',
+            f'# TYPE {PROMETHEUS_PREFIX}_stage_latency_seconds summary',
+        ]
+        for stage, stage_stats in stats['stages'].items():
+            labels = f'stage="{stage}"'
+            for p in PERCENTILES:
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_latency_seconds{{{labels},quantile="{p / 100}"}} '
+                             f'{stage_stats[f"p{p}"]:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_latency_seconds_sum{{{labels}}} {stage_stats["sum"]:.6f}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_latency_seconds_count{{{labels}}} {stage_stats["count"]}')
+
+        governor = stats.get('governor')
+        if governor is not None:
+            lines += [
+                f'# TYPE {PROMETHEUS_PREFIX}_quality_level gauge',
+                f'{PROMETHEUS_PREFIX}_quality_level {governor["level"]}',
+                f'# TYPE {PROMETHEUS_PREFIX}_frame_budget_seconds gauge',
+                f'{PROMETHEUS_PREFIX}_frame_budget_seconds {governor["frame_budget"]:.6f}',
+                f'# TYPE {PROMETHEUS_PREFIX}_frame_budget_misses_total counter',
+                f'{PROMETHEUS_PREFIX}_frame_budget_misses_total {governor["budget_misses"]}',
+            ]
+
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path=None):
+        '''
+        Writes the stats to the file (replaced atomically, so it can be scraped at any time)
+
+        Parameters:
+            path (str): output file, Prometheus text format if the extension is .prom, JSON otherwise,
+                None = output_path
+        '''
+
+        path = self.output_path if path is None else path
+        stats = self.get_stats()
+        if path.endswith('.prom'):
+            text = self.format_prometheus(stats)
+        else:
+            text = json.dumps(stats, indent=4)
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as snapshot_file:
+            snapshot_file.write(text)
+        os.replace(temp_path, path)
+
+    def write_trace(self, path):
+        '''
+        Writes the recorded stages as Chrome trace events (chrome://tracing or https://ui.perfetto.dev)
+        '''
+
+        events = [{
+            'name': stage,
+            'ph': 'X',
+            'ts': (start_time - self.start_time) * 1e6,
+            'dur': (end_time - start_time) * 1e6,
+            'pid': os.getpid(),
+            'tid': 0,
+        } for stage, start_time, end_time in self.trace_events]
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        logging.info(f'Wrote {len(events)} trace events to {path}')
+
+    def close(self):
+        '''
+        Writes the final snapshot and the trace
+        '''
+
+        if self.output_path is not None:
+            self.write_snapshot()
+        if self.trace_path is not None:
+            self.write_trace(self.trace_path)
+
+
+class NullProfiler:
+    '''
+    Disabled profiler, all methods are no-ops
+    '''
+
+    def start_frame(self):
+        pass
+
+    def mark(self, stage):
+        pass
+
+    def get_summary(self):
+        return []
+
+    def get_stats(self):
+        return None
+
+    def log_stats(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_profiler(enabled, output_path=None, trace_path=None, get_frames_dropped=None, governor=None):
+    '''
+    Returns:
+        profiler (FrameProfiler): enabled if requested or if any output is requested, otherwise NullProfiler
+    '''
+
+    if not (enabled or output_path or trace_path):
+        return NullProfiler()
+
+    return FrameProfiler(output_path=output_path, trace_path=trace_path, get_frames_dropped=get_frames_dropped,
+                         governor=governor)
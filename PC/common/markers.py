@@ -0,0 +1,214 @@
+import json
+import os
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+
+# frame width used for detection when the detection scale is picked automatically
+AUTO_DETECTION_WIDTH_IN_PIXELS = 640
+
+# sub-pixel corner refinement termination criteria
+CORNER_REFINEMENT_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+# detector parameters tuned by autotune/autotune.py and stored in detector parameter files
+DETECTOR_PARAMETER_NAMES = (
+    'adaptiveThreshWinSizeMin',
+    'adaptiveThreshWinSizeMax',
+    'adaptiveThreshWinSizeStep',
+    'minMarkerPerimeterRate',
+    'maxMarkerPerimeterRate',
+    'polygonalApproxAccuracyRate',
+    'cornerRefinementMethod',
+)
+
+
+def get_marker_center(marker_corners_for_current_id):
+    '''
+    Calculates position of the center of ArUco marker
+
+    Parameters:
+        marker_corners_for_current_id (numpy.ndarray): 4 corners of the marker as returned by detectMarkers()
+
+    Returns:
+        marker_center_x, marker_center_y (int): position of the center of the marker in pixels
+    '''
+
+    marker_center = np.mean(marker_corners_for_current_id.reshape(-1, 2), axis=0)
+    return int(marker_center[0]), int(marker_center[1])
+
+
+def get_detection_scale(frame_width, detection_scale):
+    '''
+    Parameters:
+        frame_width (int): video frame width in pixels
+        detection_scale (float): scale factor in range (0, 1] or 0 to pick it automatically
+
+    Returns:
+        detection_scale (float): scale factor in range (0, 1]
+    '''
+
+    if detection_scale <= 0:
+        return min(1.0, AUTO_DETECTION_WIDTH_IN_PIXELS / frame_width)
+
+    return min(1.0, detection_scale)
+
+
+def get_buffer(buffers, name, shape):
+    '''
+    Returns:
+        buffer (numpy.ndarray): uint8 buffer of the shape kept in buffers (dict) for reuse, None if buffers is None
+    '''
+
+    if buffers is None:
+        return None
+
+    if name not in buffers or buffers[name].shape != shape:
+        buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buffers[name]
+
+
+def detect_markers_downscaled(video_frame, aruco_dictionary, parameters, detection_scale, buffers=None):
+    '''
+    Detects ArUco markers in downscaled grayscale frame and refines the corners on the full resolution frame
+
+    Parameters:
+        video_frame (numpy.ndarray): video frame
+        aruco_dictionary (cv2.aruco.Dictionary): ArUco marker dictionary
+        parameters (cv2.aruco.DetectorParameters): detector parameters
+        detection_scale (float): scale factor in range (0, 1] or 0 to pick it automatically
+        buffers (dict): reused grayscale and downscaled frame buffers, None = allocate them
+
+    Returns:
+        marker_corners, marker_ids (tuple): same as returned by detectMarkers() for the full resolution frame
+    '''
+
+    if video_frame.ndim == 3:
+        gray_frame = cv2.cvtColor(video_frame, cv2.COLOR_BGR2GRAY,
+            dst=get_buffer(buffers, 'gray', video_frame.shape[0:2]))
+    else:
+        gray_frame = video_frame
+
+    scale = get_detection_scale(gray_frame.shape[1], detection_scale)
+    if scale == 1.0:
+        marker_corners, marker_ids, rejected_candidates = aruco.detectMarkers(gray_frame, aruco_dictionary, parameters=parameters)
+        return marker_corners, marker_ids
+
+    small_shape = (round(gray_frame.shape[0] * scale), round(gray_frame.shape[1] * scale))
+    small_frame = cv2.resize(gray_frame, None, dst=get_buffer(buffers, 'small', small_shape), fx=scale, fy=scale,
+        interpolation=cv2.INTER_AREA)
+    marker_corners, marker_ids, rejected_candidates = aruco.detectMarkers(small_frame, aruco_dictionary, parameters=parameters)
+
+    if marker_ids is None:
+        return marker_corners, marker_ids
+
+    # map the corners back to full resolution (pixel centers) and refine them to sub-pixel accuracy
+    corners = (np.concatenate(marker_corners).reshape(-1, 2) + 0.5) / scale - 0.5
+    corners = corners.astype(np.float32)
+    half_window = int(np.ceil(1 / scale)) + 2
+    cv2.cornerSubPix(gray_frame, corners, (half_window, half_window), (-1, -1), CORNER_REFINEMENT_CRITERIA)
+
+    marker_corners = tuple(corners.reshape(-1, 1, 4, 2))
+    return marker_corners, marker_ids
+
+
+def create_detector_parameters(detector_parameters=None):
+    '''
+    Parameters:
+        detector_parameters (dict): key = name of a cv2.aruco.DetectorParameters attribute, value = its value,
+            None = default values
+
+    Returns:
+        parameters (cv2.aruco.DetectorParameters): default parameters with the given values set
+    '''
+
+    parameters = aruco.DetectorParameters_create()
+    for name, value in (detector_parameters or {}).items():
+        setattr(parameters, name, value)
+    return parameters
+
+
+def get_detector_parameters(parameters=None):
+    '''
+    Returns:
+        detector_parameters (dict): key = name, value = value of the tuned parameters (DETECTOR_PARAMETER_NAMES) of
+            the cv2.aruco.DetectorParameters, None = default values
+    '''
+
+    parameters = aruco.DetectorParameters_create() if parameters is None else parameters
+    return {name: getattr(parameters, name) for name in DETECTOR_PARAMETER_NAMES}
+
+
+def save_detector_parameters(path, detector_parameters, stats=None):
+    '''
+    Writes detector parameters as JSON (replaced atomically)
+
+    Parameters:
+        path (str): detector parameter file
+        detector_parameters (dict): key = name, value = value of the parameters
+        stats (dict): how the parameters were found (e.g. recall and detection time)
+    '''
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as parameters_file:
+        json.dump({'parameters': detector_parameters, 'stats': stats or {}}, parameters_file, indent=4)
+    os.replace(temp_path, path)
+
+
+def load_detector_parameters(path):
+    '''
+    Returns:
+        detector_parameters (dict): key = name, value = value of the parameters stored in the file
+    '''
+
+    with open(path) as parameters_file:
+        return json.load(parameters_file)['parameters']
+
+
+def create_detector(detection_scale=1.0, detector_parameters=None):
+    '''
+    Creates ArUco marker detector for DICT_4X4_250 markers
+
+    Parameters:
+        detection_scale (float): scale factor of the frame used for detection in range (0, 1] or 0 to pick it
+            automatically, corners are refined on the full resolution frame if smaller than 1
+        detector_parameters (dict): detector parameters (e.g. from load_detector_parameters()) overriding the
+            defaults, None = default detector parameters
+
+    Returns:
+        detect (function): takes video frame and returns marker_corners, marker_ids as returned by detectMarkers(),
+            detect.set_scale_factor(scale_factor) scales the detection resolution further at runtime (e.g. by
+            FrameGovernor)
+    '''
+
+    # load ArUco marker dictionary
+    aruco_dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+
+    # initialize the detector parameters using default values and the tuned ones
+    parameters = create_detector_parameters(detector_parameters)
+
+    # grayscale and downscaled frames are reused from frame to frame
+    buffers = {}
+
+    # factor applied on top of the detection scale
+    scale_factor = 1.0
+
+    def detect(video_frame):
+        if scale_factor != 1.0:
+            scale = get_detection_scale(video_frame.shape[1], detection_scale) * scale_factor
+            return detect_markers_downscaled(video_frame, aruco_dictionary, parameters, scale, buffers)
+
+        if detection_scale != 1.0:
+            return detect_markers_downscaled(video_frame, aruco_dictionary, parameters, detection_scale, buffers)
+
+        marker_corners, marker_ids, rejected_candidates = aruco.detectMarkers(video_frame, aruco_dictionary, parameters=parameters)
+        return marker_corners, marker_ids
+
+    def set_scale_factor(factor):
+        nonlocal scale_factor
+        scale_factor = factor
+
+    detect.set_scale_factor = set_scale_factor
+    return detect
@@ -0,0 +1,319 @@
+import logging
+import math
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from common.frame_grabber import LatestFrameGrabber
+from common.frame_profiler import RollingHistogram
+from common.markers import get_marker_center
+from common.pipeline import STATS_PERIOD_IN_SECONDS, StageStats
+
+
+# horizontal field of view assumed for uncalibrated cameras
+DEFAULT_HORIZONTAL_FOV_IN_DEGREES = 60.0
+
+# detections older than this are not used for the target selection
+DEFAULT_MAX_DETECTION_AGE_IN_SECONDS = 0.2
+
+
+class CameraGeometry:
+    '''
+    Maps pixel positions of a camera to angles relative to the turret boresight
+
+    Angles come from the camera calibration if there is one, otherwise from a pinhole model with the nominal
+    horizontal field of view. The yaw and pitch offsets are the angles of the camera's optical axis relative to the
+    turret boresight (positive = right and down, as the pixel coordinates).
+    '''
+
+    def __init__(self, width, height, horizontal_fov=DEFAULT_HORIZONTAL_FOV_IN_DEGREES, calibration=None,
+                 yaw_offset=0.0, pitch_offset=0.0):
+        '''
+        Parameters:
+            width, height (int): frame size in pixels
+            horizontal_fov (float): horizontal field of view in degrees, used without calibration
+            calibration (CameraCalibration): camera calibration, None = pinhole model with the field of view
+            yaw_offset, pitch_offset (float): angles of the optical axis relative to the turret boresight in degrees
+        '''
+
+        self.width = int(width)
+        self.height = int(height)
+        self.calibration = calibration
+        self.yaw_offset = yaw_offset
+        self.pitch_offset = pitch_offset
+
+        if calibration is None:
+            self.focal_length = self.width / 2 / math.tan(math.radians(horizontal_fov) / 2)
+            self.principal_point = (self.width / 2, self.height / 2)
+        else:
+            self.focal_length = calibration.focal_length[0]
+            self.principal_point = calibration.principal_point
+
+    @property
+    def degrees_per_pixel(self):
+        # angular resolution at the image center, the narrower the lens the finer it is
+        return math.degrees(math.atan(1 / self.focal_length))
+
+    def get_angles(self, points):
+        '''
+        Parameters:
+            points (numpy.ndarray): pixel positions in the (distorted) frame, shape (N, 2)
+
+        Returns:
+            angles (numpy.ndarray): horizontal and vertical angles relative to the turret boresight in degrees,
+                shape (N, 2)
+        '''
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.calibration is None:
+            angles = np.degrees(np.arctan((points - self.principal_point) / self.focal_length))
+        else:
+            angles = self.calibration.get_angles(self.calibration.undistort_points(points))
+
+        return angles + (self.yaw_offset, self.pitch_offset)
+
+    def get_target_angles(self, marker_corners, marker_ids, target_id):
+        '''
+        Returns:
+            target_angles (list): tuples of horizontal and vertical angles in degrees of the centers of all markers
+                with the target ID
+        '''
+
+        if marker_ids is None:
+            return []
+
+        centers = [get_marker_center(marker_corners[i]) for i, marker_id in enumerate(marker_ids)
+                   if marker_id == target_id]
+        if not centers:
+            return []
+
+        return [(float(angle_x), float(angle_y)) for angle_x, angle_y in self.get_angles(centers)]
+
+
+class TargetFusion:
+    '''
+    Merges the target detections of all cameras into a single target
+
+    The camera with the finest angular resolution which currently sees the target is used, e.g. a wide camera
+    acquires the target and a narrow one takes over for the fine aim as soon as the target is in its view. Of
+    several targets seen by that camera the one closest to the boresight is engaged.
+    '''
+
+    def __init__(self, geometries, max_age=DEFAULT_MAX_DETECTION_AGE_IN_SECONDS):
+        '''
+        Parameters:
+            geometries (dict): key = camera name, value = CameraGeometry
+            max_age (float): max. age of a detection in seconds
+        '''
+
+        self.geometries = geometries
+        self.max_age = max_age
+
+        # key = camera name, value = tuple: capture timestamp, target angles
+        self.detections = {}
+        self.selected_camera = None
+        self.handovers = 0
+        self.selections = {camera_name: 0 for camera_name in geometries}
+
+    def update(self, camera_name, timestamp, target_angles):
+        '''
+        Parameters:
+            camera_name: camera the detection comes from
+            timestamp (float): capture time of the frame (time.monotonic())
+            target_angles (list): target angles as returned by CameraGeometry.get_target_angles()
+        '''
+
+        self.detections[camera_name] = (timestamp, target_angles)
+
+    def select(self, now=None):
+        '''
+        Returns:
+            selection (tuple): camera name, target angles (tuple) and capture timestamp of the detection or None if
+                no camera sees the target
+        '''
+
+        now = time.monotonic() if now is None else now
+        cameras = [camera_name for camera_name, (timestamp, target_angles) in self.detections.items()
+                   if target_angles and now - timestamp <= self.max_age]
+        if not cameras:
+            return None
+
+        camera_name = min(cameras, key=lambda camera_name: self.geometries[camera_name].degrees_per_pixel)
+        timestamp, target_angles = self.detections[camera_name]
+        target = min(target_angles, key=lambda angles: math.hypot(*angles))
+
+        if camera_name != self.selected_camera:
+            if self.selected_camera is not None:
+                logging.debug(f'Target handed over from camera {self.selected_camera} to camera {camera_name}')
+                self.handovers += 1
+            self.selected_camera = camera_name
+        self.selections[camera_name] += 1
+
+        return camera_name, target, timestamp
+
+
+def camera_worker(camera_name, capture_factory, detector_factory, geometry, target_id, threaded, detection_queue,
+                  stats, stop_event):
+    '''
+    Captures frames of a single camera, detects markers and sends the target angles to the fusion
+    '''
+
+    video_capture = LatestFrameGrabber(capture_factory(), threaded=threaded).start()
+    detect = detector_factory()
+    seq = 0
+
+    while not stop_event.is_set():
+        ret, video_frame = video_capture.read()
+        if not ret:
+            logging.error(f'No video frame received from camera {camera_name}. Camera worker stopped.')
+            break
+
+        marker_corners, marker_ids = detect(video_frame)
+        target_angles = geometry.get_target_angles(marker_corners, marker_ids, target_id)
+        detection_queue.put((camera_name, seq, video_capture.last_frame_timestamp, target_angles))
+        stats.count_processed()
+        stats.dropped.value = video_capture.frames_dropped
+        seq += 1
+
+    video_capture.release()
+    # detections not consumed by the fusion are discarded on exit
+    detection_queue.cancel_join_thread()
+
+
+def run_multi_camera(cameras, detector_factory, calculate, desired_time, send_control=None, target_id=0,
+                     threaded_capture=True, max_age=DEFAULT_MAX_DETECTION_AGE_IN_SECONDS):
+    '''
+    Streams several cameras at once, each in its own capture and detection process, and fuses their detections into
+    a single target. The control is calculated and sent by this process only, so the commands form a single ordered
+    stream. The fused target is always the one closest to the boresight (see TargetFusion) and the control acts on its
+    observed angles, motion prediction and target policies do not apply.
+
+    All factories are called inside the camera processes and therefore have to be picklable (module-level functions
+    or functools.partial of module-level functions).
+
+    Parameters:
+        cameras (dict): key = camera name, value = tuple: capture factory (returns opened video capture),
+            CameraGeometry
+        detector_factory (function): returns function taking video frame and returning marker_corners, marker_ids
+        calculate (function): takes the target angles (tuple) in degrees and returns control (dict)
+        desired_time (float): time of operation in seconds
+        send_control (function): control sink, called with the control (dict) of every new fused target, None = no
+            sink
+        target_id (int): marker ID of the target
+        threaded_capture (bool): read frames in a background thread of the camera process (always newest frame)
+        max_age (float): max. age of a detection used for the target selection in seconds
+
+    Returns:
+        stats (dict): key = camera name, value = dict with number of processed and dropped frames and FPS, and
+            key 'fusion', value = dict with number of commands, handovers, selections per camera and the fusion
+            latency percentiles in seconds (frame capture to command)
+    '''
+
+    fusion = TargetFusion({camera_name: geometry for camera_name, (capture_factory, geometry) in cameras.items()},
+                          max_age)
+    detection_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    stats = {camera_name: StageStats() for camera_name in cameras}
+
+    processes = [
+        multiprocessing.Process(target=camera_worker, name=f'camera {camera_name}',
+            args=(camera_name, capture_factory, detector_factory, geometry, target_id, threaded_capture,
+                  detection_queue, stats[camera_name], stop_event))
+        for camera_name, (capture_factory, geometry) in cameras.items()
+    ]
+
+    logging.info(f'Starting {len(processes)} camera workers for {desired_time} seconds...')
+    for process in processes:
+        process.start()
+
+    fusion_latency = RollingHistogram()
+    last_sent_timestamp = None
+    commands = 0
+
+    start_time = time.monotonic()
+    last_stats_time = start_time
+    last_processed = {camera_name: 0 for camera_name in cameras}
+
+    while True:
+        current_time = time.monotonic()
+        if current_time - start_time >= desired_time:
+            break
+
+        if current_time - last_stats_time >= STATS_PERIOD_IN_SECONDS:
+            # report per-camera throughput and fusion latency
+            period = current_time - last_stats_time
+            throughput = []
+            for camera_name in cameras:
+                processed = stats[camera_name].processed.value
+                throughput.append(f'camera {camera_name}: {(processed - last_processed[camera_name]) / period:.1f} FPS')
+                last_processed[camera_name] = processed
+            latency = fusion_latency.get_percentiles() if fusion_latency.count > 0 else {'p50': 0.0, 'p95': 0.0}
+            logging.info(f'Multi-camera throughput - {", ".join(throughput)}; fusion latency p50: '
+                         f'{latency["p50"] * 1000:.1f} ms, p95: {latency["p95"] * 1000:.1f} ms; '
+                         f'target camera: {fusion.selected_camera}')
+            last_stats_time = current_time
+
+        try:
+            detection = detection_queue.get(timeout=0.1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                logging.error('All camera workers stopped.')
+                break
+            continue
+
+        # fuse the newest detection of every camera
+        while detection is not None:
+            camera_name, seq, timestamp, target_angles = detection
+            fusion.update(camera_name, timestamp, target_angles)
+            try:
+                detection = detection_queue.get_nowait()
+            except queue.Empty:
+                detection = None
+
+        selection = fusion.select()
+        if selection is None:
+            continue
+
+        camera_name, target, timestamp = selection
+        if timestamp == last_sent_timestamp:
+            # the detection of the target camera was already acted on
+            continue
+
+        control = calculate(target)
+        control['camera'] = camera_name
+        if send_control is not None:
+            send_control(control)
+        last_sent_timestamp = timestamp
+        commands += 1
+        fusion_latency.add(time.monotonic() - timestamp)
+
+    stop_event.set()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            logging.warning(f'Camera worker {process.name} did not stop in time. Terminating.')
+            process.terminate()
+            process.join()
+
+    elapsed_time = time.monotonic() - start_time
+
+    result = {}
+    for camera_name in cameras:
+        result[camera_name] = {
+            'processed': stats[camera_name].processed.value,
+            'dropped': stats[camera_name].dropped.value,
+            'fps': stats[camera_name].processed.value / elapsed_time,
+        }
+        logging.info(f'Camera {camera_name}: {result[camera_name]}')
+
+    result['fusion'] = {
+        'commands': commands,
+        'handovers': fusion.handovers,
+        'selections': fusion.selections,
+        'latency': fusion_latency.get_percentiles() if fusion_latency.count > 0 else None,
+    }
+    logging.info(f'Target fusion: {result["fusion"]}')
+
+    return result
@@ -0,0 +1,260 @@
+import logging
+
+import numpy as np
+
+
+TARGET_POLICIES = ('boresight', 'size', 'first_seen')
+
+ASSIGNMENT_METHODS = ('greedy', 'hungarian')
+
+# max. distance in pixels between predicted track position and detection to be associated
+DEFAULT_GATE_IN_PIXELS = 100.0
+
+# number of consecutive frames a track survives without detection
+DEFAULT_MAX_MISSED_FRAMES = 10
+
+# weight of the newest displacement in the track velocity estimate
+VELOCITY_SMOOTHING = 0.5
+
+# a visible engaged target is replaced only if another one is better by more than this margin (pixels of boresight
+# distance or of marker size), so that the turret does not jump between similar targets
+SWITCH_MARGINS = {'boresight': 20.0, 'size': 5.0, 'first_seen': 0.0}
+
+
+class Track:
+    '''
+    Single target with a persistent ID
+    '''
+
+    def __init__(self, track_id, center, size, timestamp):
+        self.track_id = track_id
+        self.center = center
+        self.size = size
+        self.velocity = np.zeros(2)
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.missed = 0
+
+    def predict(self, timestamp):
+        '''
+        Returns:
+            center (numpy.ndarray): expected position of the target at the timestamp
+        '''
+
+        return self.center + self.velocity * (timestamp - self.last_seen)
+
+    def update(self, center, size, timestamp):
+        dt = timestamp - self.last_seen
+        if dt > 0:
+            self.velocity += VELOCITY_SMOOTHING * ((center - self.center) / dt - self.velocity)
+        self.center = center
+        self.size = size
+        self.last_seen = timestamp
+        self.hits += 1
+        self.missed = 0
+
+
+def get_centers_and_sizes(marker_corners):
+    '''
+    Parameters:
+        marker_corners (list): marker corners as returned by detectMarkers()
+
+    Returns:
+        centers (numpy.ndarray): marker centers in pixels, shape (N, 2)
+        sizes (numpy.ndarray): square roots of the marker areas in pixels, shape (N,)
+    '''
+
+    if len(marker_corners) == 0:
+        return np.zeros((0, 2)), np.zeros(0)
+
+    corners = np.asarray(marker_corners, dtype=np.float64).reshape(-1, 4, 2)
+    centers = corners.mean(axis=1)
+
+    # shoelace formula
+    x, y = corners[:, :, 0], corners[:, :, 1]
+    areas = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+    return centers, np.sqrt(areas)
+
+
+def assign_greedy(distances, gate):
+    '''
+    Associates tracks (rows) with detections (columns) starting with the closest pair
+
+    Returns:
+        pairs (list): track index, detection index tuples
+    '''
+
+    pairs = []
+    track_used = np.zeros(distances.shape[0], dtype=bool)
+    detection_used = np.zeros(distances.shape[1], dtype=bool)
+    max_pairs = min(distances.shape)
+
+    for flat_idx in np.argsort(distances, axis=None):
+        if len(pairs) == max_pairs:
+            break
+        track_idx, detection_idx = divmod(int(flat_idx), distances.shape[1])
+        if distances[track_idx, detection_idx] > gate:
+            break
+        if track_used[track_idx] or detection_used[detection_idx]:
+            continue
+        track_used[track_idx] = detection_used[detection_idx] = True
+        pairs.append((track_idx, detection_idx))
+
+    return pairs
+
+
+def assign_hungarian(distances, gate):
+    '''
+    Associates tracks (rows) with detections (columns) minimizing the total distance
+
+    Returns:
+        pairs (list): track index, detection index tuples
+    '''
+
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        logging.error('Hungarian assignment requires scipy. Use greedy assignment instead.')
+        raise
+
+    # pairs outside of the gate must never be preferred over leaving a track or detection unassigned
+    costs = np.where(distances > gate, gate * (1 + distances.size), distances)
+    track_idxs, detection_idxs = linear_sum_assignment(costs)
+    return [(int(t), int(d)) for t, d in zip(track_idxs, detection_idxs) if distances[t, d] <= gate]
+
+
+class MultiTargetTracker:
+    '''
+    Tracks all foe markers with persistent track IDs and picks the single target to engage
+
+    Detections are associated with the tracks by their distance to the predicted track positions, either greedily
+    (closest pairs first) or optimally (Hungarian method, requires scipy). The engaged target is kept while it is
+    visible unless another target is better by the policy's switch margin:
+
+    - 'boresight': closest to the frame center
+    - 'size': largest apparent size (closest to the camera)
+    - 'first_seen': tracked for the longest time
+    '''
+
+    def __init__(self, policy='boresight', frame_center=(0, 0), gate=DEFAULT_GATE_IN_PIXELS,
+                 max_missed=DEFAULT_MAX_MISSED_FRAMES, assignment='greedy'):
+        '''
+        Parameters:
+            policy (str): one of TARGET_POLICIES
+            frame_center (tuple): position of the camera's image frame center in pixels
+            gate (float): max. association distance in pixels
+            max_missed (int): number of consecutive frames a track survives without detection
+            assignment (str): one of ASSIGNMENT_METHODS
+        '''
+
+        assert policy in TARGET_POLICIES, f'Unknown target policy {policy}'
+        assert assignment in ASSIGNMENT_METHODS, f'Unknown assignment method {assignment}'
+
+        self.policy = policy
+        self.frame_center = np.asarray(frame_center, dtype=np.float64)
+        self.gate = gate
+        self.max_missed = max_missed
+        self.assign = assign_greedy if assignment == 'greedy' else assign_hungarian
+
+        self.tracks = []
+        self.next_track_id = 0
+        self.target_id = None
+
+        self.tracks_created = 0
+        self.target_switches = 0
+
+    def _get_priorities(self, tracks):
+        '''
+        Returns:
+            priorities (numpy.ndarray): higher is better
+        '''
+
+        if self.policy == 'boresight':
+            centers = np.array([track.center for track in tracks])
+            return -np.linalg.norm(centers - self.frame_center, axis=1)
+        if self.policy == 'size':
+            return np.array([track.size for track in tracks])
+        return -np.array([track.first_seen for track in tracks])
+
+    def update(self, marker_corners, timestamp):
+        '''
+        Updates the tracks with the foe markers of a frame and selects the target
+
+        Parameters:
+            marker_corners (list): corners of the foe markers as returned by detectMarkers()
+            timestamp (float): time of the frame in seconds
+
+        Returns:
+            target (Track): engaged target if it is visible in this frame, otherwise None
+        '''
+
+        centers, sizes = get_centers_and_sizes(marker_corners)
+
+        pairs = []
+        if self.tracks and len(centers):
+            predicted = np.array([track.predict(timestamp) for track in self.tracks])
+            distances = np.linalg.norm(predicted[:, None, :] - centers[None, :, :], axis=2)
+            pairs = self.assign(distances, self.gate)
+
+        detection_assigned = np.zeros(len(centers), dtype=bool)
+        track_assigned = np.zeros(len(self.tracks), dtype=bool)
+        for track_idx, detection_idx in pairs:
+            self.tracks[track_idx].update(centers[detection_idx], sizes[detection_idx], timestamp)
+            track_assigned[track_idx] = detection_assigned[detection_idx] = True
+
+        for track_idx in np.flatnonzero(~track_assigned):
+            self.tracks[track_idx].missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for detection_idx in np.flatnonzero(~detection_assigned):
+            self.tracks.append(Track(self.next_track_id, centers[detection_idx], sizes[detection_idx], timestamp))
+            self.next_track_id += 1
+            self.tracks_created += 1
+
+        return self._select_target()
+
+    def _select_target(self):
+        visible = [track for track in self.tracks if track.missed == 0]
+
+        # engaged target which is only missing in this frame stays engaged (control coasts on its prediction)
+        if any(track.track_id == self.target_id and track.missed > 0 for track in self.tracks):
+            return None
+
+        if not visible:
+            return None
+
+        priorities = self._get_priorities(visible)
+        best_idx = int(np.argmax(priorities))
+
+        for idx, track in enumerate(visible):
+            if track.track_id == self.target_id:
+                if priorities[best_idx] <= priorities[idx] + SWITCH_MARGINS[self.policy]:
+                    return track
+                break
+
+        # engaged target is lost or a better one is available
+        if self.target_id is not None:
+            self.target_switches += 1
+        self.target_id = visible[best_idx].track_id
+        return visible[best_idx]
+
+    def get_target_markers(self, marker_corners, timestamp):
+        '''
+        Returns:
+            foe_markers (dict): key = track ID, value = center of the engaged target in pixels (empty if there is none)
+        '''
+
+        target = self.update(marker_corners, timestamp)
+        if target is None:
+            return {}
+
+        return {target.track_id: (int(target.center[0]), int(target.center[1]))}
+
+    def get_stats(self):
+        return {
+            'tracks': len(self.tracks),
+            'tracks_created': self.tracks_created,
+            'target_switches': self.target_switches,
+            'target_id': self.target_id,
+        }
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+
+class OverlayAsset:
+    '''
+    AR image to be composited onto ArUco markers together with its precomputed mask and corners
+    '''
+
+    def __init__(self, img, corners, mask=None):
+        '''
+        Parameters:
+            img (numpy.ndarray): AR image as returned by load_ar_image()
+            corners (numpy.ndarray): 4 corners of the AR image as returned by load_ar_image()
+            mask (numpy.ndarray): precomputed mask (e.g. from an asset bundle), None = compute from the image
+        '''
+
+        self.img = img
+        self.corners = np.asarray(corners, dtype=np.float32)
+
+        # only non-black pixels of the AR image are drawn
+        self.mask = np.any(img > 0, axis=2).astype(np.uint8) * 255 if mask is None else mask
+
+
+class OverlayBuffers:
+    '''
+    Preallocated scratch buffers for composite_overlay(), so that warping AR images allocates no new arrays
+
+    The buffers have the size of the frame, the bounding box of a marker clipped to the frame always fits into them.
+    '''
+
+    def __init__(self, frame_shape):
+        '''
+        Parameters:
+            frame_shape (tuple): shape of the frames drawn on
+        '''
+
+        self.image = np.empty(frame_shape, dtype=np.uint8)
+        self.mask = np.empty(frame_shape[0:2], dtype=np.uint8)
+
+
+def get_bounding_box(points, frame_shape):
+    '''
+    Calculates bounding box of the points clipped to the frame
+
+    Returns:
+        x0, y0, x1, y1 (int): bounding box, empty if x1 <= x0 or y1 <= y0
+    '''
+
+    x0, y0 = np.floor(points.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(points.max(axis=0)).astype(int) + 1
+
+    return max(int(x0), 0), max(int(y0), 0), min(int(x1), frame_shape[1]), min(int(y1), frame_shape[0])
+
+
+def composite_overlay(display_frame, asset, marker_corners_for_current_id, buffers=None):
+    '''
+    Warps the AR image onto the ArUco marker in place
+
+    Only the bounding box of the marker is warped and blended, so the cost depends on the marker area and not on the
+    frame size.
+
+    Parameters:
+        display_frame (numpy.ndarray): frame to draw on, modified in place
+        asset (OverlayAsset): AR image to warp
+        marker_corners_for_current_id (numpy.ndarray): 4 corners of the marker, shape (4, 2)
+        buffers (OverlayBuffers): scratch buffers the AR image and its mask are warped into, None = allocate them
+
+    Returns:
+        display_frame (numpy.ndarray)
+    '''
+
+    marker_corners_for_current_id = np.asarray(marker_corners_for_current_id, dtype=np.float32).reshape(4, 2)
+    x0, y0, x1, y1 = get_bounding_box(marker_corners_for_current_id, display_frame.shape)
+    if x1 <= x0 or y1 <= y0:
+        # marker is completely outside of the frame
+        return display_frame
+
+    # direct 4-point transform from the AR image to the marker's bounding box
+    roi_corners = (marker_corners_for_current_id - np.array([x0, y0], dtype=np.float32)).astype(np.float32)
+    transform_matrix = cv2.getPerspectiveTransform(asset.corners, roi_corners)
+
+    roi_size = (x1 - x0, y1 - y0)
+    if buffers is None:
+        warped_image = cv2.warpPerspective(asset.img, transform_matrix, roi_size)
+        warped_mask = cv2.warpPerspective(asset.mask, transform_matrix, roi_size, flags=cv2.INTER_NEAREST)
+    else:
+        warped_image = cv2.warpPerspective(asset.img, transform_matrix, roi_size, dst=buffers.image[y0:y1, x0:x1])
+        warped_mask = cv2.warpPerspective(asset.mask, transform_matrix, roi_size, dst=buffers.mask[y0:y1, x0:x1],
+            flags=cv2.INTER_NEAREST)
+
+    # replace original pixels of the video frame with pixels from warped image where the AR image is drawn
+    roi = display_frame[y0:y1, x0:x1]
+    cv2.copyTo(warped_image, warped_mask, roi)
+
+    return display_frame
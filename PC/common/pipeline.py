@@ -0,0 +1,357 @@
+import logging
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from common.markers import create_detector
+
+
+# how often the pipeline statistics are logged in seconds
+STATS_PERIOD_IN_SECONDS = 1.0
+
+PIPELINE_STAGES = ('capture', 'detect', 'control', 'render')
+
+
+class SharedFrameSlots:
+    '''
+    Fixed number of video frame slots in shared memory
+
+    Frames are written into a slot by the capture stage and read in place by the other stages. Only the slot index
+    is passed between the processes, so frames are never pickled.
+    '''
+
+    def __init__(self, frame_shape, num_slots, name=None):
+        '''
+        Parameters:
+            frame_shape (tuple): height, width, channels of a video frame
+            num_slots (int): number of frame slots
+            name (str): name of existing shared memory block to attach to, or None to create a new one
+        '''
+
+        self.frame_shape = tuple(frame_shape)
+        self.num_slots = num_slots
+        self.owner = name is None
+
+        size = num_slots * int(np.prod(self.frame_shape))
+        if self.owner:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+
+        self.frames = np.ndarray((num_slots,) + self.frame_shape, dtype=np.uint8, buffer=self.shared_memory.buf)
+
+    def describe(self):
+        '''
+        Returns:
+            description (tuple): arguments needed to attach to the slots from another process
+        '''
+
+        return self.frame_shape, self.num_slots, self.shared_memory.name
+
+    @classmethod
+    def attach(cls, description):
+        frame_shape, num_slots, name = description
+        return cls(frame_shape, num_slots, name=name)
+
+    def close(self):
+        # release the numpy view before closing the shared memory block
+        self.frames = None
+        self.shared_memory.close()
+        if self.owner:
+            self.shared_memory.unlink()
+
+
+class StageStats:
+    '''
+    Per-stage counters shared between the stage process and the supervisor
+    '''
+
+    def __init__(self):
+        self.processed = multiprocessing.Value('Q', 0)
+        self.dropped = multiprocessing.Value('Q', 0)
+
+    def count_processed(self):
+        with self.processed.get_lock():
+            self.processed.value += 1
+
+    def count_dropped(self):
+        with self.dropped.get_lock():
+            self.dropped.value += 1
+
+
+def get_newest(input_queue, timeout):
+    '''
+    Gets the newest item from the queue, discarding all older ones
+
+    Returns:
+        item, number of discarded items (tuple) or None, 0 if no item arrived within timeout
+    '''
+
+    try:
+        item = input_queue.get(timeout=timeout)
+    except queue.Empty:
+        return None, 0
+
+    discarded = 0
+    while True:
+        try:
+            item = input_queue.get_nowait()
+            discarded += 1
+        except queue.Empty:
+            return item, discarded
+
+
+def capture_stage(capture_factory, slots_description, free_slots, detect_queue, stats, stop_event):
+    '''
+    Reads frames from the video capture into free shared memory slots
+    '''
+
+    slots = SharedFrameSlots.attach(slots_description)
+    video_capture = capture_factory()
+    seq = 0
+
+    while not stop_event.is_set():
+        ret, video_frame = video_capture.read()
+        timestamp = time.monotonic()
+        if not ret:
+            logging.error('No video frame received. Capture stage stopped.')
+            break
+
+        try:
+            slot = free_slots.get_nowait()
+        except queue.Empty:
+            # all slots are in use by slower stages - drop the frame
+            stats.count_dropped()
+            continue
+
+        if video_frame.shape != slots.frame_shape:
+            logging.error(f'Unexpected video frame shape {video_frame.shape}, expected {slots.frame_shape}')
+            free_slots.put(slot)
+            stats.count_dropped()
+            continue
+
+        slots.frames[slot][...] = video_frame
+        detect_queue.put((slot, seq, timestamp))
+        stats.count_processed()
+        seq += 1
+
+    video_capture.release()
+    slots.close()
+    # wake up the downstream stages
+    stop_event.set()
+
+
+def detect_stage(detector_factory, slots_description, free_slots, detect_queue, control_queue, render_queue,
+                 stats, stop_event):
+    '''
+    Detects ArUco markers in shared memory slots and passes the detections on to the control and render stages
+
+    The control stage gets every detection. The render stage gets the frame slot only if it is keeping up, so that
+    detection (and thus control) never waits on rendering. Without render stage (render_queue is None) the slot
+    is returned to the pool of free slots right away.
+    '''
+
+    slots = SharedFrameSlots.attach(slots_description)
+    detect = detector_factory()
+
+    while not stop_event.is_set():
+        try:
+            slot, seq, timestamp = detect_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        marker_corners, marker_ids = detect(slots.frames[slot])
+        control_queue.put((seq, timestamp, marker_corners, marker_ids))
+
+        if render_queue is None:
+            free_slots.put(slot)
+            stats.count_processed()
+            continue
+
+        try:
+            render_queue.put_nowait((slot, seq, timestamp, marker_corners, marker_ids))
+        except queue.Full:
+            # renderer is lagging behind - skip rendering of this frame
+            free_slots.put(slot)
+            stats.count_dropped()
+
+        stats.count_processed()
+
+    slots.close()
+
+
+def control_stage(controller_factory, control_queue, control_output_queue, stats, stop_event):
+    '''
+    Calculates and sends motor commands for the newest detection, stale detections are discarded
+    '''
+
+    control = controller_factory()
+
+    while not stop_event.is_set():
+        detection, discarded = get_newest(control_queue, timeout=0.1)
+        for i in range(discarded):
+            stats.count_dropped()
+        if detection is None:
+            continue
+
+        seq, timestamp, marker_corners, marker_ids = detection
+        control_output = control(marker_corners, marker_ids, timestamp)
+
+        # hand the control output to the renderer without ever waiting for it
+        try:
+            control_output_queue.put_nowait(control_output)
+        except queue.Full:
+            pass
+
+        stats.count_processed()
+
+    # release resources owned by the controller (e.g. the serial port)
+    if hasattr(control, 'close'):
+        control.close()
+
+
+def render_stage(renderer_factory, slots_description, free_slots, render_queue, control_output_queue, stats,
+                 stop_event):
+    '''
+    Renders frames from shared memory slots and returns the slots to the pool of free slots
+    '''
+
+    slots = SharedFrameSlots.attach(slots_description)
+    render = renderer_factory()
+    control_output = None
+
+    while not stop_event.is_set():
+        try:
+            slot, seq, timestamp, marker_corners, marker_ids = render_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        newest_control_output, discarded = get_newest(control_output_queue, timeout=0)
+        if newest_control_output is not None:
+            control_output = newest_control_output
+
+        render(slots.frames[slot], marker_corners, marker_ids, control_output)
+        free_slots.put(slot)
+        stats.count_processed()
+
+    slots.close()
+
+
+def get_queue_depth(q):
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        # not supported on macOS
+        return -1
+
+
+def run_pipeline(capture_factory, controller_factory, renderer_factory, frame_shape, desired_time,
+                 detector_factory=create_detector, num_slots=4):
+    '''
+    Runs capture, detect, control and render stages in separate processes for the desired time
+
+    All factories are called inside the stage process and therefore have to be picklable (module-level functions
+    or functools.partial of module-level functions).
+
+    Parameters:
+        capture_factory (function): returns opened video capture
+        controller_factory (function): returns function taking marker_corners, marker_ids, frame capture timestamp
+            and returning control output (e.g. errors and motor speeds) which is passed on to the renderer, its
+            optional close attribute is called when the control stage stops
+        renderer_factory (function): returns function taking video frame, marker_corners, marker_ids and
+            the newest control output or None to run without render stage (headless)
+        frame_shape (tuple): height, width, channels of a video frame
+        desired_time (float): time of operation in seconds
+        detector_factory (function): returns function taking video frame and returning marker_corners, marker_ids
+        num_slots (int): number of shared memory frame slots
+
+    Returns:
+        stats (dict): key = stage name, value = dict with number of processed and dropped items and throughput
+    '''
+
+    slots = SharedFrameSlots(frame_shape, num_slots)
+
+    free_slots = multiprocessing.Queue()
+    for slot in range(num_slots):
+        free_slots.put(slot)
+    detect_queue = multiprocessing.Queue(num_slots)
+    control_queue = multiprocessing.Queue()
+    # render queue is smaller than the number of slots so that the capture stage always has a free slot to write to
+    render_queue = multiprocessing.Queue(max(1, num_slots - 2)) if renderer_factory is not None else None
+    control_output_queue = multiprocessing.Queue(1)
+    stop_event = multiprocessing.Event()
+
+    stages = PIPELINE_STAGES if renderer_factory is not None else PIPELINE_STAGES[:-1]
+    stats = {stage: StageStats() for stage in stages}
+    queues = {
+        'free_slots': free_slots,
+        'detect': detect_queue,
+        'control': control_queue,
+    }
+    if render_queue is not None:
+        queues['render'] = render_queue
+
+    slots_description = slots.describe()
+    processes = [
+        multiprocessing.Process(target=capture_stage, name='capture',
+            args=(capture_factory, slots_description, free_slots, detect_queue, stats['capture'], stop_event)),
+        multiprocessing.Process(target=detect_stage, name='detect',
+            args=(detector_factory, slots_description, free_slots, detect_queue, control_queue, render_queue,
+                  stats['detect'], stop_event)),
+        multiprocessing.Process(target=control_stage, name='control',
+            args=(controller_factory, control_queue, control_output_queue, stats['control'], stop_event)),
+    ]
+    if renderer_factory is not None:
+        processes.append(multiprocessing.Process(target=render_stage, name='render',
+            args=(renderer_factory, slots_description, free_slots, render_queue, control_output_queue,
+                  stats['render'], stop_event)))
+
+    logging.info(f'Starting pipeline with {num_slots} shared memory slots for {desired_time} seconds...')
+    for process in processes:
+        process.start()
+
+    start_time = time.monotonic()
+    last_stats_time = start_time
+    last_processed = {stage: 0 for stage in stages}
+
+    while not stop_event.is_set():
+        time.sleep(min(STATS_PERIOD_IN_SECONDS, max(0.0, desired_time - (time.monotonic() - start_time))))
+        current_time = time.monotonic()
+        if current_time - start_time >= desired_time:
+            break
+
+        # report per-stage throughput and queue depth
+        period = current_time - last_stats_time
+        throughput = []
+        for stage in stages:
+            processed = stats[stage].processed.value
+            throughput.append(f'{stage}: {(processed - last_processed[stage]) / period:.1f} FPS')
+            last_processed[stage] = processed
+        depths = [f'{name}: {get_queue_depth(q)}' for name, q in queues.items()]
+        logging.info(f'Pipeline throughput - {", ".join(throughput)}; queue depth - {", ".join(depths)}')
+        last_stats_time = current_time
+
+    stop_event.set()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            logging.warning(f'Pipeline stage {process.name} did not stop in time. Terminating.')
+            process.terminate()
+            process.join()
+
+    elapsed_time = time.monotonic() - start_time
+    slots.close()
+
+    result = {}
+    for stage in stages:
+        result[stage] = {
+            'processed': stats[stage].processed.value,
+            'dropped': stats[stage].dropped.value,
+            'fps': stats[stage].processed.value / elapsed_time,
+        }
+        logging.info(f'Pipeline stage {stage}: {result[stage]}')
+
+    return result
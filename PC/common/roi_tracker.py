@@ -0,0 +1,222 @@
+import logging
+import time
+
+import numpy as np
+
+from common.markers import create_detector
+
+
+# half size of the search window in marker sizes, on top of half of the marker itself
+ROI_MARGIN_IN_MARKER_SIZES = 1.0
+
+# number of frames of target motion added to the half size of the search window
+ROI_SPEED_GAIN_IN_FRAMES = 3.0
+
+# full frame scan is done every N frames even if the target is tracked
+ROI_REFRESH_PERIOD_IN_FRAMES = 30
+
+# smoothing factor of the target velocity estimate
+VELOCITY_SMOOTHING = 0.5
+
+
+class RoiTracker:
+    '''
+    Runs marker detection only in a window around the last position of the locked targets
+
+    All visible markers with the target ID are locked at once, the window covers their bounding box (so the target
+    tracker still sees every foe and keeps engaging the same one), is centered at its predicted position and grows
+    with the estimated speed. A full frame scan is done when no target is locked, when fewer targets than locked
+    are found inside the window and periodically every refresh_period frames. Markers outside of the window are not
+    reported while the targets are tracked.
+    '''
+
+    def __init__(self, detect, target_id, margin=ROI_MARGIN_IN_MARKER_SIZES, speed_gain=ROI_SPEED_GAIN_IN_FRAMES,
+                 refresh_period=ROI_REFRESH_PERIOD_IN_FRAMES):
+        '''
+        Parameters:
+            detect (function): takes video frame and returns marker_corners, marker_ids
+            target_id (int): ArUco marker ID of the target
+            margin (float): half size of the search window in marker sizes, on top of half of the marker itself
+            speed_gain (float): number of frames of target motion added to the half size of the search window
+            refresh_period (int): full frame scan is done every refresh_period frames
+        '''
+
+        self.detect_markers = detect
+        self.target_id = target_id
+        self.margin = margin
+        self.speed_gain = speed_gain
+        self.refresh_period = refresh_period
+
+        # locked target state: center and half extent of the bounding box of the targets, size of the largest one
+        self.target_center = None
+        self.target_extent = None
+        self.target_size = None
+        self.target_count = 0
+        self.target_velocity = np.zeros(2)
+        self.frames_since_refresh = 0
+
+        self.frames = 0
+        self.roi_scans = 0
+        self.roi_hits = 0
+        self.full_scans = 0
+        self.full_scan_time = 0.0
+        self.detect_time = 0.0
+
+    def get_search_window(self, frame_shape):
+        '''
+        Returns:
+            x0, y0, x1, y1 (int): search window around the predicted target position clipped to the frame
+        '''
+
+        predicted_center = self.target_center + self.target_velocity
+        half_size = self.target_extent + self.target_size * self.margin + \
+            self.speed_gain * np.linalg.norm(self.target_velocity)
+
+        x0, y0 = (predicted_center - half_size).astype(int)
+        x1, y1 = (predicted_center + half_size).astype(int)
+
+        return max(x0, 0), max(y0, 0), min(x1, frame_shape[1]), min(y1, frame_shape[0])
+
+    def find_target(self, marker_corners, marker_ids):
+        '''
+        Returns:
+            target_corners (list): corners (numpy.ndarray, shape (4, 2)) of every target marker, empty if there is none
+        '''
+
+        if marker_ids is None:
+            return []
+
+        return [marker_corners[i].reshape(-1, 2) for i, marker_id in enumerate(marker_ids)
+                if marker_id[0] == self.target_id]
+
+    def update_target(self, target_corners):
+        if not target_corners:
+            # targets lost
+            self.target_center = None
+            self.target_count = 0
+            self.target_velocity = np.zeros(2)
+            return
+
+        corners = np.concatenate(target_corners)
+        target_size = max(np.max(np.ptp(marker_corners, axis=0)) for marker_corners in target_corners)
+        target_center = (corners.min(axis=0) + corners.max(axis=0)).astype(float) / 2
+        if self.target_center is not None and len(target_corners) == self.target_count:
+            velocity = target_center - self.target_center
+            self.target_velocity = VELOCITY_SMOOTHING * velocity + (1 - VELOCITY_SMOOTHING) * self.target_velocity
+
+        self.target_center = target_center
+        self.target_extent = np.maximum(np.ptp(corners, axis=0), target_size).astype(float) / 2
+        self.target_size = target_size
+        self.target_count = len(target_corners)
+
+    def scan_window(self, video_frame):
+        '''
+        Returns:
+            marker_corners, marker_ids detected inside the search window in full frame coordinates or None, None
+            if not all locked targets are inside the window
+        '''
+
+        x0, y0, x1, y1 = self.get_search_window(video_frame.shape)
+        if x1 <= x0 or y1 <= y0:
+            return None, None
+
+        marker_corners, marker_ids = self.detect_markers(video_frame[y0:y1, x0:x1])
+
+        offset = np.array([x0, y0], dtype=np.float32)
+        marker_corners = tuple(corners + offset for corners in marker_corners)
+
+        if len(self.find_target(marker_corners, marker_ids)) < self.target_count:
+            return None, None
+
+        return marker_corners, marker_ids
+
+    def scan_full_frame(self, video_frame):
+        start_time = time.perf_counter()
+        marker_corners, marker_ids = self.detect_markers(video_frame)
+        self.full_scan_time += time.perf_counter() - start_time
+        self.full_scans += 1
+        self.frames_since_refresh = 0
+        return marker_corners, marker_ids
+
+    def detect(self, video_frame):
+        '''
+        Detects markers in the search window around the locked targets or in the full frame
+
+        Parameters:
+            video_frame (numpy.ndarray): video frame
+
+        Returns:
+            marker_corners, marker_ids (tuple): same as returned by detectMarkers()
+        '''
+
+        start_time = time.perf_counter()
+        self.frames += 1
+        self.frames_since_refresh += 1
+
+        marker_corners, marker_ids = None, None
+        if self.target_center is not None and self.frames_since_refresh < self.refresh_period:
+            self.roi_scans += 1
+            marker_corners, marker_ids = self.scan_window(video_frame)
+            if marker_ids is not None:
+                self.roi_hits += 1
+
+        if marker_ids is None:
+            # no target locked, a target lost or periodic refresh
+            marker_corners, marker_ids = self.scan_full_frame(video_frame)
+
+        self.update_target(self.find_target(marker_corners, marker_ids))
+        self.detect_time += time.perf_counter() - start_time
+
+        return marker_corners, marker_ids
+
+    def set_scale_factor(self, scale_factor):
+        '''
+        Scales the detection resolution of the detector further at runtime, see create_detector()
+        '''
+
+        self.detect_markers.set_scale_factor(scale_factor)
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats (dict): ROI hit rate, number of full and ROI scans and average detection time saved per frame
+            in seconds compared to scanning the full frame every time
+        '''
+
+        average_full_scan_time = self.full_scan_time / self.full_scans if self.full_scans else 0.0
+        average_detect_time = self.detect_time / self.frames if self.frames else 0.0
+
+        return {
+            'frames': self.frames,
+            'roi_scans': self.roi_scans,
+            'roi_hits': self.roi_hits,
+            'roi_hit_rate': self.roi_hits / self.roi_scans if self.roi_scans else 0.0,
+            'full_scans': self.full_scans,
+            'average_full_scan_time': average_full_scan_time,
+            'average_detect_time': average_detect_time,
+            'time_saved_per_frame': average_full_scan_time - average_detect_time,
+        }
+
+
+def create_roi_tracking_detector(target_id, detection_scale=1.0, detector_parameters=None):
+    '''
+    Creates ArUco marker detector which tracks the target markers in a search window
+
+    Parameters:
+        target_id (int): ArUco marker ID of the target
+        detection_scale (float): scale factor of the frame used for detection, see create_detector()
+        detector_parameters (dict): detector parameters, see create_detector()
+
+    Returns:
+        detect (function): takes video frame and returns marker_corners, marker_ids
+    '''
+
+    roi_tracker = RoiTracker(create_detector(detection_scale, detector_parameters), target_id)
+
+    def detect(video_frame):
+        marker_corners, marker_ids = roi_tracker.detect(video_frame)
+        if roi_tracker.frames % 100 == 0:
+            logging.info(f'ROI tracking stats: {roi_tracker.get_stats()}')
+        return marker_corners, marker_ids
+
+    return detect
@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+# number of most recent round-trip times used for the percentiles
+RTT_WINDOW_SIZE = 1000
+
+# number of most recent parsed events kept
+EVENT_HISTORY_SIZE = 1000
+
+# sent commands not echoed within this time or beyond this number of outstanding commands are counted as lost
+COMMAND_TIMEOUT_IN_SECONDS = 1.0
+MAX_OUTSTANDING_COMMANDS = 100
+
+# action lines of arduino_control.ino
+MOTOR_CONTROL_ACTION = 'Motor control'
+UNKNOWN_COMMAND_ACTION = 'CMD unknown'
+
+
+class TelemetryReader:
+    '''
+    Reads replies of arduino_control.ino in a background thread and matches them to the sent commands
+
+    The sketch answers every ASCII command with 'CMD received', the echo of the command and an action line ('Motor
+    control' is followed by the parsed X and Y motor speed). Each reply is parsed into an event (dict) and matched by
+    its echo to the oldest outstanding sent command with the same text, the time between sending and receiving the
+    echo is the command round-trip time. Sent commands which are never echoed are counted as lost, they expire after
+    a timeout, so the outstanding commands stay bounded if the Arduino does not reply at all.
+    '''
+
+    def __init__(self, serial_port, command_timeout=COMMAND_TIMEOUT_IN_SECONDS,
+                 max_outstanding=MAX_OUTSTANDING_COMMANDS):
+        '''
+        Parameters:
+            serial_port (serial.Serial): open serial port, the reader sets its read timeout
+            command_timeout (float): time in seconds after which a sent command which was not echoed is lost
+            max_outstanding (int): max. number of outstanding sent commands, the oldest ones are lost beyond it
+        '''
+
+        self.serial_port = serial_port
+        self.command_timeout = command_timeout
+        self.max_outstanding = max_outstanding
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+        # outstanding sent commands as (command, timestamp)
+        self.sent_commands = deque()
+        self.rtts = deque(maxlen=RTT_WINDOW_SIZE)
+        self.events = deque(maxlen=EVENT_HISTORY_SIZE)
+
+        # reply being parsed and the expected next line: 'echo', 'action' or 'values'
+        self.event = None
+        self.expected = None
+
+        self.replies_received = 0
+        self.commands_matched = 0
+        self.commands_lost = 0
+        self.commands_unknown = 0
+        self.unmatched_replies = 0
+        self.unparsed_lines = 0
+
+    def start(self):
+        '''
+        Starts the background reader thread
+
+        Returns:
+            self (TelemetryReader): to allow chaining with the constructor
+        '''
+
+        # wake up regularly so that the thread can be stopped
+        self.serial_port.timeout = 0.1
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, name='TelemetryReader', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _read_loop(self):
+        line = b''
+        while self.running:
+            try:
+                line += self.serial_port.readline()
+            except Exception as e:
+                logging.error(f'Serial read failed: {e}')
+                break
+
+            # readline() returns a partial line on timeout
+            if not line.endswith(b'\n'):
+                continue
+
+            self.parse_line(line.decode(errors='replace').strip(), time.monotonic())
+            line = b''
+
+    def record_sent(self, command, timestamp):
+        '''
+        Records a command written to the serial port
+
+        Parameters:
+            command (bytes): command including the new line
+            timestamp (float): time.monotonic() right before the command is written
+        '''
+
+        with self.lock:
+            self._expire(timestamp)
+            if len(self.sent_commands) >= self.max_outstanding:
+                self.sent_commands.popleft()
+                self.commands_lost += 1
+            self.sent_commands.append((command.decode(errors='replace').strip(), timestamp))
+
+    def cancel_sent(self, command):
+        '''
+        Removes the most recently recorded command with the same text, e.g. if writing it failed
+
+        Parameters:
+            command (bytes): command including the new line
+        '''
+
+        command = command.decode(errors='replace').strip()
+        with self.lock:
+            for i in range(len(self.sent_commands) - 1, -1, -1):
+                if self.sent_commands[i][0] == command:
+                    del self.sent_commands[i]
+                    return
+
+    def _expire(self, timestamp):
+        # commands are sent in order, the expired ones are at the front
+        while self.sent_commands and timestamp - self.sent_commands[0][1] > self.command_timeout:
+            self.sent_commands.popleft()
+            self.commands_lost += 1
+
+    def _match(self, command, timestamp):
+        '''
+        Returns:
+            rtt (float): round-trip time in seconds or None if the command was not sent
+        '''
+
+        self._expire(timestamp)
+        for i, (sent_command, sent_timestamp) in enumerate(self.sent_commands):
+            if sent_command != command:
+                continue
+
+            # older commands were not echoed and will never be
+            for j in range(i):
+                self.sent_commands.popleft()
+            self.commands_lost += i
+            self.sent_commands.popleft()
+
+            self.commands_matched += 1
+            rtt = timestamp - sent_timestamp
+            self.rtts.append(rtt)
+            return rtt
+
+        self.unmatched_replies += 1
+        return None
+
+    def parse_line(self, line, timestamp):
+        '''
+        Parses a single reply line
+
+        Parameters:
+            line (str): line without the new line characters
+            timestamp (float): time.monotonic() when the line was received
+        '''
+
+        with self.lock:
+            if line == 'CMD received':
+                if self.event is not None:
+                    self._finish_event()
+                self.replies_received += 1
+                self.event = {'timestamp': timestamp, 'command': None, 'rtt': None, 'action': None, 'values': []}
+                self.expected = 'echo'
+
+            elif self.expected == 'echo':
+                self.event['command'] = line
+                self.event['rtt'] = self._match(line, timestamp)
+                self.expected = 'action'
+
+            elif self.expected == 'action':
+                self.event['action'] = line
+                if line == UNKNOWN_COMMAND_ACTION:
+                    self.commands_unknown += 1
+                if line == MOTOR_CONTROL_ACTION:
+                    self.expected = 'values'
+                else:
+                    self._finish_event()
+
+            elif self.expected == 'values':
+                try:
+                    self.event['values'].append(int(line))
+                except ValueError:
+                    self.unparsed_lines += 1
+                if len(self.event['values']) == 2:
+                    self._finish_event()
+
+            else:
+                self.unparsed_lines += 1
+                logging.debug(f'Unparsed Arduino line: {line}')
+
+    def _finish_event(self):
+        self.events.append(self.event)
+        self.event = None
+        self.expected = None
+
+    def get_latest_rtt(self):
+        '''
+        Returns:
+            rtt (float): round-trip time of the most recently matched command in seconds or None
+        '''
+
+        with self.lock:
+            return self.rtts[-1] if self.rtts else None
+
+    def get_events(self):
+        '''
+        Returns:
+            events (list): most recent parsed replies, oldest first
+        '''
+
+        with self.lock:
+            return list(self.events)
+
+    def get_stats(self):
+        '''
+        Returns:
+            stats (dict): reply counters and p50/p95/p99 of the recent command round-trip times in seconds
+        '''
+
+        with self.lock:
+            rtts = np.array(self.rtts)
+            stats = {
+                'replies_received': self.replies_received,
+                'commands_matched': self.commands_matched,
+                'commands_lost': self.commands_lost,
+                'commands_outstanding': len(self.sent_commands),
+                'commands_unknown': self.commands_unknown,
+                'unmatched_replies': self.unmatched_replies,
+                'unparsed_lines': self.unparsed_lines,
+            }
+
+        for percentile in (50, 95, 99):
+            stats[f'rtt_p{percentile}'] = float(np.percentile(rtts, percentile)) if len(rtts) else None
+
+        return stats
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import deque
+
+
+# start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+
+
+class SerialCommandWriter:
+    '''
+    Writes commands to the serial port in a background thread so that the frame loop never blocks on the link
+
+    Motor commands (DC) are coalesced: only the newest pending one is kept and it is sent only when the link has
+    transmitted the previous command, so the Arduino never works through a backlog of stale speeds. Repeats of the
+    last sent motor command are dropped. All other commands (GUN_ON, GUN_OFF, TRG) are sent immediately and in order.
+
+    Can be used wherever the serial port is used (send_motor_x_y_speed() etc.), everything else is passed through to
+    the wrapped serial port.
+    '''
+
+    def __init__(self, serial_port, baud_rate=None, telemetry_reader=None):
+        '''
+        Parameters:
+            serial_port (serial.Serial): open serial port (or BinaryProtocolPort)
+            baud_rate (int): link baud rate used for pacing, None = baud rate of the serial port
+            telemetry_reader (TelemetryReader): optional reader of the Arduino replies, it is notified of every sent
+                command and stopped together with the writer
+        '''
+
+        self.serial_port = serial_port
+        self.baud_rate = baud_rate
+        self.telemetry_reader = telemetry_reader
+        self.buffer = b''
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.writing = False
+
+        self.urgent_commands = deque()
+        self.pending_motor_command = None
+        self.last_motor_command = None
+        # time at which the link finishes transmitting the last written command
+        self.link_free_time = 0.0
+
+        self.commands_coalesced = 0
+        self.commands_dropped = 0
+        self.commands_sent = 0
+        self.bytes_sent = 0
+
+    def start(self):
+        '''
+        Starts the background writer thread
+
+        Returns:
+            self (SerialCommandWriter): to allow chaining with the constructor
+        '''
+
+        self.running = True
+        self.thread = threading.Thread(target=self._write_loop, name='SerialCommandWriter', daemon=True)
+        self.thread.start()
+        return self
+
+    def write(self, data):
+        '''
+        Queues commands (new line terminated) without blocking
+        '''
+
+        self.buffer += bytes(data)
+
+        with self.condition:
+            while b'\n' in self.buffer:
+                line, self.buffer = self.buffer.split(b'\n', 1)
+                command = line + b'\n'
+
+                if not line.startswith(b'DC '):
+                    self.urgent_commands.append(command)
+                    continue
+
+                if self.pending_motor_command is not None:
+                    # replaced by the newer command before it was sent
+                    self.commands_coalesced += 1
+                    self.pending_motor_command = None
+
+                if command == self.last_motor_command:
+                    self.commands_dropped += 1
+                else:
+                    self.pending_motor_command = command
+
+            self.condition.notify_all()
+
+        return len(data)
+
+    def _get_transmission_time(self, num_bytes):
+        baud_rate = self.baud_rate or self.serial_port.baudrate
+        return num_bytes * BITS_PER_BYTE / baud_rate
+
+    def _next_command(self):
+        '''
+        Waits for the next command to be sent, must be called with the condition held
+
+        Returns:
+            command (bytes) or None if the writer is stopped and all commands were sent
+        '''
+
+        while True:
+            if self.urgent_commands:
+                return self.urgent_commands.popleft()
+
+            if self.pending_motor_command is not None:
+                # pace motor commands to the link bandwidth (send everything right away when stopping)
+                delay = self.link_free_time - time.monotonic()
+                if delay <= 0 or not self.running:
+                    command, self.pending_motor_command = self.pending_motor_command, None
+                    self.last_motor_command = command
+                    return command
+                self.condition.wait(delay)
+                continue
+
+            if not self.running:
+                return None
+
+            self.condition.wait()
+
+    def _write_loop(self):
+        while True:
+            with self.condition:
+                command = self._next_command()
+                if command is None:
+                    self.condition.notify_all()
+                    break
+                self.writing = True
+
+            # recorded before the write so that the echo can never be parsed before the command is recorded
+            if self.telemetry_reader is not None:
+                self.telemetry_reader.record_sent(command, time.monotonic())
+
+            try:
+                num_bytes = self.serial_port.write(command)
+            except Exception as e:
+                logging.error(f'Serial write failed: {e}')
+                num_bytes = 0
+                # the command was not sent and must not be counted as lost
+                if self.telemetry_reader is not None:
+                    self.telemetry_reader.cancel_sent(command)
+
+            if not isinstance(num_bytes, int):
+                num_bytes = len(command)
+
+            with self.condition:
+                self.writing = False
+                self.commands_sent += 1
+                self.bytes_sent += num_bytes
+                self.link_free_time = max(self.link_free_time, time.monotonic()) + \
+                    self._get_transmission_time(num_bytes)
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        '''
+        Waits until all queued commands are written
+
+        Returns:
+            success (bool): False if timed out
+        '''
+
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.urgent_commands and self.pending_motor_command is None and not self.writing, timeout)
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'commands_sent': self.commands_sent,
+                'commands_coalesced': self.commands_coalesced,
+                'commands_dropped': self.commands_dropped,
+                'bytes_sent': self.bytes_sent,
+            }
+
+    def stop(self):
+        '''
+        Stops the writer thread after all queued commands are written
+        '''
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        if self.telemetry_reader is not None:
+            self.telemetry_reader.stop()
+        self.serial_port.close()
+
+    def __getattr__(self, name):
+        return getattr(self.serial_port, name)
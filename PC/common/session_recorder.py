@@ -0,0 +1,313 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+FRAME_ENCODINGS = ('jpg', 'png', 'raw', 'none')
+
+# 'drop_newest' = a frame arriving at a full queue is not recorded, 'drop_oldest' = the oldest queued frame is
+# discarded to make room for it; telemetry of dropped frames is recorded anyway
+DROP_POLICIES = ('drop_newest', 'drop_oldest')
+
+# max. number of frames waiting to be written
+DEFAULT_MAX_QUEUED_FRAMES = 32
+
+# max. number of telemetry records waiting to be written, further records are dropped
+MAX_QUEUED_RECORDS = 10000
+
+JPEG_QUALITY = 90
+
+SESSION_VERSION = 1
+METADATA_FILE = 'session.json'
+RECORDS_FILE = 'records.jsonl'
+FRAMES_FILE = 'frames.bin'
+
+
+def to_json(value):
+    '''
+    Converts numpy values for json.dumps()
+    '''
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value)} is not JSON serializable')
+
+
+class SessionRecorder:
+    '''
+    Records frames and control telemetry of a session in a background thread
+
+    The processing loop only copies the frame and appends it to a bounded queue, encoding and disk I/O happen in the
+    writer thread. If the writer falls behind and the queue is full, frames are dropped according to the drop policy
+    and counted, their telemetry is still recorded.
+
+    Session directory layout:
+        session.json - metadata and recording stats, written by close()
+        records.jsonl - one JSON object per frame or event, frames reference their data in frames.bin by offset
+        frames.bin - concatenated encoded (or raw) frames
+    '''
+
+    def __init__(self, path, encoding='jpg', max_queued_frames=DEFAULT_MAX_QUEUED_FRAMES, drop_policy='drop_newest',
+                 metadata=None):
+        '''
+        Parameters:
+            path (str): session directory, created if it does not exist
+            encoding (str): one of FRAME_ENCODINGS, 'none' = telemetry only
+            max_queued_frames (int): max. number of frames waiting to be written
+            drop_policy (str): one of DROP_POLICIES
+            metadata (dict): additional session metadata (e.g. command line arguments)
+        '''
+
+        assert encoding in FRAME_ENCODINGS, f'Unknown frame encoding {encoding}'
+        assert drop_policy in DROP_POLICIES, f'Unknown drop policy {drop_policy}'
+
+        self.path = path
+        self.encoding = encoding
+        self.max_queued_frames = max_queued_frames
+        self.drop_policy = drop_policy
+        self.metadata = metadata or {}
+
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        # queued records which still hold a frame, oldest first
+        self.queued_frames = collections.deque()
+        self.stopped = False
+        self.thread = None
+
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.records_written = 0
+        self.records_dropped = 0
+        self.max_queue_length = 0
+        self.bytes_written = 0
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.records_file = open(os.path.join(self.path, RECORDS_FILE), 'w')
+        self.frames_file = open(os.path.join(self.path, FRAMES_FILE), 'wb')
+        self.start_time = time.time()
+
+        self.thread = threading.Thread(target=self._write_loop, name='SessionRecorder', daemon=True)
+        self.thread.start()
+        logging.info(f'Recording session to {self.path}')
+        return self
+
+    def _put(self, record, frame=None):
+        '''
+        Queues the record, the frame is copied into it only if it is not dropped
+        '''
+
+        with self.condition:
+            if len(self.queue) >= MAX_QUEUED_RECORDS:
+                self.records_dropped += 1
+                if frame is not None:
+                    self.frames_dropped += 1
+                return
+
+            if frame is not None and len(self.queued_frames) >= self.max_queued_frames:
+                self.frames_dropped += 1
+                if self.drop_policy == 'drop_newest':
+                    frame = None
+                else:
+                    self.queued_frames.popleft()['frame'] = None
+
+            if frame is not None:
+                # the caller may reuse the frame
+                record['frame'] = frame.copy()
+                self.queued_frames.append(record)
+            self.queue.append(record)
+            self.max_queue_length = max(self.max_queue_length, len(self.queue))
+            self.condition.notify()
+
+    def record_frame(self, frame, timestamp, marker_corners, marker_ids, control):
+        '''
+        Queues the frame and its telemetry, never blocks
+
+        Parameters:
+            frame (numpy.ndarray): video frame, copied (unless it is dropped) because the caller may reuse it
+            timestamp (float): capture timestamp of the frame (time.monotonic())
+            marker_corners (list): detected marker corners as returned by detectMarkers()
+            marker_ids (numpy.ndarray): detected marker IDs
+            control (dict): control as returned by calculate_control() or None
+        '''
+
+        self._put({
+            'type': 'frame',
+            'timestamp': timestamp,
+            'wall_time': time.time(),
+            'marker_ids': [] if marker_ids is None else np.asarray(marker_ids).ravel(),
+            'marker_corners': [np.round(np.asarray(corners).reshape(4, 2), 2) for corners in marker_corners],
+            'control': control,
+            'frame': None,
+        }, frame if self.encoding != 'none' else None)
+
+    def record_event(self, name, **data):
+        '''
+        Queues an event (e.g. a command sent to Arduino), never blocks
+        '''
+
+        self._put({'type': 'event', 'name': name, 'timestamp': time.monotonic(), 'wall_time': time.time(), **data})
+
+    def _encode(self, frame):
+        if self.encoding == 'raw':
+            return np.ascontiguousarray(frame).tobytes()
+
+        params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if self.encoding == 'jpg' else []
+        ok, data = cv2.imencode(f'.{self.encoding}', frame, params)
+        return data.tobytes() if ok else None
+
+    def _write(self, record):
+        frame = record.pop('frame', None)
+        if record['type'] == 'frame':
+            record['frame_offset'] = record['frame_length'] = None
+            data = self._encode(frame) if frame is not None else None
+            if data is not None:
+                record['frame_offset'] = self.frames_file.tell()
+                record['frame_length'] = len(data)
+                record['frame_encoding'] = self.encoding
+                record['frame_shape'] = frame.shape
+                record['frame_dtype'] = frame.dtype.str
+                self.frames_file.write(data)
+                self.bytes_written += len(data)
+                self.frames_recorded += 1
+
+        self.records_file.write(json.dumps(record, default=to_json) + '\n')
+        self.records_written += 1
+
+    def _write_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                record = self.queue.popleft()
+                if self.queued_frames and self.queued_frames[0] is record:
+                    self.queued_frames.popleft()
+
+            try:
+                self._write(record)
+            except Exception as e:
+                logging.error(f'Session record could not be written: {e}')
+
+    def get_stats(self):
+        return {
+            'frames_recorded': self.frames_recorded,
+            'frames_dropped': self.frames_dropped,
+            'records_written': self.records_written,
+            'records_dropped': self.records_dropped,
+            'max_queue_length': self.max_queue_length,
+            'bytes_written': self.bytes_written,
+        }
+
+    def close(self):
+        '''
+        Writes all queued records and the session metadata
+        '''
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+        self.records_file.close()
+        self.frames_file.close()
+
+        metadata = {
+            'version': SESSION_VERSION,
+            'encoding': self.encoding,
+            'drop_policy': self.drop_policy,
+            'start_time': self.start_time,
+            'end_time': time.time(),
+            'stats': self.get_stats(),
+            **self.metadata,
+        }
+        with open(os.path.join(self.path, METADATA_FILE), 'w') as metadata_file:
+            json.dump(metadata, metadata_file, indent=4, default=to_json)
+
+
+class SessionReader:
+    '''
+    Loads a recorded session for analysis
+    '''
+
+    def __init__(self, path):
+        '''
+        Parameters:
+            path (str): session directory written by SessionRecorder
+        '''
+
+        self.path = path
+
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if os.path.isfile(metadata_path):
+            with open(metadata_path) as metadata_file:
+                self.metadata = json.load(metadata_file)
+        else:
+            # recorder was not closed (e.g. crash), the records written so far are still readable
+            logging.warning(f'Session {path} has no metadata, it was not closed properly')
+            self.metadata = {}
+
+        self.records = []
+        with open(os.path.join(path, RECORDS_FILE)) as records_file:
+            for line in records_file:
+                try:
+                    self.records.append(json.loads(line))
+                except ValueError:
+                    # last line may be incomplete
+                    break
+
+        self.frames_file = open(os.path.join(path, FRAMES_FILE), 'rb')
+
+    @property
+    def frames(self):
+        return [record for record in self.records if record['type'] == 'frame']
+
+    @property
+    def events(self):
+        return [record for record in self.records if record['type'] == 'event']
+
+    def read_frame(self, record):
+        '''
+        Parameters:
+            record (dict): frame record
+
+        Returns:
+            frame (numpy.ndarray): decoded video frame or None if the frame was dropped
+        '''
+
+        if record.get('frame_offset') is None:
+            return None
+
+        self.frames_file.seek(record['frame_offset'])
+        data = self.frames_file.read(record['frame_length'])
+        if record['frame_encoding'] == 'raw':
+            return np.frombuffer(data, dtype=record['frame_dtype']).reshape(record['frame_shape'])
+
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    def __iter__(self):
+        '''
+        Yields:
+            record (dict), frame (numpy.ndarray or None) of every frame record
+        '''
+
+        for record in self.frames:
+            yield record, self.read_frame(record)
+
+    def close(self):
+        self.frames_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
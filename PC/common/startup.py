@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    '''
+    Measures the startup steps and the time from the start of the program to the first processed frame
+    '''
+
+    def __init__(self, start_time=None):
+        '''
+        Parameters:
+            start_time (float): time.perf_counter() at the start of the program, None = now
+        '''
+
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.time_to_first_frame = None
+
+    @contextmanager
+    def measure(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start_time
+
+    def call(self, name, function):
+        '''
+        Calls the function and measures its duration as step name
+
+        Returns:
+            result of the function
+        '''
+
+        with self.measure(name):
+            return function()
+
+    def mark_first_frame(self):
+        '''
+        Returns:
+            first (bool): True for the first processed frame
+        '''
+
+        if self.time_to_first_frame is not None:
+            return False
+
+        self.time_to_first_frame = time.perf_counter() - self.start_time
+        return True
+
+    def get_breakdown(self):
+        '''
+        Returns:
+            breakdown (dict): key = step name, value = duration in seconds, plus the time to the first frame
+        '''
+
+        with self.lock:
+            breakdown = dict(self.durations)
+        breakdown['time_to_first_frame'] = self.time_to_first_frame
+        return breakdown
+
+    def log(self):
+        breakdown = self.get_breakdown()
+        time_to_first_frame = breakdown.pop('time_to_first_frame')
+        logging.info('Startup timing breakdown:')
+        for name, duration in breakdown.items():
+            logging.info(f'    {name}: {duration * 1000:.1f} ms')
+        if time_to_first_frame is not None:
+            logging.info(f'    time to first frame: {time_to_first_frame * 1000:.1f} ms')
+
+
+def run_startup_steps(steps, timer, concurrent=True):
+    '''
+    Runs independent initialization steps, either concurrently in background threads or one after another
+
+    Parameters:
+        steps (dict): key = step name, value = function without arguments
+        timer (StartupTimer): measures the duration of every step
+        concurrent (bool): run the steps in background threads and return immediately
+
+    Returns:
+        futures (dict): key = step name, value = concurrent.futures.Future with the result of the step
+    '''
+
+    if concurrent:
+        executor = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='startup')
+        futures = {name: executor.submit(timer.call, name, function) for name, function in steps.items()}
+        executor.shutdown(wait=False)
+        return futures
+
+    futures = {}
+    for name, function in steps.items():
+        futures[name] = Future()
+        try:
+            futures[name].set_result(timer.call(name, function))
+        except Exception as e:
+            futures[name].set_exception(e)
+
+    return futures
@@ -0,0 +1,299 @@
+import time
+
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+
+from common.overlay import get_bounding_box
+
+
+SYNTHETIC_WIDTH = 1280
+SYNTHETIC_HEIGHT = 720
+SYNTHETIC_FPS = 30
+
+# white quiet zone around the marker in marker sizes
+QUIET_ZONE = 0.25
+
+# number of precomputed noise frames
+NOISE_BANK_SIZE = 4
+
+
+def linear_trajectory(start, velocity):
+    '''
+    Returns:
+        trajectory (function): takes time in seconds and returns x, y position in pixels
+    '''
+
+    start = np.asarray(start, dtype=float)
+    velocity = np.asarray(velocity, dtype=float)
+    return lambda t: start + velocity * t
+
+
+def circular_trajectory(center, radius, period):
+    '''
+    Returns:
+        trajectory (function): takes time in seconds and returns x, y position in pixels
+    '''
+
+    center = np.asarray(center, dtype=float)
+    return lambda t: center + radius * np.array([np.cos(2 * np.pi * t / period), np.sin(2 * np.pi * t / period)])
+
+
+def waypoint_trajectory(waypoints, loop=False):
+    '''
+    Parameters:
+        waypoints (list): tuples of time in seconds, x and y position in pixels
+        loop (bool): start over from the first waypoint after the last one
+
+    Returns:
+        trajectory (function): takes time in seconds and returns x, y position linearly interpolated between waypoints
+    '''
+
+    waypoints = np.asarray(waypoints, dtype=float)
+    period = waypoints[-1, 0] - waypoints[0, 0]
+
+    def trajectory(t):
+        if loop and period > 0:
+            t = waypoints[0, 0] + (t - waypoints[0, 0]) % period
+        return np.array([np.interp(t, waypoints[:, 0], waypoints[:, 1]), np.interp(t, waypoints[:, 0], waypoints[:, 2])])
+
+    return trajectory
+
+
+class SyntheticMarker:
+    '''
+    DICT_4X4_250 marker moving along a scripted trajectory
+    '''
+
+    def __init__(self, marker_id, size, trajectory, rotation_speed=0.0, tilt=0.0, tilt_speed=0.0):
+        '''
+        Parameters:
+            marker_id (int): ArUco marker ID
+            size (int): marker size in pixels
+            trajectory (function): takes time in seconds and returns x, y position of the marker center in pixels
+            rotation_speed (float): in-plane rotation speed in degrees per second
+            tilt (float): out-of-plane rotation (perspective) around the vertical axis in degrees
+            tilt_speed (float): out-of-plane rotation speed in degrees per second
+        '''
+
+        self.marker_id = marker_id
+        self.size = size
+        self.trajectory = trajectory
+        self.rotation_speed = rotation_speed
+        self.tilt = tilt
+        self.tilt_speed = tilt_speed
+
+    def get_corners(self, t, focal_length, scale=1.0):
+        '''
+        Calculates image corners of the marker (scale = 1) or of the marker with its quiet zone (scale > 1)
+
+        Returns:
+            corners (numpy.ndarray): 4 corners clockwise from top-left, shape (4, 2)
+        '''
+
+        half_size = self.size * scale / 2
+        square = np.array([[-half_size, -half_size], [half_size, -half_size], [half_size, half_size],
+                           [-half_size, half_size]])
+
+        # in-plane rotation
+        angle = np.deg2rad(self.rotation_speed * t)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        square = square @ rotation.T
+
+        # out-of-plane rotation around the vertical axis and pinhole projection
+        tilt = np.deg2rad(self.tilt + self.tilt_speed * t)
+        x = square[:, 0] * np.cos(tilt)
+        z = square[:, 0] * np.sin(tilt)
+        projection = focal_length / (focal_length + z)
+
+        center = self.trajectory(t)
+        return np.stack([x * projection, square[:, 1] * projection], axis=1) + center
+
+
+class SyntheticCamera:
+    '''
+    Renders DICT_4X4_250 markers moving over a background, with perspective, blur, noise and lighting changes
+
+    Has the read()/get()/release() interface of cv2.VideoCapture so it can be used instead of a real camera. Frames
+    are rendered as fast as possible (or paced to the frame rate if real_time is set) and are fully determined by the
+    seed and the frame index. Time in the scene is the frame index divided by the frame rate.
+    '''
+
+    def __init__(self, markers, width=SYNTHETIC_WIDTH, height=SYNTHETIC_HEIGHT, fps=SYNTHETIC_FPS, seed=0,
+                 blur=0.0, noise=0.0, lighting_amplitude=0.0, lighting_period=5.0, num_frames=None, real_time=False):
+        '''
+        Parameters:
+            markers (list): SyntheticMarker objects
+            width, height (int): frame size in pixels
+            fps (float): frame rate
+            seed (int): random seed of background and noise
+            blur (float): sigma of Gaussian blur in pixels, 0 = no blur
+            noise (float): standard deviation of sensor noise, 0 = no noise
+            lighting_amplitude (float): relative amplitude of the brightness changes, 0 = constant lighting
+            lighting_period (float): period of the brightness changes in seconds
+            num_frames (int): number of frames after which read() fails, None = endless
+            real_time (bool): pace read() to the frame rate
+        '''
+
+        self.markers = markers
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.blur = blur
+        self.lighting_amplitude = lighting_amplitude
+        self.lighting_period = lighting_period
+        self.num_frames = num_frames
+        self.real_time = real_time
+
+        self.frame_idx = 0
+        self.start_time = None
+        self.opened = True
+        self.ground_truth = []
+
+        rng = np.random.default_rng(seed)
+
+        # smooth random background
+        background = rng.integers(40, 220, size=(9, 16, 3), dtype=np.uint8)
+        self.background = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+
+        # signed sensor noise split into positive and negative part so that it can be applied with saturation
+        self.noise_bank = []
+        if noise > 0:
+            for i in range(NOISE_BANK_SIZE):
+                frame_noise = rng.normal(0, noise, size=(height, width, 3))
+                self.noise_bank.append((np.clip(frame_noise, 0, 255).astype(np.uint8),
+                                        np.clip(-frame_noise, 0, 255).astype(np.uint8)))
+
+        # marker images with quiet zone
+        dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+        self.marker_images = {}
+        for marker in markers:
+            marker_image = aruco.drawMarker(dictionary, marker.marker_id, 200)
+            border = int(200 * QUIET_ZONE)
+            marker_image = cv2.copyMakeBorder(marker_image, border, border, border, border, cv2.BORDER_CONSTANT,
+                value=255)
+            self.marker_images[marker.marker_id] = cv2.cvtColor(marker_image, cv2.COLOR_GRAY2BGR)
+
+    def render_marker(self, video_frame, marker, t):
+        marker_image = self.marker_images[marker.marker_id]
+        h, w = marker_image.shape[0:2]
+        source_corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
+
+        focal_length = self.width
+        corners = marker.get_corners(t, focal_length, scale=1 + 2 * QUIET_ZONE).astype(np.float32)
+        x0, y0, x1, y1 = get_bounding_box(corners, video_frame.shape)
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        # warp only into the bounding box of the marker
+        roi_corners = (corners - np.array([x0, y0], dtype=np.float32)).astype(np.float32)
+        transform_matrix = cv2.getPerspectiveTransform(source_corners, roi_corners)
+        roi = video_frame[y0:y1, x0:x1]
+        cv2.warpPerspective(marker_image, transform_matrix, (x1 - x0, y1 - y0), dst=roi,
+            borderMode=cv2.BORDER_TRANSPARENT)
+
+        return marker.get_corners(t, focal_length)
+
+    def render(self, frame_idx, image=None):
+        '''
+        Renders a single frame
+
+        Parameters:
+            frame_idx (int): frame index
+            image (numpy.ndarray): optional buffer to render into
+
+        Returns:
+            video_frame (numpy.ndarray): BGR frame
+        '''
+
+        t = frame_idx / self.fps
+
+        if image is None:
+            image = self.background.copy()
+        else:
+            np.copyto(image, self.background)
+
+        self.ground_truth = []
+        for marker in self.markers:
+            corners = self.render_marker(image, marker, t)
+            if corners is not None:
+                self.ground_truth.append((marker.marker_id, corners))
+
+        if self.lighting_amplitude > 0:
+            gain = 1 + self.lighting_amplitude * np.sin(2 * np.pi * t / self.lighting_period)
+            cv2.convertScaleAbs(image, dst=image, alpha=gain)
+
+        if self.blur > 0:
+            cv2.GaussianBlur(image, (0, 0), self.blur, dst=image)
+
+        if self.noise_bank:
+            noise_positive, noise_negative = self.noise_bank[frame_idx % len(self.noise_bank)]
+            cv2.add(image, noise_positive, dst=image)
+            cv2.subtract(image, noise_negative, dst=image)
+
+        return image
+
+    def read(self, image=None):
+        '''
+        Returns:
+            ret (bool): False if the camera is released or all frames were read
+            video_frame (numpy.ndarray): next frame or None
+        '''
+
+        if not self.opened or (self.num_frames is not None and self.frame_idx >= self.num_frames):
+            return False, None
+
+        if self.real_time:
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            delay = self.start_time + self.frame_idx / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        video_frame = self.render(self.frame_idx, image)
+        self.frame_idx += 1
+        return True, video_frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_idx)
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            return self.frame_idx / self.fps * 1000
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.num_frames) if self.num_frames is not None else -1.0
+        return 0.0
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+
+def create_default_scene(width=SYNTHETIC_WIDTH, height=SYNTHETIC_HEIGHT, fps=SYNTHETIC_FPS, seed=0, **kwargs):
+    '''
+    Creates synthetic camera with a foe (ID 0) circling around the frame center and a friendly (ID 1) crossing
+    the frame, with mild blur, noise and lighting changes
+
+    Returns:
+        synthetic_camera (SyntheticCamera)
+    '''
+
+    marker_size = min(width, height) // 5
+    markers = [
+        SyntheticMarker(0, marker_size, circular_trajectory((width / 2, height / 2), min(width, height) / 4, 8.0),
+            rotation_speed=10.0, tilt=20.0, tilt_speed=5.0),
+        SyntheticMarker(1, marker_size, waypoint_trajectory([(0, width * 0.1, height * 0.2),
+            (10, width * 0.9, height * 0.8), (20, width * 0.1, height * 0.2)], loop=True), tilt=-30.0),
+    ]
+
+    scene = {'blur': 0.8, 'noise': 3.0, 'lighting_amplitude': 0.15}
+    scene.update(kwargs)
+
+    return SyntheticCamera(markers, width, height, fps, seed, **scene)
@@ -0,0 +1,228 @@
+import numpy as np
+
+
+MOTION_MODELS = ('cv', 'ca')
+
+# spectral density of the white noise driving the highest modelled derivative (acceleration for the constant
+# velocity model, jerk for the constant acceleration model), in px^2/s^3 and px^2/s^5
+DEFAULT_PROCESS_NOISE = {'cv': 2e4, 'ca': 2e5}
+
+# standard deviation of the marker center measurement in pixels
+DEFAULT_MEASUREMENT_NOISE = 2.0
+
+# initial standard deviation of velocity (px/s) and acceleration (px/s^2)
+INITIAL_VELOCITY_STD = 500.0
+INITIAL_ACCELERATION_STD = 2000.0
+
+# max. time without measurement before the track is dropped
+DEFAULT_MAX_COAST_TIME_IN_SECONDS = 0.5
+
+# max. time the position is extrapolated ahead of the last filter update
+MAX_PREDICTION_TIME_IN_SECONDS = 0.5
+
+# measurements further than this (squared Mahalanobis distance, chi2 with 2 DOF at 99.9 %) restart the track
+GATE_THRESHOLD = 13.8
+
+
+def get_transition_matrix(model, dt):
+    '''
+    Returns:
+        transition_matrix (numpy.ndarray): state transition of a single axis over dt seconds
+    '''
+
+    if model == 'cv':
+        return np.array([[1, dt],
+                         [0, 1]])
+
+    return np.array([[1, dt, dt**2 / 2],
+                     [0, 1, dt],
+                     [0, 0, 1]])
+
+
+def get_process_noise(model, dt, process_noise):
+    '''
+    Returns:
+        process_noise_covariance (numpy.ndarray): discretized continuous white noise of a single axis over dt seconds
+    '''
+
+    if model == 'cv':
+        q = np.array([[dt**3 / 3, dt**2 / 2],
+                      [dt**2 / 2, dt]])
+    else:
+        q = np.array([[dt**5 / 20, dt**4 / 8, dt**3 / 6],
+                      [dt**4 / 8, dt**3 / 3, dt**2 / 2],
+                      [dt**3 / 6, dt**2 / 2, dt]])
+
+    return q * process_noise
+
+
+class KalmanTracker:
+    '''
+    Constant velocity ('cv') or constant acceleration ('ca') Kalman filter of the target center in pixels
+
+    The filter is advanced to the timestamp of every frame. Frames without measurement (detection dropouts) only
+    advance the prediction, so the target keeps moving along its estimated path. The track is dropped after
+    max_coast_time without measurement, and restarted if a measurement is too far from the prediction.
+    '''
+
+    def __init__(self, model='cv', process_noise=None, measurement_noise=DEFAULT_MEASUREMENT_NOISE,
+                 max_coast_time=DEFAULT_MAX_COAST_TIME_IN_SECONDS):
+        '''
+        Parameters:
+            model (str): 'cv' = constant velocity, 'ca' = constant acceleration
+            process_noise (float): see DEFAULT_PROCESS_NOISE, None = default of the model
+            measurement_noise (float): standard deviation of the measured position in pixels
+            max_coast_time (float): max. time in seconds without measurement before the track is dropped
+        '''
+
+        assert model in MOTION_MODELS, f'Unknown motion model {model}'
+
+        self.model = model
+        self.order = 2 if model == 'cv' else 3
+        self.process_noise = DEFAULT_PROCESS_NOISE[model] if process_noise is None else process_noise
+        self.max_coast_time = max_coast_time
+
+        # state [x, vx, (ax), y, vy, (ay)]
+        self.measurement_matrix = np.zeros((2, 2 * self.order))
+        self.measurement_matrix[0, 0] = 1
+        self.measurement_matrix[1, self.order] = 1
+        self.measurement_covariance = np.eye(2) * measurement_noise**2
+
+        self.state = None
+        self.covariance = None
+        self.timestamp = None
+        self.last_measurement_timestamp = None
+
+        self.updates = 0
+        self.coasted = 0
+        self.restarts = 0
+
+    @property
+    def is_tracking(self):
+        return self.state is not None
+
+    def reset(self):
+        self.state = None
+        self.covariance = None
+        self.timestamp = None
+        self.last_measurement_timestamp = None
+
+    def _initialize(self, measurement, timestamp):
+        initial_std = [DEFAULT_MEASUREMENT_NOISE, INITIAL_VELOCITY_STD, INITIAL_ACCELERATION_STD][:self.order]
+        self.state = np.zeros(2 * self.order)
+        self.state[0], self.state[self.order] = measurement
+        self.covariance = np.diag(np.tile(np.square(initial_std), 2))
+        self.covariance[[0, self.order], [0, self.order]] = np.diag(self.measurement_covariance)
+        self.timestamp = timestamp
+        self.last_measurement_timestamp = timestamp
+
+    def _get_matrices(self, dt):
+        identity = np.eye(2)
+        transition_matrix = np.kron(identity, get_transition_matrix(self.model, dt))
+        process_noise_covariance = np.kron(identity, get_process_noise(self.model, dt, self.process_noise))
+        return transition_matrix, process_noise_covariance
+
+    def update(self, measurement, timestamp):
+        '''
+        Advances the filter to the timestamp and corrects it with the measurement
+
+        Parameters:
+            measurement (tuple): measured x, y target center in pixels or None if the target was not detected
+            timestamp (float): time of the frame in seconds (e.g. time.monotonic() at capture)
+
+        Returns:
+            tracking (bool): True if the target is being tracked after the update
+        '''
+
+        if self.state is None:
+            if measurement is not None:
+                self._initialize(measurement, timestamp)
+                self.updates += 1
+            return self.is_tracking
+
+        dt = timestamp - self.timestamp
+        if dt > 0:
+            transition_matrix, process_noise_covariance = self._get_matrices(dt)
+            self.state = transition_matrix @ self.state
+            self.covariance = transition_matrix @ self.covariance @ transition_matrix.T + process_noise_covariance
+            self.timestamp = timestamp
+
+        if measurement is None:
+            if timestamp - self.last_measurement_timestamp > self.max_coast_time:
+                self.reset()
+            else:
+                self.coasted += 1
+            return self.is_tracking
+
+        innovation = np.asarray(measurement, dtype=float) - self.measurement_matrix @ self.state
+        innovation_covariance = self.measurement_matrix @ self.covariance @ self.measurement_matrix.T + \
+            self.measurement_covariance
+
+        if innovation @ np.linalg.solve(innovation_covariance, innovation) > GATE_THRESHOLD:
+            # target jumped (e.g. a different marker) - start over from the measurement
+            self._initialize(measurement, timestamp)
+            self.restarts += 1
+            self.updates += 1
+            return True
+
+        gain = self.covariance @ self.measurement_matrix.T @ np.linalg.inv(innovation_covariance)
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(2 * self.order) - gain @ self.measurement_matrix) @ self.covariance
+        self.last_measurement_timestamp = timestamp
+        self.updates += 1
+        return True
+
+    def predict(self, timestamp):
+        '''
+        Parameters:
+            timestamp (float): time in seconds to predict the position at
+
+        Returns:
+            position (tuple): predicted x, y target center in pixels or None if the target is not tracked
+        '''
+
+        if self.state is None:
+            return None
+
+        dt = min(max(timestamp - self.timestamp, 0.0), MAX_PREDICTION_TIME_IN_SECONDS)
+        transition_matrix = get_transition_matrix(self.model, dt)
+        x = transition_matrix[0] @ self.state[:self.order]
+        y = transition_matrix[0] @ self.state[self.order:]
+        return float(x), float(y)
+
+    def get_velocity(self):
+        '''
+        Returns:
+            velocity (tuple): estimated x, y target velocity in pixels per second or None
+        '''
+
+        if self.state is None:
+            return None
+
+        return float(self.state[1]), float(self.state[self.order + 1])
+
+    def get_stats(self):
+        return {
+            'updates': self.updates,
+            'coasted': self.coasted,
+            'restarts': self.restarts,
+        }
+
+
+class LatencyEstimator:
+    '''
+    Exponential moving average of the end-to-end latency from frame capture to the command taking effect
+    '''
+
+    def __init__(self, initial_latency=0.0, smoothing=0.1):
+        self.latency = initial_latency
+        self.smoothing = smoothing
+        self.samples = 0
+
+    def update(self, latency):
+        if self.samples == 0:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        self.samples += 1
+        return self.latency
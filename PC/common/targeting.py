@@ -0,0 +1,303 @@
+import logging
+import time
+
+from common.markers import get_marker_center
+from common.multi_target_tracker import MultiTargetTracker
+from common.target_predictor import KalmanTracker, LatencyEstimator
+
+
+# ArUco marker IDs legend
+FOE_ID = 0
+FRIENDLY_ID = 1
+
+# deadzoe radius definition - if the target is within this radius te robot wil not move
+DEADZONE_RADIUS_IN_PIXELS = 50
+
+# min motor speed
+MIN_X_MOTOR_SPEED = 100
+MAX_X_MOTOR_SPEED = 255
+K_X = 1.0
+MIN_Y_MOTOR_SPEED = 100
+MAX_Y_MOTOR_SPEED = 255
+K_Y = 1.0
+
+# deadzone radius and proportional constants between error and PWM value used with a camera calibration, when the
+# error is an angle in degrees (about the pixel values above at the center of a 640 px frame with 60 deg FOV)
+DEADZONE_RADIUS_IN_DEGREES = 5.0
+K_X_PER_DEGREE = 10.0
+K_Y_PER_DEGREE = 10.0
+
+
+def calculate_motor_speed(error, deadzone, min_motor_speed, max_motor_speed, k):
+    '''
+    Calculates motor speed in range [min_motor_speed, max_motor_speed] or zero if th error is within deadzone
+
+    Parameters:
+        error (int): error in pixels (or float in degrees with a camera calibration)
+        deadzone (int): deadzone in pixels (or degrees)
+        min_motor_speed (int): Arduino motor shield PWM setting in range of [0, 255] at which the motor starts moving
+        max_motor_speed (int): Arduino motor shield PWM setting in range of [0, 255] which we consider maximum allowable speed
+        k (float): proportional constant between error in pixels and PWM value
+
+    Returns:
+        motor_speed (int): Arduino motor shield PWM setting in range of [-255, 255]
+        NOTE: user will need to check for motor speed sign to set proper motor direction using Arduino library
+    '''
+
+    assert min_motor_speed < max_motor_speed, 'Min. motor speed has to be smaller than max. speed'
+    assert type(min_motor_speed) is int
+    assert type(max_motor_speed) is int
+    assert min_motor_speed >= 0
+    assert max_motor_speed <= 255
+
+    if abs(error) <= deadzone:
+        return 0
+
+    # calculate desired motor speed to eliminate the error (simple P-control)
+    # NOTE: The + and - pins of the DC motor need to be connected accordingly to be aligned with positive and
+    # negative error in the pixel domain
+    motor_speed = k * error
+
+    if abs(motor_speed) > max_motor_speed:
+        return max_motor_speed if error > 0 else -max_motor_speed
+
+    if abs(motor_speed) < min_motor_speed:
+        return min_motor_speed if error > 0 else -min_motor_speed
+
+    # the error can be a fractional angle, the PWM setting (and the command sent to Arduino) is an integer
+    return int(round(motor_speed))
+
+
+def get_foe_markers(marker_corners, marker_ids):
+    '''
+    Gets centers of foe ArUco markers
+
+    Parameters:
+        marker_corners (list): marker corners as returned by detectMarkers()
+        marker_ids (numpy.ndarray): marker IDs as returned by detectMarkers()
+
+    Returns:
+        foe_markers (dict): key = index of the detected marker, value = tuple: position of the center of the marker
+            in pixels
+    '''
+
+    foe_markers = {}
+
+    if marker_ids is not None:
+        for i, marker_id in enumerate(marker_ids):
+            if marker_id == FOE_ID:
+                foe_markers[i] = get_marker_center(marker_corners[i])
+
+    return foe_markers
+
+
+def get_foe_corners(marker_corners, marker_ids):
+    '''
+    Gets corners of foe ArUco markers
+
+    Returns:
+        foe_corners (list): corners of the foe markers as returned by detectMarkers()
+    '''
+
+    if marker_ids is None:
+        return []
+
+    return [marker_corners[i] for i, marker_id in enumerate(marker_ids) if marker_id == FOE_ID]
+
+
+def calculate_control(foe_markers, frame_center, calibration=None):
+    '''
+    Calculates error between image center and foe marker center and the X & Y motor speed eliminating it
+
+    Parameters:
+        foe_markers (dict): foe markers as returned by get_foe_markers()
+        frame_center (tuple): position of the camera's image frame center in pixels
+        calibration (CameraCalibration): camera calibration, None = error in pixels
+
+    Returns:
+        control (dict): target, error_x, error_y, motor_speed_x, motor_speed_y or None if there is no single foe
+    '''
+
+    if len(foe_markers) > 1:
+        # only without a target policy (--target_policy none), otherwise the tracker passes the engaged foe only
+        logging.warning('More than one foe detected and no target policy to pick one. Targeting procedure aborted.')
+
+    if len(foe_markers) != 1:
+        return None
+
+    return calculate_target_control(next(iter(foe_markers.values())), frame_center, calibration)
+
+
+def calculate_predicted_control(foe_markers, frame_center, tracker, timestamp, latency, calibration=None):
+    '''
+    Calculates error between image center and the foe position predicted at the time the command takes effect and
+    the X & Y motor speed eliminating it
+
+    Parameters:
+        foe_markers (dict): foe markers as returned by get_foe_markers() or MultiTargetTracker.get_target_markers()
+        frame_center (tuple): position of the camera's image frame center in pixels
+        tracker (KalmanTracker): tracker of the foe marker center
+        timestamp (float): capture time of the frame in seconds
+        latency (float): end-to-end latency in seconds from frame capture to the command taking effect
+        calibration (CameraCalibration): camera calibration, None = error in pixels
+
+    Returns:
+        control (dict): as returned by calculate_control() plus the observed foe position (None during detection
+            dropouts) or None if the foe is not tracked
+    '''
+
+    if len(foe_markers) > 1:
+        logging.warning(f'More than one foe detected. Coasting on the prediction.')
+
+    observed = next(iter(foe_markers.values())) if len(foe_markers) == 1 else None
+    if not tracker.update(observed, timestamp):
+        return None
+
+    predicted_x, predicted_y = tracker.predict(timestamp + latency)
+    control = calculate_target_control((int(round(predicted_x)), int(round(predicted_y))), frame_center, calibration)
+    control['observed'] = observed
+    return control
+
+
+def calculate_target_control(target, frame_center, calibration=None):
+    '''
+    Calculates error between image center and target and the X & Y motor speed eliminating it
+
+    Parameters:
+        target (tuple): position of the target in pixels (undistorted if calibrated)
+        frame_center (tuple): position of the camera's image frame center in pixels (undistorted if calibrated)
+        calibration (CameraCalibration): camera calibration, None = error in pixels
+
+    Returns:
+        control (dict): target, error_x, error_y, motor_speed_x, motor_speed_y, plus error_unit 'deg' if the error
+            is an angle
+    '''
+
+    # calculate distance between image center and target
+    marker_center_x, marker_center_y = target
+
+    if calibration is None:
+        error_x = marker_center_x - frame_center[0]
+        error_y = marker_center_y - frame_center[1]
+        deadzone, k_x, k_y = DEADZONE_RADIUS_IN_PIXELS, K_X, K_Y
+    else:
+        # angular error, a pixel near the edge of a wide-angle frame covers a smaller angle than one at the center
+        error_x, error_y = calibration.get_angular_error(target, frame_center)
+        error_x, error_y = round(error_x, 2), round(error_y, 2)
+        deadzone, k_x, k_y = DEADZONE_RADIUS_IN_DEGREES, K_X_PER_DEGREE, K_Y_PER_DEGREE
+
+    # calculate X & Y motor speed
+    motor_speed_x = calculate_motor_speed(error_x,
+        deadzone,
+        MIN_X_MOTOR_SPEED,
+        MAX_X_MOTOR_SPEED,
+        k_x)
+
+    motor_speed_y = calculate_motor_speed(error_y,
+        deadzone,
+        MIN_Y_MOTOR_SPEED,
+        MAX_Y_MOTOR_SPEED,
+        k_y)
+
+    logging.debug(f'X Error: {error_x}, X Speed: {motor_speed_x}')
+    logging.debug(f'Y Error: {error_y}, Y Speed: {motor_speed_y}')
+
+    control = {
+        'target': (marker_center_x, marker_center_y),
+        'error_x': error_x,
+        'error_y': error_y,
+        'motor_speed_x': motor_speed_x,
+        'motor_speed_y': motor_speed_y,
+    }
+    if calibration is not None:
+        control['error_unit'] = 'deg'
+
+    return control
+
+
+def calculate_angle_control(target_angles):
+    '''
+    Calculates the X & Y motor speed eliminating the angle between the turret boresight and the target
+
+    Parameters:
+        target_angles (tuple): horizontal and vertical angle of the target relative to the boresight in degrees
+
+    Returns:
+        control (dict): error_x, error_y (in degrees), error_unit, motor_speed_x, motor_speed_y
+    '''
+
+    error_x, error_y = round(target_angles[0], 2), round(target_angles[1], 2)
+
+    # calculate X & Y motor speed
+    motor_speed_x = calculate_motor_speed(error_x,
+        DEADZONE_RADIUS_IN_DEGREES,
+        MIN_X_MOTOR_SPEED,
+        MAX_X_MOTOR_SPEED,
+        K_X_PER_DEGREE)
+
+    motor_speed_y = calculate_motor_speed(error_y,
+        DEADZONE_RADIUS_IN_DEGREES,
+        MIN_Y_MOTOR_SPEED,
+        MAX_Y_MOTOR_SPEED,
+        K_Y_PER_DEGREE)
+
+    return {
+        'error_x': error_x,
+        'error_y': error_y,
+        'error_unit': 'deg',
+        'motor_speed_x': motor_speed_x,
+        'motor_speed_y': motor_speed_y,
+    }
+
+
+def create_control_calculator(frame_center, prediction='none', target_policy='boresight', link_latency=None,
+                              calibration=None):
+    '''
+    Creates control calculation for the markers detected in a frame. With a target policy all foes are tracked and
+    the one picked by the policy is engaged, otherwise targeting is aborted while more than one foe is visible.
+    Control acts either on the observed foe position or on the position predicted at the end-to-end latency
+    measured from frame capture until the command is issued (plus the serial link latency).
+
+    Parameters:
+        frame_center (tuple): position of the camera's image frame center in pixels
+        prediction (str): 'none' or motion model of the KalmanTracker ('cv', 'ca')
+        target_policy (str): 'none' or target policy of the MultiTargetTracker ('boresight', 'size', 'first_seen')
+        link_latency (function): returns latency in seconds from issuing the command to it taking effect
+        calibration (CameraCalibration): camera calibration, the marker corners passed to calculate have to be
+            undistorted and the error is an angle, None = error in pixels
+
+    Returns:
+        calculate (function): takes marker corners, marker IDs, the frame capture timestamp used for tracking and
+            optionally the time.monotonic() capture time used for the latency (if it differs from the timestamp,
+            e.g. for a recorded frame) and returns control (dict) or None
+    '''
+
+    if calibration is not None:
+        # aim at the frame center in the undistorted pixel coordinates of the corners
+        frame_center = tuple(float(c) for c in calibration.undistort_points([frame_center])[0])
+
+    foe_tracker = None if target_policy == 'none' else MultiTargetTracker(target_policy, frame_center)
+    tracker = None if prediction == 'none' else KalmanTracker(prediction)
+    latency_estimator = LatencyEstimator()
+
+    def calculate(marker_corners, marker_ids, timestamp, capture_time=None):
+        if foe_tracker is None:
+            foe_markers = get_foe_markers(marker_corners, marker_ids)
+        else:
+            foe_markers = foe_tracker.get_target_markers(get_foe_corners(marker_corners, marker_ids), timestamp)
+
+        if tracker is None:
+            return calculate_control(foe_markers, frame_center, calibration)
+
+        control = calculate_predicted_control(foe_markers, frame_center, tracker, timestamp, latency_estimator.latency,
+                                              calibration)
+        latency = time.monotonic() - (timestamp if capture_time is None else capture_time)
+        if link_latency is not None:
+            latency += link_latency()
+        latency_estimator.update(latency)
+        return control
+
+    calculate.foe_tracker = foe_tracker
+    calculate.tracker = tracker
+    calculate.latency_estimator = latency_estimator
+    return calculate
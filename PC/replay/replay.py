@@ -0,0 +1,273 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.frame_log import FrameLog, convert_to_frame_log, is_frame_log
+from common.markers import create_detector, get_marker_center
+from common.multi_target_tracker import TARGET_POLICIES
+from common.targeting import create_control_calculator
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+# number of frames processed by a single worker task
+DEFAULT_CHUNK_SIZE = 500
+
+# nominal frame rate of the replayed frames, the frame timestamps of the target tracking are derived from it
+REPLAY_FPS = 30.0
+
+CSV_COLUMNS = ['source', 'frame_idx', 'num_markers', 'marker_ids', 'marker_centers',
+               'target_x', 'target_y', 'error_x', 'error_y', 'motor_speed_x', 'motor_speed_y']
+
+
+# set root logger log level
+logging.getLogger().setLevel(logging.INFO)
+
+
+def get_image_paths(image_dir):
+    '''
+    Returns:
+        image_paths (list): sorted paths of all images in the directory
+    '''
+
+    return sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def split_into_tasks(sources, chunk_size):
+    '''
+    Splits video files and image directories into chunks of frames which can be processed independently
+
+    Parameters:
+        sources (list): paths of video files, image directories and raw frame logs
+        chunk_size (int): max. number of frames in a chunk
+
+    Returns:
+        tasks (list): tuples of source, first frame index and either list of image paths or number of video frames
+            (None = until the end of the video)
+    '''
+
+    tasks = []
+
+    for source in sources:
+        if os.path.isdir(source):
+            image_paths = get_image_paths(source)
+            for start in range(0, len(image_paths), chunk_size):
+                tasks.append((source, start, image_paths[start:start + chunk_size]))
+            continue
+
+        if is_frame_log(source):
+            num_frames = len(FrameLog(source))
+            for start in range(0, num_frames, chunk_size):
+                tasks.append((source, start, min(chunk_size, num_frames - start)))
+            continue
+
+        video_capture = cv2.VideoCapture(source)
+        num_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        video_capture.release()
+
+        if num_frames <= 0:
+            # frame count unknown - process the whole video in a single task
+            tasks.append((source, 0, None))
+            continue
+
+        for start in range(0, num_frames, chunk_size):
+            tasks.append((source, start, min(chunk_size, num_frames - start)))
+
+    return tasks
+
+
+def read_frames(source, start, frames):
+    '''
+    Yields frames of a single task
+    '''
+
+    if isinstance(frames, list):
+        for image_path in frames:
+            yield cv2.imread(image_path)
+        return
+
+    if is_frame_log(source):
+        # random access to the chunk, the frames are views into the mapped file
+        frame_log = FrameLog(source)
+        for frame_idx in range(start, start + frames):
+            yield frame_log[frame_idx]
+        return
+
+    video_capture = cv2.VideoCapture(source)
+    if start > 0:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    frame_idx = 0
+    while frames is None or frame_idx < frames:
+        ret, video_frame = video_capture.read()
+        if not ret:
+            break
+        yield video_frame
+        frame_idx += 1
+
+    video_capture.release()
+
+
+def process_frame(detect_markers, calculate, video_frame, timestamp):
+    '''
+    Runs the same detection and control chain as the live loop on a single frame
+
+    Parameters:
+        detect_markers (function): takes frame, returns marker corners and IDs
+        calculate (function): control calculator as created by create_control_calculator()
+        video_frame (numpy.ndarray): frame
+        timestamp (float): time of the frame in seconds
+
+    Returns:
+        row (dict): marker IDs and centers, error and motor speed (empty if there is no engaged foe)
+    '''
+
+    marker_corners, marker_ids = detect_markers(video_frame)
+    control = calculate(marker_corners, marker_ids, timestamp)
+
+    row = {
+        'num_markers': 0 if marker_ids is None else len(marker_ids),
+        'marker_ids': '' if marker_ids is None else ' '.join(str(marker_id[0]) for marker_id in marker_ids),
+        'marker_centers': ' '.join(f'{x}:{y}' for x, y in map(get_marker_center, marker_corners)),
+    }
+
+    if control is not None:
+        row['target_x'], row['target_y'] = control['target']
+        for key in ('error_x', 'error_y', 'motor_speed_x', 'motor_speed_y'):
+            row[key] = control[key]
+
+    return row
+
+
+def process_task(task, detection_scale=1.0, target_policy='boresight'):
+    '''
+    Processes a single chunk of frames, runs inside the worker process. The foes are tracked from the first frame of
+    the chunk.
+
+    Returns:
+        rows (list): one row per frame
+    '''
+
+    source, start, frames = task
+    detect_markers = create_detector(detection_scale)
+    calculate = None
+
+    rows = []
+    for frame_idx, video_frame in enumerate(read_frames(source, start, frames), start=start):
+        if video_frame is None:
+            logging.warning(f'Frame {frame_idx} of {source} could not be read')
+            continue
+
+        if calculate is None:
+            # all frames of a source have the same size
+            height, width = video_frame.shape[0:2]
+            calculate = create_control_calculator((int(width/2), int(height/2)), target_policy=target_policy)
+
+        row = process_frame(detect_markers, calculate, video_frame, frame_idx / REPLAY_FPS)
+        row['source'] = source
+        row['frame_idx'] = frame_idx
+        rows.append(row)
+
+    return rows
+
+
+def write_csv(output_path, rows):
+    with open(output_path, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_parquet(output_path, rows):
+    try:
+        import pandas as pd
+    except ImportError:
+        logging.error('Writing Parquet files requires pandas and pyarrow. Use a .csv output file instead.')
+        raise
+
+    pd.DataFrame(rows, columns=CSV_COLUMNS).to_parquet(output_path, index=False)
+
+
+def replay(sources, output_path, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE, detection_scale=1.0,
+           target_policy='boresight'):
+    '''
+    Replays recorded video files, image directories and frame logs through detection and control as fast as possible
+
+    Parameters:
+        sources (list): paths of video files, image directories and raw frame logs
+        output_path (str): path of the output .csv or .parquet file
+        jobs (int): number of worker processes, None = number of CPUs
+        chunk_size (int): max. number of frames processed by a single worker task
+        detection_scale (float): scale of the frame used for marker detection, see create_detector()
+        target_policy (str): 'none' or target policy of the MultiTargetTracker, see create_control_calculator()
+
+    Returns:
+        rows (list): one row per frame, ordered by source and frame index
+    '''
+
+    tasks = split_into_tasks(sources, chunk_size)
+    logging.info(f'Replaying {len(sources)} source(s) in {len(tasks)} task(s)...')
+
+    start_time = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for task_rows in executor.map(process_task, tasks, [detection_scale] * len(tasks),
+                                      [target_policy] * len(tasks)):
+            rows.extend(task_rows)
+    elapsed_time = time.perf_counter() - start_time
+
+    logging.info(f'Processed {len(rows)} frames in {elapsed_time:.2f} s ({len(rows) / max(elapsed_time, 1e-9):.1f} FPS)')
+
+    if output_path.lower().endswith('.parquet'):
+        write_parquet(output_path, rows)
+    else:
+        write_csv(output_path, rows)
+    logging.info(f'Results written to {output_path}')
+
+    return rows
+
+
+def main():
+
+    logging.info('Replay App')
+
+    # input arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="+",
+                    help="video files, image directories and/or raw frame logs")
+    parser.add_argument("-o", "--output", default="replay.csv",
+                    help="output .csv or .parquet file")
+    parser.add_argument("-j", "--jobs", default=None, type=int,
+                    help="number of worker processes, default = number of CPUs")
+    parser.add_argument("--chunk_size", default=DEFAULT_CHUNK_SIZE, type=int,
+                    help="max. number of frames processed by a single worker task")
+    parser.add_argument("-s", "--detection_scale", default=1.0, type=float,
+                    help="scale of the frame used for marker detection in range (0, 1], 0 = automatic")
+    parser.add_argument("--target_policy", default="boresight", choices=("none",) + TARGET_POLICIES,
+                    help="track all foes and engage the one picked by the policy as the live loop, none = no control "
+                         "if there is more than one foe")
+    parser.add_argument("--to_frame_log", default=None,
+                    help="convert the video source to a raw frame log with random access instead of replaying it")
+    args = parser.parse_args()
+
+    if args.to_frame_log is not None:
+        video_capture = cv2.VideoCapture(args.sources[0])
+        frames_written = convert_to_frame_log(video_capture, args.to_frame_log)
+        video_capture.release()
+        logging.info(f'Wrote {frames_written} frames to {args.to_frame_log}')
+        return
+
+    replay(args.sources, args.output, args.jobs, args.chunk_size, args.detection_scale, args.target_policy)
+    logging.info('DONE')
+
+
+if __name__ == "__main__":
+    main()
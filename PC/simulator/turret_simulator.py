@@ -0,0 +1,356 @@
+import argparse
+import itertools
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.markers import get_marker_center
+import common.targeting as targeting
+import pc_control.pc_control as pc_control
+
+
+# virtual camera
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+CAMERA_HORIZONTAL_FOV_IN_DEGREES = 60.0
+CAMERA_FPS = 30
+MARKER_SIZE_IN_DEGREES = 3.0
+
+# pan/tilt plant
+MAX_MOTOR_SPEED_IN_DEGREES_PER_SECOND = 90.0
+MOTOR_DEADBAND_PWM = 60
+MOTOR_TIME_CONSTANT_IN_SECONDS = 0.05
+
+# serial link
+BAUD_RATE = 9600
+BITS_PER_BYTE = 10
+
+# detection + processing latency between frame capture and sending the command
+PROCESSING_LATENCY_IN_SECONDS = 0.03
+
+SIMULATION_TIME_IN_SECONDS = 10.0
+
+
+# set root logger log level
+logging.getLogger().setLevel(logging.INFO)
+
+
+def get_default_controller_settings():
+    '''
+    Returns:
+        settings (dict): controller settings currently used by pc_control.py (see common/targeting.py)
+    '''
+
+    return {
+        'deadzone': targeting.DEADZONE_RADIUS_IN_PIXELS,
+        'min_motor_speed': targeting.MIN_X_MOTOR_SPEED,
+        'max_motor_speed': targeting.MAX_X_MOTOR_SPEED,
+        'k': targeting.K_X,
+    }
+
+
+class SimulatedTurret:
+    '''
+    Pan/tilt turret driven by the serial command stream sent to the Arduino
+
+    Behaves like a write-only serial port: every DC command written is parsed and applied to the motors once it has
+    been transmitted over the simulated serial link. Motors have a PWM deadband, PWM saturation and first-order
+    dynamics.
+    '''
+
+    def __init__(self, max_speed=MAX_MOTOR_SPEED_IN_DEGREES_PER_SECOND, deadband=MOTOR_DEADBAND_PWM,
+                 time_constant=MOTOR_TIME_CONSTANT_IN_SECONDS, baud_rate=BAUD_RATE):
+        '''
+        Parameters:
+            max_speed (float): motor speed at PWM 255 in degrees per second
+            deadband (int): PWM below which the motor does not move
+            time_constant (float): motor time constant in seconds
+            baud_rate (int): serial link speed
+        '''
+
+        self.max_speed = max_speed
+        self.deadband = deadband
+        self.time_constant = time_constant
+        self.baud_rate = baud_rate
+
+        # simulation time, set by the simulator
+        self.time = 0.0
+
+        self.pose = np.zeros(2)
+        self.velocity = np.zeros(2)
+        self.pwm = np.zeros(2)
+        self.gun_on = False
+
+        self.buffer = b''
+        self.link_busy_until = 0.0
+        self.pending_commands = []
+        self.commands_received = 0
+        self.bytes_received = 0
+
+    def write(self, data):
+        '''
+        Receives bytes sent to the Arduino at the current simulation time
+        '''
+
+        self.bytes_received += len(data)
+
+        # bytes are transmitted one after another over the serial link
+        transmission_start = max(self.time, self.link_busy_until)
+        self.link_busy_until = transmission_start + len(data) * BITS_PER_BYTE / self.baud_rate
+
+        self.buffer += bytes(data)
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            self.pending_commands.append((self.link_busy_until, line.decode()))
+            self.commands_received += 1
+
+        return len(data)
+
+    def execute_command(self, command):
+        if command == 'GUN_ON':
+            self.gun_on = True
+        elif command == 'GUN_OFF':
+            self.gun_on = False
+        elif command.startswith('DC '):
+            motor_speed_x, motor_speed_y = command.split()[1:3]
+            # PWM saturation of the motor shield
+            self.pwm = np.clip([int(float(motor_speed_x)), int(float(motor_speed_y))], -255, 255)
+
+    def advance(self, dt):
+        '''
+        Advances the motors by dt seconds at constant PWM (exact solution of the first-order dynamics)
+        '''
+
+        target_velocity = np.where(np.abs(self.pwm) < self.deadband, 0.0, self.pwm / 255 * self.max_speed)
+        decay = np.exp(-dt / self.time_constant)
+        self.pose += target_velocity * dt + (self.velocity - target_velocity) * self.time_constant * (1 - decay)
+        self.velocity = target_velocity + (self.velocity - target_velocity) * decay
+        self.time += dt
+
+    def step(self, duration):
+        '''
+        Advances the simulation by duration seconds, applying received commands at their arrival time
+        '''
+
+        end_time = self.time + duration
+        while self.pending_commands and self.pending_commands[0][0] <= end_time:
+            arrival_time, command = self.pending_commands.pop(0)
+            self.advance(max(0.0, arrival_time - self.time))
+            self.execute_command(command)
+
+        self.advance(end_time - self.time)
+
+
+def create_scenario(rng, max_offset=20.0, max_target_speed=10.0):
+    '''
+    Creates a random target scenario
+
+    Returns:
+        scenario (dict): target start position in degrees relative to the turret and target velocity in degrees per
+            second
+    '''
+
+    return {
+        'target_start': rng.uniform(-max_offset, max_offset, size=2).tolist(),
+        'target_velocity': rng.uniform(-max_target_speed, max_target_speed, size=2).tolist(),
+    }
+
+
+def project_target(target_angle, turret_pose):
+    '''
+    Projects the target into the virtual camera attached to the turret
+
+    Returns:
+        marker_corners (list): marker corners as returned by detectMarkers() or empty if the target is not visible
+    '''
+
+    pixels_per_degree = CAMERA_WIDTH / CAMERA_HORIZONTAL_FOV_IN_DEGREES
+    center = np.array([CAMERA_WIDTH / 2, CAMERA_HEIGHT / 2]) + (target_angle - turret_pose) * pixels_per_degree
+    if not (0 <= center[0] < CAMERA_WIDTH and 0 <= center[1] < CAMERA_HEIGHT):
+        return []
+
+    half_size = MARKER_SIZE_IN_DEGREES * pixels_per_degree / 2
+    corners = center + np.array([[-half_size, -half_size], [half_size, -half_size], [half_size, half_size],
+                                 [-half_size, half_size]])
+    return [corners.reshape(1, 4, 2).astype(np.float32)]
+
+
+def simulate(settings, scenario, simulation_time=SIMULATION_TIME_IN_SECONDS, fps=CAMERA_FPS,
+             latency=PROCESSING_LATENCY_IN_SECONDS):
+    '''
+    Runs the closed loop: virtual camera -> error -> calculate_motor_speed -> serial command -> turret -> camera
+
+    Parameters:
+        settings (dict): deadzone, min_motor_speed, max_motor_speed and k used for both axes
+        scenario (dict): as returned by create_scenario()
+        simulation_time (float): simulated time in seconds
+        fps (float): camera frame rate
+        latency (float): time between frame capture and sending of the command in seconds
+
+    Returns:
+        metrics (dict): time to lock, overshoot, settling time (None if not reached) and command rate
+    '''
+
+    turret = SimulatedTurret()
+    frame_center = (int(CAMERA_WIDTH/2), int(CAMERA_HEIGHT/2))
+    pixels_per_degree = CAMERA_WIDTH / CAMERA_HORIZONTAL_FOV_IN_DEGREES
+
+    target_start = np.array(scenario['target_start'])
+    target_velocity = np.array(scenario['target_velocity'])
+
+    initial_error = None
+    time_to_lock = None
+    last_unlocked_time = 0.0
+    overshoot = 0.0
+
+    frame_period = 1 / fps
+    for frame_idx in range(int(simulation_time * fps)):
+        capture_time = frame_idx * frame_period
+        target_angle = target_start + target_velocity * capture_time
+        marker_corners = project_target(target_angle, turret.pose)
+
+        # the command is sent after the frame has been processed
+        turret.step(latency)
+
+        if marker_corners:
+            marker_center = np.array(get_marker_center(marker_corners[0]))
+            error = marker_center - frame_center
+            if initial_error is None:
+                initial_error = error
+
+            motor_speed_x = targeting.calculate_motor_speed(int(error[0]), settings['deadzone'],
+                settings['min_motor_speed'], settings['max_motor_speed'], settings['k'])
+            motor_speed_y = targeting.calculate_motor_speed(int(error[1]), settings['deadzone'],
+                settings['min_motor_speed'], settings['max_motor_speed'], settings['k'])
+            pc_control.send_motor_x_y_speed(turret, motor_speed_x, motor_speed_y)
+
+            locked = np.linalg.norm(error) <= settings['deadzone']
+            if locked and time_to_lock is None:
+                time_to_lock = capture_time
+            if not locked:
+                last_unlocked_time = capture_time + frame_period
+
+            # overshoot: error on the opposite side of the initial error
+            overshoot_pixels = -error * np.sign(initial_error)
+            overshoot = max(overshoot, float(np.max(overshoot_pixels)))
+        else:
+            # target out of view - stop the motors
+            pc_control.send_motor_x_y_speed(turret, 0, 0)
+            last_unlocked_time = capture_time + frame_period
+
+        turret.step(frame_period - latency)
+
+    settled = last_unlocked_time < simulation_time
+
+    return {
+        'time_to_lock': time_to_lock,
+        'overshoot': overshoot / pixels_per_degree,
+        'settling_time': last_unlocked_time if settled else None,
+        'command_rate': turret.commands_received / simulation_time,
+        'byte_rate': turret.bytes_received / simulation_time,
+    }
+
+
+def evaluate_settings(settings, scenarios):
+    '''
+    Runs all scenarios with the given controller settings
+
+    Returns:
+        result (dict): settings, ratio of settled scenarios and mean metrics over the settled scenarios
+    '''
+
+    metrics = [simulate(settings, scenario) for scenario in scenarios]
+    settled = [m for m in metrics if m['settling_time'] is not None]
+
+    def mean(key, items):
+        values = [m[key] for m in items if m[key] is not None]
+        return float(np.mean(values)) if values else None
+
+    return {
+        'settings': settings,
+        'settled_ratio': len(settled) / len(metrics),
+        'time_to_lock': mean('time_to_lock', metrics),
+        'settling_time': mean('settling_time', settled),
+        'overshoot': mean('overshoot', metrics),
+        'command_rate': mean('command_rate', metrics),
+    }
+
+
+def sweep(settings_grid, num_scenarios, seed=0, jobs=None):
+    '''
+    Evaluates all combinations of controller settings on the same random scenarios
+
+    Parameters:
+        settings_grid (dict): key = setting name, value = list of values to try
+        num_scenarios (int): number of random scenarios per settings combination
+        seed (int): random seed of the scenarios
+        jobs (int): number of worker processes, None = number of CPUs
+
+    Returns:
+        results (list): as returned by evaluate_settings(), fastest converging settings first
+    '''
+
+    rng = np.random.default_rng(seed)
+    scenarios = [create_scenario(rng) for i in range(num_scenarios)]
+
+    names = list(settings_grid)
+    all_settings = [dict(zip(names, values)) for values in itertools.product(*settings_grid.values())]
+    # min. motor speed has to be smaller than max. motor speed (see calculate_motor_speed())
+    all_settings = [s for s in all_settings if s['min_motor_speed'] < s['max_motor_speed']]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(evaluate_settings, all_settings, [scenarios] * len(all_settings)))
+
+    # all scenarios settled first, then the fastest settling
+    results.sort(key=lambda r: (-r['settled_ratio'], r['settling_time'] if r['settling_time'] is not None else np.inf))
+    return results
+
+
+def main():
+
+    logging.info('Turret Simulator')
+
+    default_settings = get_default_controller_settings()
+
+    # input arguments parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--scenarios", default=100, type=int,
+                    help="number of random scenarios per settings combination")
+    parser.add_argument("--seed", default=0, type=int,
+                    help="random seed of the scenarios")
+    parser.add_argument("-j", "--jobs", default=None, type=int,
+                    help="number of worker processes, default = number of CPUs")
+    parser.add_argument("--k", nargs="+", default=[default_settings['k']], type=float,
+                    help="proportional constants to try")
+    parser.add_argument("--min_motor_speed", nargs="+", default=[default_settings['min_motor_speed']], type=int,
+                    help="min. motor speeds to try")
+    parser.add_argument("--max_motor_speed", nargs="+", default=[default_settings['max_motor_speed']], type=int,
+                    help="max. motor speeds to try")
+    parser.add_argument("--deadzone", nargs="+", default=[default_settings['deadzone']], type=int,
+                    help="deadzone radii in pixels to try")
+    args = parser.parse_args()
+
+    settings_grid = {
+        'deadzone': args.deadzone,
+        'min_motor_speed': args.min_motor_speed,
+        'max_motor_speed': args.max_motor_speed,
+        'k': args.k,
+    }
+
+    start_time = time.perf_counter()
+    results = sweep(settings_grid, args.scenarios, args.seed, args.jobs)
+    elapsed_time = time.perf_counter() - start_time
+
+    logging.info(f'Simulated {len(results) * args.scenarios} scenarios in {elapsed_time:.1f} s')
+    for result in results[:10]:
+        logging.info(f'{result}')
+    logging.info(f'Best settings: {results[0]["settings"]}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import sys
+import time
+sys.path.append('.')
+from common.annotation import RenderThrottle
+
+
+def test_render_throttle_render_every():
+    render_throttle = RenderThrottle(render_every=3)
+    rendered = [render_throttle.should_render() for i in range(9)]
+    assert rendered == [True, False, False] * 3
+    assert render_throttle.frames_rendered == 3
+
+
+def test_render_throttle_headless():
+    render_throttle = RenderThrottle(headless=True)
+    assert not any(render_throttle.should_render() for i in range(10))
+    assert render_throttle.frames_rendered == 0
+
+
+def test_render_throttle_render_fps():
+    RENDER_FPS = 10
+
+    render_throttle = RenderThrottle(render_fps=RENDER_FPS)
+    assert render_throttle.should_render()
+    assert not render_throttle.should_render()
+
+    time.sleep(1 / RENDER_FPS)
+    assert render_throttle.should_render()
@@ -0,0 +1,63 @@
+import sys
+sys.path.append('.')
+import os
+
+import numpy as np
+from common.asset_bundle import load_asset_bundle, load_or_build_asset_bundle
+from common.overlay import composite_overlay
+from common.control_app import IMAGES_DIR, load_ar_images
+from common.targeting import FOE_ID, FRIENDLY_ID
+
+SOURCE_PATHS = [os.path.join(IMAGES_DIR, 'friendly.png'), os.path.join(IMAGES_DIR, 'foe.png')]
+MARKER_CORNERS = np.array([[200, 150], [330, 170], [320, 300], [190, 280]], dtype=np.float32)
+
+
+def test_bundle_round_trip(tmp_path):
+    bundle_path = str(tmp_path / 'overlay_assets.bundle')
+    expected = load_ar_images()
+
+    # first load builds the bundle from the images
+    load_or_build_asset_bundle(load_ar_images, SOURCE_PATHS, bundle_path)
+    ar_images = load_asset_bundle(bundle_path, SOURCE_PATHS)
+
+    assert set(ar_images) == {FOE_ID, FRIENDLY_ID}
+    for marker_id, asset in ar_images.items():
+        # arrays are memory-mapped, not copied
+        assert isinstance(asset.img, np.memmap)
+        assert np.array_equal(asset.img, expected[marker_id].img)
+        assert np.array_equal(asset.mask, expected[marker_id].mask)
+        assert np.array_equal(asset.corners, expected[marker_id].corners)
+
+    # memory-mapped assets can be composited directly
+    display_frame = np.full((480, 640, 3), 100, dtype=np.uint8)
+    assert np.array_equal(composite_overlay(display_frame.copy(), ar_images[FOE_ID], MARKER_CORNERS),
+                          composite_overlay(display_frame.copy(), expected[FOE_ID], MARKER_CORNERS))
+
+
+def test_stale_bundle_is_rebuilt(tmp_path):
+    bundle_path = str(tmp_path / 'overlay_assets.bundle')
+    source_path = str(tmp_path / 'foe.png')
+    with open(SOURCE_PATHS[1], 'rb') as src, open(source_path, 'wb') as dst:
+        dst.write(src.read())
+
+    loads = []
+    def load():
+        loads.append(1)
+        return load_ar_images()
+
+    load_or_build_asset_bundle(load, [source_path], bundle_path)
+    load_or_build_asset_bundle(load, [source_path], bundle_path)
+    assert len(loads) == 1
+
+    # source image changed - bundle is rebuilt
+    with open(source_path, 'ab') as dst:
+        dst.write(b'\0')
+    assert load_asset_bundle(bundle_path, [source_path]) is None
+    load_or_build_asset_bundle(load, [source_path], bundle_path)
+    assert len(loads) == 2
+
+    # corrupted bundle is rebuilt
+    with open(bundle_path, 'r+b') as bundle_file:
+        bundle_file.write(b'XXXX')
+    load_or_build_asset_bundle(load, [source_path], bundle_path)
+    assert len(loads) == 3
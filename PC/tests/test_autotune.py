@@ -0,0 +1,64 @@
+import sys
+sys.path.append('.')
+import numpy as np
+from autotune.autotune import (PARAMETER_SPACE, autotune, count_detected, evaluate, generate_candidates,
+                               load_synthetic_frames)
+from common.markers import (create_detector, get_detector_parameters, load_detector_parameters,
+                            save_detector_parameters)
+
+NUM_FRAMES = 6
+
+
+def test_generate_candidates_starts_with_defaults_and_is_valid():
+    candidates = generate_candidates(20, seed=1)
+
+    assert len(candidates) == 20
+    assert candidates[0] == get_detector_parameters()
+    assert len({tuple(candidate.items()) for candidate in candidates}) == 20
+    for candidate in candidates[1:]:
+        assert candidate['adaptiveThreshWinSizeMin'] <= candidate['adaptiveThreshWinSizeMax']
+        assert all(candidate[name] in values for name, values in PARAMETER_SPACE.items())
+
+
+def test_count_detected_matches_id_and_position():
+    corners = np.array([[10, 10], [50, 10], [50, 50], [10, 50]], dtype=np.float32)
+    labels = [(0, corners), (1, corners + 100)]
+
+    marker_corners = (corners.reshape(1, 4, 2), (corners + 1).reshape(1, 4, 2), (corners + 300).reshape(1, 4, 2))
+    marker_ids = np.array([[0], [1], [2]])
+
+    # ID 1 is detected at the position of ID 0, ID 2 is not labelled
+    assert count_detected(labels, marker_corners, marker_ids) == (1, 2)
+    assert count_detected(labels, (), None) == (0, 0)
+
+
+def test_evaluate_prunes_candidates_missing_the_recall():
+    frames = load_synthetic_frames(NUM_FRAMES, width=640, height=360)
+
+    result = evaluate(frames, get_detector_parameters(), min_recall=0.9)
+    assert result['recall'] >= 0.9
+    assert not result['pruned']
+    assert result['time_per_frame'] > 0
+
+    # markers are smaller than the min. perimeter
+    result = evaluate(frames, {'minMarkerPerimeterRate': 3.0, 'maxMarkerPerimeterRate': 4.0}, min_recall=0.9)
+    assert result['recall'] == 0
+    assert result['pruned']
+
+
+def test_autotune_result_is_loadable(tmp_path):
+    frames = load_synthetic_frames(NUM_FRAMES, width=640, height=360)
+
+    best, results = autotune(frames, min_recall=0.9, num_candidates=5)
+    assert len(results) == 5
+    assert best['recall'] >= 0.9
+    assert best['time_per_frame'] <= results[0]['time_per_frame']
+
+    path = str(tmp_path / 'detector_params.json')
+    save_detector_parameters(path, best['parameters'], {'recall': best['recall']})
+    detector_parameters = load_detector_parameters(path)
+    assert detector_parameters == best['parameters']
+
+    video_frame, labels = frames[0]
+    marker_corners, marker_ids = create_detector(1.0, detector_parameters)(video_frame)
+    assert count_detected(labels, marker_corners, marker_ids)[0] >= 1
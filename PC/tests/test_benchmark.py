@@ -0,0 +1,34 @@
+import os
+import sys
+sys.path.append('.')
+import pytest
+from benchmarks.benchmark import (DEFAULT_TOLERANCE, STAGES, find_regressions, load_baseline, run_benchmarks)
+
+# timing benchmarks are slow and machine dependent, run them only on request:
+#   BENCHMARK=1 pytest tests/test_benchmark.py
+# optionally with custom tolerance, e.g. BENCHMARK_TOLERANCE=0.25
+run_benchmark = pytest.mark.skipif(not os.environ.get('BENCHMARK'), reason='set BENCHMARK=1 to run benchmarks')
+
+
+def test_find_regressions():
+    baseline = {'results': {'VGA 1 markers': {'detect': 2.0, 'command': 0.01}}}
+
+    benchmark = {'results': {'VGA 1 markers': {'detect': 2.5, 'command': 0.03}}}
+    assert find_regressions(benchmark, baseline, tolerance=0.5) == []
+
+    # relative slow down of very fast stages below the absolute threshold is ignored
+    benchmark = {'results': {'VGA 1 markers': {'detect': 3.5, 'command': 0.03}}}
+    assert len(find_regressions(benchmark, baseline, tolerance=0.5)) == 1
+
+
+def test_baseline_covers_all_stages():
+    baseline = load_baseline()
+    for name, stages in baseline['results'].items():
+        assert set(stages) == set(STAGES), name
+
+
+@run_benchmark
+def test_no_stage_regressed():
+    tolerance = float(os.environ.get('BENCHMARK_TOLERANCE', DEFAULT_TOLERANCE))
+    regressions = find_regressions(run_benchmarks(), load_baseline(), tolerance)
+    assert regressions == []
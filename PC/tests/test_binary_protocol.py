@@ -0,0 +1,116 @@
+import sys
+sys.path.append('.')
+import time
+
+import pytest
+import serial
+from common.binary_protocol import (OPCODE_GUN_ON, OPCODE_MOTOR, BinaryProtocolPort, FrameDecoder, crc8,
+    decode_motor_x_y_speed, encode_frame, encode_motor_x_y_speed, negotiate_baud_rate)
+from pc_control.pc_control import open_arduino_serial_port, send_gun_on, send_motor_x_y_speed, send_pull_trigger
+
+if sys.platform == 'win32':
+    pytest.skip('pseudo-terminals are not available on Windows', allow_module_level=True)
+
+from common.arduino_emulator import ArduinoEmulator
+
+
+EMULATOR_TIMEOUT_IN_SECONDS = 2.0
+
+
+def wait_for_commands(emulator, num_commands):
+    end_time = time.monotonic() + EMULATOR_TIMEOUT_IN_SECONDS
+    while len(emulator.commands) < num_commands and time.monotonic() < end_time:
+        time.sleep(0.005)
+    return emulator.commands
+
+
+def test_crc8_check_value():
+    # CRC-8 (polynomial 0x07) check value
+    assert crc8(b'123456789') == 0xF4
+
+
+def test_motor_frame_round_trip():
+    frame = encode_motor_x_y_speed(120, -255)
+
+    # sync, version/opcode, 2 x int16, CRC8
+    assert len(frame) == 7
+    assert len(frame) < len(b'DC 120 -255\n')
+
+    frames = FrameDecoder().feed(frame)
+    assert len(frames) == 1
+    opcode, payload = frames[0]
+    assert opcode == OPCODE_MOTOR
+    assert decode_motor_x_y_speed(payload) == (120, -255)
+
+    # speeds are saturated to the PWM range
+    assert decode_motor_x_y_speed(FrameDecoder().feed(encode_motor_x_y_speed(1000, -1000))[0][1]) == (255, -255)
+
+
+def test_corrupted_frames_are_rejected():
+    frame = bytearray(encode_motor_x_y_speed(120, -255))
+    decoder = FrameDecoder()
+
+    for i in range(1, len(frame)):
+        corrupted = frame.copy()
+        corrupted[i] ^= 0x10
+        assert decoder.feed(corrupted) == []
+
+    assert decoder.frames_rejected == len(frame) - 1
+
+    # decoder resynchronizes on the next valid frame, also after garbage
+    assert decoder.feed(b'\x00\x13' + encode_frame(OPCODE_GUN_ON)) == [(OPCODE_GUN_ON, b'')]
+
+
+def test_binary_protocol_port_translates_commands():
+    serial_port = serial.serial_for_url('loop://', timeout=0.1)
+    binary_port = BinaryProtocolPort(serial_port)
+
+    send_gun_on(binary_port)
+    send_motor_x_y_speed(binary_port, 120.0, -100)
+    send_pull_trigger(binary_port)
+
+    frames = FrameDecoder().feed(serial_port.read(100))
+    assert [opcode for opcode, payload in frames] == [OPCODE_GUN_ON, OPCODE_MOTOR, 0x4]
+    assert decode_motor_x_y_speed(frames[1][1]) == (120, -100)
+
+
+def test_ascii_commands_on_emulated_device():
+    with ArduinoEmulator() as emulator:
+        arduino_serial_port = open_arduino_serial_port(emulator.port)
+
+        send_motor_x_y_speed(arduino_serial_port, 120, -255)
+        assert wait_for_commands(emulator, 1) == ['DC 120 -255']
+
+        arduino_serial_port.close()
+
+
+def test_binary_commands_on_emulated_device():
+    with ArduinoEmulator() as emulator:
+        arduino_serial_port = open_arduino_serial_port(emulator.port, binary_protocol=True, baud_rate=115200)
+        assert emulator.baud_rate == 115200
+        assert arduino_serial_port.baudrate == 115200
+
+        send_gun_on(arduino_serial_port)
+        send_motor_x_y_speed(arduino_serial_port, 120, -255)
+        arduino_serial_port.flush()
+
+        # corrupted frame is not executed
+        binary_port = arduino_serial_port.serial_port
+        binary_port.serial_port.write(encode_motor_x_y_speed(1, 1)[:-1] + b'\x00')
+        send_motor_x_y_speed(arduino_serial_port, -100, 100)
+
+        assert wait_for_commands(emulator, 4) == ['BAUD 115200', 'GUN_ON', 'DC 120 -255', 'DC -100 100']
+        assert emulator.frames_rejected == 1
+        assert emulator.gun_on
+        assert (emulator.motor_speed_x, emulator.motor_speed_y) == (-100, 100)
+
+        arduino_serial_port.close()
+
+
+def test_baud_rate_negotiation_timeout():
+    serial_port = serial.serial_for_url('loop://', timeout=None)
+
+    # nobody acknowledges the request
+    assert not negotiate_baud_rate(serial_port, 115200, timeout=0.1)
+    assert serial_port.baudrate == 9600
+    assert serial_port.timeout is None
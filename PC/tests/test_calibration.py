@@ -0,0 +1,119 @@
+import sys
+sys.path.append('.')
+import cv2
+import numpy as np
+from common.calibration import (CameraCalibration, calibrate_charuco, create_charuco_board, detect_charuco_corners,
+                                draw_charuco_board, get_calibration_path, load_camera_calibration)
+from common.targeting import DEADZONE_RADIUS_IN_DEGREES, calculate_target_control
+
+WIDTH, HEIGHT = 640, 480
+CAMERA_MATRIX = np.array([[500.0, 0, 320], [0, 500.0, 240], [0, 0, 1]])
+DIST_COEFFS = np.array([-0.3, 0.1, 0, 0, 0])
+
+
+def render_board_views(board, num_views=12):
+    '''
+    Renders the board at different poses as seen by a distortion-free camera with CAMERA_MATRIX
+    '''
+
+    squares_x, squares_y = board.getChessboardSize()
+    board_width, board_height = squares_x * board.getSquareLength(), squares_y * board.getSquareLength()
+    board_image = draw_charuco_board(board, squares_x * 100, squares_y * 100)
+    # board image pixels to board coordinates in meters
+    pixel_to_board = np.diag([board_width / board_image.shape[1], board_height / board_image.shape[0], 1.0])
+
+    views = []
+    rng = np.random.default_rng(0)
+    for i in range(num_views):
+        rvec = np.radians(rng.uniform(-25, 25, 3)) * (1, 1, 0.5)
+        rotation, jacobian = cv2.Rodrigues(rvec)
+        tvec = np.array([-board_width / 2 + rng.uniform(-0.05, 0.05), -board_height / 2 + rng.uniform(-0.04, 0.04),
+                         rng.uniform(0.45, 0.6)])
+        homography = CAMERA_MATRIX @ np.column_stack([rotation[:, 0], rotation[:, 1], tvec]) @ pixel_to_board
+        views.append(cv2.warpPerspective(board_image, homography, (WIDTH, HEIGHT), borderValue=255))
+
+    return views
+
+
+def test_calibrate_charuco_recovers_camera_matrix():
+    board = create_charuco_board()
+
+    all_charuco_corners, all_charuco_ids = [], []
+    for view in render_board_views(board):
+        charuco_corners, charuco_ids = detect_charuco_corners(view, board)
+        assert charuco_corners is not None
+        all_charuco_corners.append(charuco_corners)
+        all_charuco_ids.append(charuco_ids)
+
+    calibration = calibrate_charuco(all_charuco_corners, all_charuco_ids, board, WIDTH, HEIGHT)
+
+    assert calibration.rms < 1.0
+    assert np.allclose(calibration.focal_length, CAMERA_MATRIX[[0, 1], [0, 1]], rtol=0.03)
+    assert np.allclose(calibration.principal_point, CAMERA_MATRIX[[0, 1], [2, 2]], atol=10)
+
+
+def test_undistort_and_distort_points_round_trip():
+    calibration = CameraCalibration(CAMERA_MATRIX, DIST_COEFFS, WIDTH, HEIGHT)
+    points = np.array([[320, 240], [10, 10], [600, 400], [100, 300]], dtype=np.float32)
+
+    undistorted_points = calibration.undistort_points(points)
+    # barrel distortion pulls the edges towards the center
+    assert np.allclose(undistorted_points[0], points[0], atol=1e-3)
+    assert np.linalg.norm(undistorted_points[1] - (320, 240)) > np.linalg.norm(points[1] - (320, 240))
+
+    assert np.allclose(calibration.distort_points(undistorted_points), points, atol=0.05)
+
+    marker_corners = (points.reshape(1, 4, 2),)
+    assert np.allclose(calibration.undistort_corners(marker_corners)[0].reshape(4, 2), undistorted_points)
+    assert calibration.undistort_corners(()) == ()
+
+
+def test_angular_error_is_independent_of_position():
+    calibration = CameraCalibration(CAMERA_MATRIX, DIST_COEFFS, WIDTH, HEIGHT)
+
+    # 10 degrees to the right of the frame center and of a point near the edge
+    assert np.allclose(calibration.get_angular_error((320 + 500 * np.tan(np.radians(10)), 240), (320, 240)), (10, 0))
+    edge = 320 + 500 * np.tan(np.radians(30))
+    target = 320 + 500 * np.tan(np.radians(40))
+    error_x, error_y = calibration.get_angular_error((target, 240), (edge, 240))
+    assert np.isclose(error_x, 10)
+
+    control = calculate_target_control((int(round(target)), 240), (edge, 240), calibration)
+    assert control['error_unit'] == 'deg'
+    assert abs(control['error_x'] - 10) < 0.1
+    assert control['motor_speed_x'] > 0
+    # inside the angular deadzone
+    assert control['motor_speed_y'] == 0
+    assert calibration.angle_to_pixels(DEADZONE_RADIUS_IN_DEGREES) == round(500 * np.tan(np.radians(5)))
+
+
+def test_calibration_save_load_and_scale(tmp_path):
+    calibration = CameraCalibration(CAMERA_MATRIX, DIST_COEFFS, WIDTH, HEIGHT, rms=0.25)
+    path = get_calibration_path(0, WIDTH, HEIGHT, str(tmp_path))
+    calibration.save(path)
+
+    loaded = load_camera_calibration(None, 0, WIDTH, HEIGHT, str(tmp_path))
+    assert np.allclose(loaded.camera_matrix, CAMERA_MATRIX)
+    assert np.allclose(loaded.dist_coeffs, DIST_COEFFS)
+    assert loaded.rms == 0.25
+
+    # no cached calibration for another camera or for a synthetic scene
+    assert load_camera_calibration(None, 1, WIDTH, HEIGHT, str(tmp_path)) is None
+    assert load_camera_calibration(None, None, WIDTH, HEIGHT, str(tmp_path)) is None
+
+    scaled = load_camera_calibration(path, None, WIDTH * 2, HEIGHT * 2)
+    assert np.allclose(scaled.focal_length, (1000, 1000))
+    assert np.allclose(scaled.principal_point, (640, 480))
+
+
+def test_undistort_preview_reuses_maps_and_buffer():
+    calibration = CameraCalibration(CAMERA_MATRIX, DIST_COEFFS, WIDTH, HEIGHT)
+    video_frame = np.full((HEIGHT, WIDTH, 3), 128, dtype=np.uint8)
+    display_frame = np.empty_like(video_frame)
+
+    maps = calibration.get_preview_maps()
+    undistorted_frame = calibration.undistort_preview(video_frame, dst=display_frame)
+
+    assert calibration.get_preview_maps() is maps
+    assert undistorted_frame is display_frame or np.shares_memory(undistorted_frame, display_frame)
+    assert display_frame[HEIGHT // 2, WIDTH // 2, 0] == 128
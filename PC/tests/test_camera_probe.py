@@ -0,0 +1,123 @@
+import sys
+sys.path.append('.')
+import threading
+import time
+
+import cv2
+import numpy as np
+from common.camera_probe import CameraManager
+
+
+class FakeCapture:
+    '''
+    Camera which takes open_time seconds to deliver the first frame
+    '''
+
+    def __init__(self, size, open_time):
+        self.size = size
+        self.open_time = open_time
+        self.released = False
+
+    def read(self):
+        time.sleep(self.open_time)
+        if self.size is None:
+            return False, None
+        return True, np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.size[0], cv2.CAP_PROP_FRAME_HEIGHT: self.size[1]}[prop]
+
+    def release(self):
+        self.released = True
+
+
+class FakeCameras:
+    # camera 0 and 2 are available, 1 is not, 3 hangs
+    CAMERAS = {0: ((1280, 720), 0.2), 1: (None, 0.2), 2: ((640, 480), 0.2), 3: ((1920, 1080), 1.5)}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = []
+
+    def open(self, camera_idx):
+        size, open_time = self.CAMERAS[camera_idx]
+        capture = FakeCapture(size, open_time)
+        with self.lock:
+            self.opened.append(capture)
+        return capture
+
+
+def test_parallel_probing_with_timeout(tmp_path):
+    cameras = FakeCameras()
+    manager = CameraManager(cameras.open, cache_path=str(tmp_path / 'cameras.json'), list_devices=lambda: ['video0'],
+                            timeout=0.5)
+
+    start_time = time.perf_counter()
+    found = manager.get_cameras(max_idx=3)
+
+    # probes run in parallel and the hanging camera does not delay the startup
+    assert time.perf_counter() - start_time < 0.8
+    assert found == {0: (1280, 720), 2: (640, 480)}
+
+    # late probe and unavailable camera are released
+    time.sleep(1.5)
+    assert all(capture.released for capture in cameras.opened if capture.size in ((1920, 1080), None))
+
+
+def test_probed_handle_is_reused():
+    cameras = FakeCameras()
+    manager = CameraManager(cameras.open, cache_path=None, timeout=0.5)
+    manager.get_cameras(max_idx=2)
+    opened = len(cameras.opened)
+
+    capture = manager.open(2)
+    assert len(cameras.opened) == opened
+    assert capture.size == (640, 480) and not capture.released
+
+    # handles of the other cameras are released
+    assert all(c.released for c in cameras.opened if c is not capture)
+
+
+def test_single_camera_is_opened_once():
+    cameras = FakeCameras()
+    manager = CameraManager(cameras.open, cache_path=None)
+
+    assert manager.get_width_height(0) == (1280, 720)
+    assert manager.open(0) is cameras.opened[0]
+    assert len(cameras.opened) == 1
+
+    assert manager.get_width_height(1) is None
+
+
+def test_cache_is_validated_against_device_list(tmp_path):
+    devices = ['video0', 'video2']
+    cache_path = str(tmp_path / 'cameras.json')
+
+    cameras = FakeCameras()
+    CameraManager(cameras.open, cache_path=cache_path, list_devices=lambda: devices, timeout=0.5).get_cameras(2)
+
+    # same devices - no probing
+    cameras = FakeCameras()
+    manager = CameraManager(cameras.open, cache_path=cache_path, list_devices=lambda: devices, timeout=0.5)
+    assert manager.get_cameras(2) == {0: (1280, 720), 2: (640, 480)}
+    assert manager.from_cache
+    assert cameras.opened == []
+
+    # more indices than cached - probing
+    manager = CameraManager(cameras.open, cache_path=cache_path, list_devices=lambda: devices, timeout=0.5)
+    manager.get_cameras(3)
+    assert not manager.from_cache
+    cameras = FakeCameras()
+
+    # device unplugged - probing
+    manager = CameraManager(cameras.open, cache_path=cache_path, list_devices=lambda: ['video0'], timeout=0.5)
+    manager.get_cameras(2)
+    assert not manager.from_cache
+    assert len(cameras.opened) == 3
+
+    # devices cannot be listed - no caching
+    cameras = FakeCameras()
+    manager = CameraManager(cameras.open, cache_path=cache_path, list_devices=lambda: None, timeout=0.5)
+    manager.get_cameras(2)
+    assert not manager.from_cache
+    assert len(cameras.opened) == 3
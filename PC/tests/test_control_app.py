@@ -0,0 +1,43 @@
+import sys
+sys.path.append('.')
+from common.control_app import create_pipeline_controller
+from common.markers import create_detector
+from common.synthetic_camera import create_default_scene
+
+
+class RecordingSink:
+    '''
+    Control sink stand-in which records the calls
+    '''
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        self.calls.append('start')
+
+    def send_control(self, control):
+        self.calls.append('send_control')
+
+    def get_link_latency(self):
+        return 0.0
+
+    def close(self):
+        self.calls.append('close')
+
+    def log_stats(self):
+        pass
+
+
+def test_pipeline_controller_starts_and_closes_its_sink():
+    sink = RecordingSink()
+    scene = create_default_scene()
+    control = create_pipeline_controller((scene.width // 2, scene.height // 2), sink_factory=lambda: sink)
+    assert sink.calls == ['start']
+
+    # the default scene has a single foe
+    ret, video_frame = scene.read()
+    marker_corners, marker_ids = create_detector()(video_frame)
+    assert control(marker_corners, marker_ids, 0.0) is not None
+    control.close()
+    assert sink.calls == ['start', 'send_control', 'close']
@@ -131,3 +131,16 @@ def test_calculate_motor_speed_7():
         k=K)
 
     assert motor_speed == ERROR
+
+
+def test_calculate_motor_speed_angle_error():
+    # fractional angle error with a per-degree gain gives an integer PWM setting
+
+    motor_speed = calculate_motor_speed(error=7.77,
+        deadzone=5.0,
+        min_motor_speed=50,
+        max_motor_speed=255,
+        k=10.0)
+
+    assert type(motor_speed) is int
+    assert motor_speed == 78
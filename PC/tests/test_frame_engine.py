@@ -0,0 +1,147 @@
+import sys
+import threading
+import time
+import tracemalloc
+sys.path.append('.')
+import cv2
+import numpy as np
+from common.frame_engine import FrameEngine
+from common.frame_grabber import LatestFrameGrabber
+from common.frame_profiler import FrameProfiler
+from common.markers import create_detector, get_marker_center
+from common.overlay import OverlayAsset
+from common.synthetic_camera import create_default_scene
+
+WARMUP_FRAMES = 10
+MEASURED_FRAMES = 30
+
+
+class BufferCapture:
+    '''
+    Fake video capture reading frames filled with an increasing frame number into the given image buffer
+    '''
+
+    def __init__(self, num_frames, period=0.0):
+        self.num_frames = num_frames
+        self.period = period
+        self.frame_idx = 0
+
+    def read(self, image=None):
+        if self.frame_idx >= self.num_frames:
+            return False, None
+        time.sleep(self.period)
+        if image is None:
+            image = np.empty((4, 4, 3), dtype=np.uint8)
+        image[:] = self.frame_idx % 256
+        self.frame_idx += 1
+        return True, image
+
+    def get(self, prop_id):
+        return 0
+
+    def release(self):
+        pass
+
+
+def create_ar_images():
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[10:90, 10:90] = (50, 60, 255)
+    corners = np.array([[0, 0], [100, 0], [100, 100], [0, 100]]).astype(int)
+    return {0: OverlayAsset(img, corners), 1: OverlayAsset(img.copy(), corners)}
+
+
+def create_engine(monkeypatch, send_control=None, profiler=None):
+    monkeypatch.setattr(cv2, 'imshow', lambda *args: None)
+    monkeypatch.setattr(cv2, 'waitKey', lambda *args: -1)
+
+    camera = create_default_scene()
+    frame_center = (camera.width // 2, camera.height // 2)
+
+    def calculate(marker_corners, marker_ids, timestamp, capture_time=None):
+        if marker_ids is None:
+            return None
+        target = get_marker_center(marker_corners[0])
+        return {'target': target, 'error_x': target[0] - frame_center[0], 'error_y': target[1] - frame_center[1],
+                'motor_speed_x': 0, 'motor_speed_y': 0}
+
+    video_capture = LatestFrameGrabber(camera, threaded=False).start()
+    return FrameEngine(video_capture, create_detector(0.5), calculate, frame_center, 50, create_ar_images(),
+                       send_control=send_control, profiler=profiler)
+
+
+def test_frame_engine_steady_state_allocations(monkeypatch):
+    # tracemalloc traces all threads, wait for threads left running by other tests (e.g. timed out camera probes)
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+
+    engine = create_engine(monkeypatch)
+    for i in range(WARMUP_FRAMES):
+        assert engine.process_frame(time_left=1.0)
+    frame_bytes = engine.display_frame.nbytes
+
+    tracemalloc.start()
+    try:
+        start_memory, _ = tracemalloc.get_traced_memory()
+        max_frame_peak = 0
+        for i in range(MEASURED_FRAMES):
+            current_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            assert engine.process_frame(time_left=1.0)
+            max_frame_peak = max(max_frame_peak, tracemalloc.get_traced_memory()[1] - current_memory)
+        end_memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # no frame-sized (or even 1 % of a frame) temporary arrays and no growth from frame to frame
+    assert max_frame_peak < 0.01 * frame_bytes
+    assert end_memory - start_memory < 0.01 * frame_bytes
+    assert engine.render_throttle.frames_rendered == WARMUP_FRAMES + MEASURED_FRAMES
+
+
+def test_frame_engine_sends_control_and_marks_stages(monkeypatch):
+    sent = []
+    profiler = FrameProfiler()
+    engine = create_engine(monkeypatch, send_control=sent.append, profiler=profiler)
+
+    for i in range(5):
+        assert engine.process_frame()
+
+    assert len(sent) == 5
+    assert all('motor_speed_x' in control for control in sent)
+    stages = profiler.get_stats()['stages']
+    assert all(stages[stage]['count'] == 5 for stage in ('capture', 'detect', 'control', 'serial', 'overlay'))
+
+    # the video frame is copied, not drawn on
+    ret, video_frame = engine.video_capture.read()
+    assert ret
+    assert engine.display_frame is not video_frame
+
+
+def test_frame_grabber_reuses_buffers():
+    BUFFER_SIZE = 2
+
+    grabber = LatestFrameGrabber(BufferCapture(10000, period=0.0005), buffer_size=BUFFER_SIZE).start()
+    delivered = []
+    for i in range(20):
+        ret, frame = grabber.read()
+        assert ret
+        value = frame[0, 0, 0]
+        # the capture thread keeps reading, but never into the delivered frame
+        time.sleep(0.002)
+        assert np.all(frame == value)
+        delivered.append(frame)
+    grabber.release()
+
+    assert len(grabber.buffers) <= BUFFER_SIZE + 2
+    assert all(any(frame is buffer for buffer in grabber.buffers) for frame in delivered)
+
+
+def test_frame_grabber_reuses_buffer_when_not_threaded():
+    grabber = LatestFrameGrabber(BufferCapture(10), threaded=False).start()
+
+    ret, first_frame = grabber.read()
+    ret, second_frame = grabber.read()
+    assert ret
+    assert second_frame is first_frame
+    assert second_frame[0, 0, 0] == 1
@@ -0,0 +1,133 @@
+import sys
+sys.path.append('.')
+import numpy as np
+from common import frame_governor
+from common.annotation import RenderThrottle, draw_markers
+from common.frame_governor import QUALITY_LEVELS, FrameGovernor
+from common.frame_profiler import FrameProfiler
+from common.markers import create_detector
+from common.overlay import OverlayAsset
+from common.synthetic_camera import create_default_scene
+
+FRAME_BUDGET = 0.010
+WINDOW = 5
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_frames(governor, clock, work_time, num_frames):
+    changes = 0
+    for i in range(num_frames):
+        governor.mark('capture')
+        clock.now += work_time
+        governor.mark('detect')
+        changes += governor.end_frame()
+    return changes
+
+
+def create_governor(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(frame_governor.time, 'perf_counter', clock)
+    return FrameGovernor(FRAME_BUDGET, window=WINDOW, **kwargs), clock
+
+
+def test_governor_steps_down_over_budget_and_up_with_headroom(monkeypatch):
+    detection_scales = []
+    governor, clock = create_governor(monkeypatch, set_detection_scale=detection_scales.append)
+
+    # within budget, no headroom
+    assert run_frames(governor, clock, 0.009, 3 * WINDOW) == 0
+    assert governor.level == 0
+
+    # over budget: one level per window down to the lowest quality
+    run_frames(governor, clock, 0.015, WINDOW)
+    assert governor.level == 1
+    run_frames(governor, clock, 0.015, 10 * WINDOW)
+    assert governor.level == len(QUALITY_LEVELS) - 1
+    assert detection_scales[-1] == QUALITY_LEVELS[-1]['detection_scale']
+
+    # headroom: back up to full quality
+    run_frames(governor, clock, 0.002, 10 * WINDOW)
+    assert governor.level == 0
+    assert detection_scales[-1] == 1.0
+
+    stats = governor.get_stats()
+    assert stats['budget_misses'] == 11 * WINDOW
+    assert stats['frames'] == 24 * WINDOW
+    assert stats['steps_down'] == stats['steps_up'] == len(QUALITY_LEVELS) - 1
+    assert np.isclose(stats['stages']['detect'], 0.002, atol=1e-4)
+
+
+def test_governor_backs_off_when_stepping_up_misses_the_budget(monkeypatch):
+    governor, clock = create_governor(monkeypatch)
+
+    # level 0 takes 12 ms, level 1 takes 6 ms (below the 7 ms headroom)
+    def run(num_frames):
+        for i in range(num_frames):
+            run_frames(governor, clock, 0.012 if governor.level == 0 else 0.006, 1)
+
+    run(WINDOW)
+    assert governor.level == 1
+
+    # 1st step up after a window, it misses the budget and the next step up waits two windows
+    run(WINDOW)
+    assert governor.level == 0
+    run(WINDOW)
+    assert governor.level == 1
+    assert governor.backoff == 2
+    run(WINDOW)
+    assert governor.level == 1
+    run(WINDOW)
+    assert governor.level == 0
+
+
+def test_runtime_quality_settings():
+    render_throttle = RenderThrottle()
+    render_throttle.render_skip = 4
+    assert [render_throttle.should_render() for i in range(8)] == [True, False, False, False] * 2
+
+    # frame with the foe and the friendly marker
+    camera = create_default_scene(width=640, height=360)
+    for i in range(100):
+        ret, video_frame = camera.read()
+        if len(camera.ground_truth) == 2:
+            break
+    detect = create_detector()
+    marker_corners, marker_ids = detect(video_frame)
+    assert len(marker_ids) == 2
+
+    detect.set_scale_factor(0.5)
+    small_corners, small_ids = detect(video_frame)
+    assert sorted(small_ids.ravel()) == sorted(marker_ids.ravel())
+
+    # AR images are composited for at most max_overlays markers
+    img = np.full((10, 10, 3), (50, 60, 200), dtype=np.uint8)
+    corners = np.array([[0, 0], [10, 0], [10, 10], [0, 10]])
+    ar_images = {marker_id: OverlayAsset(img, corners) for marker_id in marker_ids.ravel()}
+    display_frames = {}
+    for max_overlays in (0, 1, None):
+        display_frames[max_overlays] = draw_markers(np.full_like(video_frame, 255), marker_corners, marker_ids,
+                                                    ar_images, max_overlays=max_overlays)
+    num_overlay_pixels = {max_overlays: np.count_nonzero(np.all(display_frame == (50, 60, 200), axis=2))
+                          for max_overlays, display_frame in display_frames.items()}
+    assert 0 == num_overlay_pixels[0] < num_overlay_pixels[1] < num_overlay_pixels[None]
+
+
+def test_profiler_reports_quality_level(monkeypatch):
+    governor, clock = create_governor(monkeypatch)
+    run_frames(governor, clock, 0.015, WINDOW)
+
+    profiler = FrameProfiler(governor=governor)
+    stats = profiler.get_stats()
+    assert stats['governor']['level'] == 1
+    assert stats['governor']['budget_misses'] == WINDOW
+
+    text = profiler.format_prometheus(stats)
+    assert 'dronekiller_quality_level 1' in text
+    assert f'dronekiller_frame_budget_misses_total {WINDOW}' in text
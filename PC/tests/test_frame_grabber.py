@@ -0,0 +1,75 @@
+import sys
+import time
+sys.path.append('.')
+import numpy as np
+from common.frame_grabber import LatestFrameGrabber
+
+
+class CountingCapture:
+    '''
+    Fake video capture returning frames filled with an increasing frame number
+    '''
+
+    def __init__(self, num_frames, period=0.0):
+        self.num_frames = num_frames
+        self.period = period
+        self.frame_idx = 0
+        self.released = False
+
+    def read(self):
+        if self.frame_idx >= self.num_frames:
+            return False, None
+        time.sleep(self.period)
+        frame = np.full((4, 4, 3), self.frame_idx, dtype=np.uint8)
+        self.frame_idx += 1
+        return True, frame
+
+    def get(self, prop_id):
+        return 0
+
+    def release(self):
+        self.released = True
+
+
+def test_latest_frame_grabber_returns_newest_frame():
+    # slow consumer - stale frames are dropped and counted
+    NUM_FRAMES = 20
+
+    grabber = LatestFrameGrabber(CountingCapture(NUM_FRAMES)).start()
+    grabber.thread.join()
+
+    ret, frame = grabber.read()
+    assert ret
+    assert frame[0, 0, 0] == NUM_FRAMES - 1
+    assert grabber.frames_dropped == NUM_FRAMES - 1
+    assert grabber.last_frame_age >= 0
+
+    # no newer frame available any more
+    ret, frame = grabber.read(timeout=0.1)
+    assert not ret
+    assert frame is None
+
+    grabber.release()
+    assert grabber.video_capture.released
+
+
+def test_latest_frame_grabber_fast_consumer():
+    # consumer keeps up with the camera - every frame is delivered exactly once
+    NUM_FRAMES = 10
+    PERIOD = 0.01
+
+    grabber = LatestFrameGrabber(CountingCapture(NUM_FRAMES, PERIOD)).start()
+
+    frame_numbers = []
+    while True:
+        ret, frame = grabber.read()
+        if not ret:
+            break
+        frame_numbers.append(int(frame[0, 0, 0]))
+
+    grabber.release()
+
+    assert frame_numbers == sorted(set(frame_numbers))
+    stats = grabber.get_stats()
+    assert stats['frames_captured'] == NUM_FRAMES
+    assert stats['frames_delivered'] + stats['frames_dropped'] == NUM_FRAMES
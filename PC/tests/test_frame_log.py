@@ -0,0 +1,119 @@
+import sys
+sys.path.append('.')
+import cv2
+import numpy as np
+import pytest
+from common.frame_grabber import LatestFrameGrabber
+from common.frame_log import FrameLog, FrameLogCapture, FrameLogWriter, convert_to_frame_log, is_frame_log
+from common.markers import create_detector
+from common.synthetic_camera import create_default_scene
+from common.targeting import create_control_calculator
+from replay.replay import replay
+
+WIDTH, HEIGHT = 320, 240
+NUM_FRAMES = 20
+FPS = 30
+
+
+def create_frame(frame_idx):
+    return np.full((HEIGHT, WIDTH, 3), frame_idx, dtype=np.uint8)
+
+
+@pytest.fixture
+def frame_log_path(tmp_path):
+    path = str(tmp_path / 'frames.dkfl')
+    with FrameLogWriter(path, WIDTH, HEIGHT, fps=FPS, metadata={'camera_idx': 1}) as writer:
+        for frame_idx in range(NUM_FRAMES):
+            writer.write(create_frame(frame_idx), 100 + frame_idx / FPS)
+    return path
+
+
+def test_random_access_views(frame_log_path):
+    frame_log = FrameLog(frame_log_path)
+
+    assert len(frame_log) == NUM_FRAMES
+    assert (frame_log.width, frame_log.height, frame_log.fps) == (WIDTH, HEIGHT, FPS)
+    assert frame_log.header['metadata'] == {'camera_idx': 1}
+    assert list(frame_log.frame_idxs) == list(range(NUM_FRAMES))
+    assert frame_log.find(100 + 10.5 / FPS) == 10
+
+    # frames are read-only views into the mapping, not copies
+    frame = frame_log[13]
+    assert np.array_equal(frame, create_frame(13))
+    assert np.shares_memory(frame, frame_log.records)
+    assert not frame.flags.writeable
+    assert np.shares_memory(frame_log.timestamps, frame_log.records)
+
+    frames = frame_log[5:8]
+    assert frames.shape == (3, HEIGHT, WIDTH, 3)
+    assert frames[2, 0, 0, 0] == 7
+
+
+def test_interrupted_log_is_readable(frame_log_path):
+    with open(frame_log_path, 'r+b') as log_file:
+        log_file.seek(0, 2)
+        log_file.truncate(log_file.tell() - 1000)
+
+    frame_log = FrameLog(frame_log_path)
+    assert len(frame_log) == NUM_FRAMES - 1
+    assert np.array_equal(frame_log[-1], create_frame(NUM_FRAMES - 2))
+
+
+def test_frame_log_capture(frame_log_path):
+    video_capture = FrameLogCapture(frame_log_path, start=15)
+    assert video_capture.get(cv2.CAP_PROP_FRAME_COUNT) == NUM_FRAMES
+    assert video_capture.get(cv2.CAP_PROP_FRAME_WIDTH) == WIDTH
+
+    frame_idxs = []
+    while True:
+        ret, video_frame = video_capture.read()
+        if not ret:
+            break
+        frame_idxs.append(int(video_frame[0, 0, 0]))
+    assert frame_idxs == list(range(15, NUM_FRAMES))
+
+    # jump to any frame at once
+    video_capture.set(cv2.CAP_PROP_POS_FRAMES, 3)
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    ret, video_frame = video_capture.read(image)
+    assert video_frame is image
+    assert image[0, 0, 0] == 3
+
+    # the grabber reports the recorded capture timestamps
+    grabber = LatestFrameGrabber(FrameLogCapture(frame_log_path, loop=True), threaded=False).start()
+    for _ in range(NUM_FRAMES + 2):
+        grabber.read()
+    assert grabber.last_frame_timestamp == 100 + 1 / FPS
+
+
+def test_convert_and_replay(tmp_path):
+    path = str(tmp_path / 'synthetic.dkfl')
+    scene = create_default_scene(WIDTH, HEIGHT, num_frames=NUM_FRAMES)
+    assert convert_to_frame_log(scene, path) == NUM_FRAMES
+    assert is_frame_log(path)
+    assert not is_frame_log(str(tmp_path))
+
+    # frame log chunks are replayed by random access
+    rows = replay([path], str(tmp_path / 'replay.csv'), jobs=1, chunk_size=7)
+    assert [row['frame_idx'] for row in rows] == list(range(NUM_FRAMES))
+    assert all(row['num_markers'] > 0 for row in rows)
+
+
+def test_prediction_latency_with_frame_log(tmp_path):
+    # the recorded timestamps (here from 0 s) are used for tracking, the latency is measured on the capture time
+    path = str(tmp_path / 'synthetic.dkfl')
+    scene = create_default_scene(WIDTH, HEIGHT, num_frames=NUM_FRAMES)
+    convert_to_frame_log(scene, path)
+
+    grabber = LatestFrameGrabber(FrameLogCapture(path), threaded=False).start()
+    detect = create_detector()
+    calculate = create_control_calculator((WIDTH // 2, HEIGHT // 2), prediction='cv')
+    for _ in range(NUM_FRAMES):
+        ret, video_frame = grabber.read()
+        assert ret
+        marker_corners, marker_ids = detect(video_frame)
+        calculate(marker_corners, marker_ids, grabber.last_frame_timestamp, capture_time=grabber.last_capture_time)
+
+    assert grabber.last_frame_timestamp < 1.0
+    assert calculate.tracker.updates > 0
+    assert 0 <= calculate.latency_estimator.latency < 0.1
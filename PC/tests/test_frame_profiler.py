@@ -0,0 +1,101 @@
+import sys
+sys.path.append('.')
+import json
+import time
+
+import pytest
+from common.frame_profiler import FrameProfiler, NullProfiler, create_profiler
+
+
+def run_frames(profiler, num_frames, detect_time=0.002):
+    for frame_idx in range(num_frames):
+        profiler.start_frame()
+        profiler.mark('capture')
+        time.sleep(detect_time)
+        profiler.mark('detect')
+        # display only every other frame
+        if frame_idx % 2 == 0:
+            profiler.mark('display')
+
+
+def test_stage_stats():
+    profiler = FrameProfiler(get_frames_dropped=lambda: 7)
+    run_frames(profiler, 50)
+
+    stats = profiler.get_stats()
+    assert stats['frames'] == 50
+    assert stats['frames_dropped'] == 7
+    assert set(stats['stages']) == {'capture', 'detect', 'display', 'frame'}
+    assert stats['stages']['display']['count'] == 25
+
+    detect = stats['stages']['detect']
+    assert 0.002 <= detect['p50'] <= detect['p95'] <= detect['p99']
+    assert detect['p50'] < 0.01
+    # frame period is dominated by the detection
+    assert 100 < stats['fps'] < 500
+
+    assert len(profiler.get_summary()) == 2
+    assert profiler.get_summary()[1].startswith('p95 ms: capture')
+
+
+def test_rolling_window():
+    profiler = FrameProfiler(window=10)
+    run_frames(profiler, 10, detect_time=0.02)
+    run_frames(profiler, 10, detect_time=0.0)
+
+    # slow frames are out of the window, but still counted
+    detect = profiler.get_stats()['stages']['detect']
+    assert detect['p99'] < 0.01
+    assert detect['count'] == 20
+    assert detect['sum'] >= 0.2
+
+
+@pytest.mark.parametrize('file_name', ['stats.json', 'stats.prom'])
+def test_snapshot(tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    profiler = FrameProfiler(output_path=path)
+    run_frames(profiler, 10)
+    profiler.close()
+
+    with open(path) as snapshot_file:
+        text = snapshot_file.read()
+
+    if file_name.endswith('.json'):
+        assert json.loads(text)['stages']['detect']['count'] == 10
+    else:
+        assert '# TYPE dronekiller_stage_latency_seconds summary' in text
+        assert 'dronekiller_stage_latency_seconds{stage="detect",quantile="0.95"}' in text
+        assert 'dronekiller_stage_latency_seconds_count{stage="detect"} 10' in text
+        assert 'dronekiller_frames_total 10' in text
+
+
+def test_chrome_trace(tmp_path):
+    path = str(tmp_path / 'trace.json')
+    profiler = FrameProfiler(trace_path=path)
+    run_frames(profiler, 4)
+    profiler.close()
+
+    with open(path) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+
+    assert [event['name'] for event in events[:5]] == ['capture', 'detect', 'display', 'capture', 'detect']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    # stages of a frame follow each other
+    assert events[1]['ts'] == pytest.approx(events[0]['ts'] + events[0]['dur'])
+    assert events[1]['dur'] >= 2000
+
+
+def test_disabled_profiler_overhead():
+    profiler = create_profiler(False)
+    assert isinstance(profiler, NullProfiler)
+    assert isinstance(create_profiler(False, output_path='stats.json'), FrameProfiler)
+
+    NUM_FRAMES = 10000
+    start_time = time.perf_counter()
+    for _ in range(NUM_FRAMES):
+        profiler.start_frame()
+        for stage in ('capture', 'detect', 'control', 'serial', 'overlay', 'display'):
+            profiler.mark(stage)
+        profiler.get_summary()
+    # well below a microsecond per call
+    assert (time.perf_counter() - start_time) / NUM_FRAMES < 10e-6
@@ -0,0 +1,55 @@
+import sys
+sys.path.append('.')
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from common.markers import create_detector, get_detection_scale
+
+FRAME_SHAPE = (960, 1280, 3)
+MARKER_CORNERS = np.array([[400, 300], [640, 320], [620, 560], [390, 540]], dtype=np.float32)
+
+
+def create_frame(marker_id):
+    dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+    marker = cv2.cvtColor(aruco.drawMarker(dictionary, marker_id, 200), cv2.COLOR_GRAY2BGR)
+    # white border around the marker
+    marker = cv2.copyMakeBorder(marker, 40, 40, 40, 40, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+
+    # warp the marker (without border) onto the frame
+    source_corners = np.array([[40, 40], [240, 40], [240, 240], [40, 240]], dtype=np.float32)
+    transform_matrix = cv2.getPerspectiveTransform(source_corners, MARKER_CORNERS)
+    return cv2.warpPerspective(marker, transform_matrix, (FRAME_SHAPE[1], FRAME_SHAPE[0]),
+        borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+
+
+def test_get_detection_scale():
+    assert get_detection_scale(1280, 0.5) == 0.5
+    assert get_detection_scale(1280, 2.0) == 1.0
+    # automatic
+    assert get_detection_scale(1280, 0) == 0.5
+    assert get_detection_scale(320, 0) == 1.0
+
+
+def test_downscaled_detection_matches_full_resolution():
+    MARKER_ID = 3
+    video_frame = create_frame(MARKER_ID)
+
+    full_corners, full_ids = create_detector()(video_frame)
+
+    for detection_scale in (0.5, 0.25, 0):
+        marker_corners, marker_ids = create_detector(detection_scale)(video_frame)
+
+        assert marker_ids.shape == full_ids.shape
+        assert marker_ids[0][0] == MARKER_ID
+        assert marker_corners[0].shape == full_corners[0].shape
+        assert marker_corners[0].dtype == np.float32
+
+        # refined corners are within a fraction of a pixel of the ground truth (marker edges lie half a pixel before
+        # the warped corner coordinates because of the pixel center convention of warpPerspective)
+        assert np.abs(marker_corners[0].reshape(-1, 2) - (MARKER_CORNERS - 0.5)).max() < 0.3
+
+
+def test_downscaled_detection_no_markers():
+    marker_corners, marker_ids = create_detector(0.5)(np.full(FRAME_SHAPE, 255, dtype=np.uint8))
+    assert marker_ids is None
+    assert len(marker_corners) == 0
@@ -0,0 +1,83 @@
+import sys
+sys.path.append('.')
+from functools import partial
+import numpy as np
+from common.calibration import CameraCalibration
+from common.markers import create_detector
+from common.multi_camera import CameraGeometry, TargetFusion, run_multi_camera
+from common.synthetic_camera import SyntheticCamera, SyntheticMarker, linear_trajectory
+
+WIDTH, HEIGHT = 320, 240
+MARKER_ID = 0
+MARKER_SIZE = 60
+
+
+def create_marker_scene(center):
+    # synthetic camera with a single static foe marker, created inside the camera process
+    marker = SyntheticMarker(MARKER_ID, MARKER_SIZE, linear_trajectory(center, (0, 0)))
+    return SyntheticCamera([marker], WIDTH, HEIGHT)
+
+
+def test_camera_geometry_angles():
+    geometry = CameraGeometry(WIDTH, HEIGHT, horizontal_fov=90.0)
+    assert np.allclose(geometry.get_angles([[WIDTH / 2, HEIGHT / 2], [WIDTH, HEIGHT / 2]]), [[0, 0], [45, 0]])
+
+    # the optical axis is offset from the boresight
+    geometry = CameraGeometry(WIDTH, HEIGHT, horizontal_fov=90.0, yaw_offset=2.0, pitch_offset=-1.0)
+    assert np.allclose(geometry.get_angles([[WIDTH / 2, HEIGHT / 2]]), [[2, -1]])
+
+    # narrow lenses have a finer angular resolution
+    assert CameraGeometry(WIDTH, HEIGHT, 30.0).degrees_per_pixel < CameraGeometry(WIDTH, HEIGHT, 90.0).degrees_per_pixel
+
+    calibration = CameraCalibration([[200.0, 0, 160], [0, 200.0, 120], [0, 0, 1]], np.zeros(5), WIDTH, HEIGHT)
+    geometry = CameraGeometry(WIDTH, HEIGHT, calibration=calibration)
+    assert np.allclose(geometry.get_angles([[360, 120]]), [[45, 0]])
+
+    corners = (np.array([[[150, 110], [170, 110], [170, 130], [150, 130]]], dtype=np.float32),
+               np.array([[[0, 0], [20, 0], [20, 20], [0, 20]]], dtype=np.float32))
+    assert geometry.get_target_angles(corners, np.array([[MARKER_ID], [MARKER_ID + 1]]), MARKER_ID) == [(0.0, 0.0)]
+    assert geometry.get_target_angles((), None, MARKER_ID) == []
+
+
+def test_target_fusion_prefers_the_narrow_camera():
+    fusion = TargetFusion({'wide': CameraGeometry(WIDTH, HEIGHT, 90.0), 'narrow': CameraGeometry(WIDTH, HEIGHT, 30.0)},
+                          max_age=0.2)
+    assert fusion.select(now=0.0) is None
+
+    # acquisition by the wide camera, the target closest to the boresight is engaged
+    fusion.update('wide', 0.0, [(20.0, 5.0), (3.0, 1.0)])
+    fusion.update('narrow', 0.0, [])
+    assert fusion.select(now=0.05) == ('wide', (3.0, 1.0), 0.0)
+
+    # fine aim by the narrow camera
+    fusion.update('narrow', 0.1, [(2.9, 1.1)])
+    assert fusion.select(now=0.15) == ('narrow', (2.9, 1.1), 0.1)
+    assert fusion.handovers == 1
+
+    # back to the wide camera once the narrow detection is stale
+    fusion.update('wide', 0.4, [(1.0, 0.0)])
+    assert fusion.select(now=0.45) == ('wide', (1.0, 0.0), 0.4)
+    assert fusion.handovers == 2
+    assert fusion.selections == {'wide': 2, 'narrow': 1}
+
+
+def test_run_multi_camera():
+    sent = []
+    cameras = {
+        # the marker is 40 px right of the wide camera's center
+        'wide': (partial(create_marker_scene, (200, 120)), CameraGeometry(WIDTH, HEIGHT, 90.0)),
+        'narrow': (partial(create_marker_scene, (280, 200)), CameraGeometry(WIDTH, HEIGHT, 30.0)),
+    }
+
+    stats = run_multi_camera(cameras, partial(create_detector, 1.0), lambda target: {'target_angles': target},
+                             desired_time=1.5, send_control=sent.append, target_id=MARKER_ID, threaded_capture=False)
+
+    assert stats['wide']['processed'] > 0
+    assert stats['narrow']['processed'] > 0
+    assert stats['fusion']['commands'] == len(sent) > 0
+    assert stats['fusion']['latency']['p50'] > 0
+
+    # the narrow camera has the finer resolution and sees the marker, so it takes over
+    assert sent[-1]['camera'] == 'narrow'
+    expected_x = np.degrees(np.arctan((280 - WIDTH / 2) / cameras['narrow'][1].focal_length))
+    assert abs(sent[-1]['target_angles'][0] - expected_x) < 0.5
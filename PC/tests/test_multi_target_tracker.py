@@ -0,0 +1,124 @@
+import sys
+sys.path.append('.')
+import time
+
+import numpy as np
+import pytest
+from common.multi_target_tracker import MultiTargetTracker, assign_greedy, assign_hungarian
+from common.targeting import FOE_ID, FRIENDLY_ID, create_control_calculator, get_foe_markers
+
+
+FPS = 30
+FRAME_CENTER = (640, 360)
+
+
+def make_corners(center, size):
+    x, y = center
+    half_size = size / 2
+    return np.array([[[x - half_size, y - half_size], [x + half_size, y - half_size], [x + half_size, y + half_size],
+                      [x - half_size, y + half_size]]], dtype=np.float32)
+
+
+def test_foe_markers_are_not_merged():
+    marker_corners = [make_corners((100, 100), 50), make_corners((500, 300), 50), make_corners((300, 200), 50)]
+    marker_ids = np.array([[FOE_ID], [FRIENDLY_ID], [FOE_ID]])
+
+    assert get_foe_markers(marker_corners, marker_ids) == {0: (100, 100), 2: (300, 200)}
+
+
+def test_track_ids_persist_across_frames():
+    NUM_TARGETS = 36
+
+    rng = np.random.default_rng(0)
+    start = rng.uniform((100, 100), (1180, 620), size=(NUM_TARGETS, 2))
+    velocity = rng.uniform(-60, 60, size=(NUM_TARGETS, 2))
+
+    tracker = MultiTargetTracker('first_seen', FRAME_CENTER, gate=30)
+    update_times = []
+    for frame_idx in range(60):
+        t = frame_idx / FPS
+        # shuffle the detection order every frame
+        order = rng.permutation(NUM_TARGETS)
+        corners = [make_corners(start[i] + velocity[i] * t, 30) for i in order]
+
+        start_time = time.perf_counter()
+        tracker.update(corners, t)
+        update_times.append(time.perf_counter() - start_time)
+
+        if frame_idx == 0:
+            track_of_target = {track.track_id: order[i] for i, track in enumerate(tracker.tracks)}
+
+        for track in tracker.tracks:
+            target = track_of_target[track.track_id]
+            assert np.allclose(track.center, start[target] + velocity[target] * t, atol=1)
+
+    assert tracker.get_stats()['tracks_created'] == NUM_TARGETS
+    # stays fast with dozens of markers in view
+    assert np.median(update_times) < 0.005
+
+
+@pytest.mark.parametrize('policy, expected_center', [
+    ('boresight', (600, 350)),
+    ('size', (200, 600)),
+    ('first_seen', (1100, 100)),
+])
+def test_target_policies(policy, expected_center):
+    tracker = MultiTargetTracker(policy, FRAME_CENTER)
+
+    tracker.update([make_corners((1100, 100), 40)], 0.0)
+    target = tracker.update([make_corners((1100, 100), 40), make_corners((600, 350), 40),
+                             make_corners((200, 600), 120)], 1 / FPS)
+
+    assert tuple(target.center) == expected_center
+
+
+def test_engaged_target_is_kept():
+    tracker = MultiTargetTracker('boresight', FRAME_CENTER)
+
+    target = tracker.update([make_corners((650, 300), 40), make_corners((700, 420), 40)], 0.0)
+    assert tuple(target.center) == (650, 300)
+    target_id = target.track_id
+
+    # the other target is only slightly closer to the boresight - no switch
+    target = tracker.update([make_corners((650, 290), 40), make_corners((690, 400), 40)], 1 / FPS)
+    assert target.track_id == target_id
+
+    # engaged target missing in a single frame - nothing is engaged instead of the other target
+    assert tracker.update([make_corners((690, 395), 40)], 2 / FPS) is None
+
+    # much better target - switch
+    target = tracker.update([make_corners((650, 280), 40), make_corners((640, 360), 40)], 3 / FPS)
+    assert target.track_id != target_id
+    assert tuple(target.center) == (640, 360)
+    assert tracker.get_stats()['target_switches'] == 1
+
+
+ASSIGNMENT_DISTANCES = np.array([[1.0, 2.0, 50.0],
+                                 [2.0, 10.0, 50.0],
+                                 [50.0, 50.0, 50.0]])
+
+
+def test_greedy_assignment():
+    # closest pair first, the last track and detection are outside of the gate
+    assert sorted(assign_greedy(ASSIGNMENT_DISTANCES, gate=20)) == [(0, 0), (1, 1)]
+
+
+def test_hungarian_assignment():
+    pytest.importorskip('scipy')
+
+    # minimal total distance
+    assert sorted(assign_hungarian(ASSIGNMENT_DISTANCES, gate=20)) == [(0, 1), (1, 0)]
+
+
+def test_control_engages_single_target_among_multiple_foes():
+    calculate = create_control_calculator(FRAME_CENTER, target_policy='boresight')
+
+    marker_corners = [make_corners((200, 100), 40), make_corners((700, 400), 40), make_corners((1000, 600), 40)]
+    marker_ids = np.array([[FOE_ID], [FOE_ID], [FOE_ID]])
+
+    control = calculate(marker_corners, marker_ids, 0.0)
+    assert control['target'] == (700, 400)
+
+    # without target policy the targeting is aborted
+    calculate = create_control_calculator(FRAME_CENTER, target_policy='none')
+    assert calculate(marker_corners, marker_ids, 0.0) is None
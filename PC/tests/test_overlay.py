@@ -0,0 +1,73 @@
+import sys
+sys.path.append('.')
+import cv2
+import numpy as np
+from common.overlay import OverlayAsset, OverlayBuffers, composite_overlay
+
+FRAME_SHAPE = (480, 640, 3)
+MARKER_CORNERS = np.array([[200, 150], [330, 170], [320, 300], [190, 280]], dtype=np.float32)
+
+
+def create_asset():
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[10:90, 10:90] = (50, 60, 255)
+    corners = np.array([[0, 0], [100, 0], [100, 100], [0, 100]]).astype(int)
+    return OverlayAsset(img, corners)
+
+
+def full_frame_overlay(display_frame, asset, marker_corners):
+    # reference: previous full-frame implementation
+    homography_matrix, status = cv2.findHomography(asset.corners, marker_corners)
+    warped_image = cv2.warpPerspective(asset.img, homography_matrix, (display_frame.shape[1], display_frame.shape[0]))
+    return np.where(warped_image > 0, warped_image, display_frame)
+
+
+def test_composite_overlay_matches_full_frame_warp():
+    asset = create_asset()
+    video_frame = np.full(FRAME_SHAPE, 100, dtype=np.uint8)
+
+    expected = full_frame_overlay(video_frame, asset, MARKER_CORNERS)
+    display_frame = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS)
+
+    # only anti-aliased pixels along the edge of the AR image may differ
+    different_pixels = np.any(display_frame != expected, axis=2).sum()
+    drawn_pixels = np.any(expected != video_frame, axis=2).sum()
+    assert drawn_pixels > 0
+    assert different_pixels < 0.05 * drawn_pixels
+
+
+def test_composite_overlay_outside_bounding_box_untouched():
+    asset = create_asset()
+    video_frame = np.full(FRAME_SHAPE, 100, dtype=np.uint8)
+
+    display_frame = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS)
+
+    changed_y, changed_x = np.nonzero(np.any(display_frame != video_frame, axis=2))
+    assert changed_x.min() >= MARKER_CORNERS[:, 0].min() - 1
+    assert changed_x.max() <= MARKER_CORNERS[:, 0].max() + 1
+    assert changed_y.min() >= MARKER_CORNERS[:, 1].min() - 1
+    assert changed_y.max() <= MARKER_CORNERS[:, 1].max() + 1
+
+
+def test_composite_overlay_marker_partially_outside_frame():
+    asset = create_asset()
+    video_frame = np.full(FRAME_SHAPE, 100, dtype=np.uint8)
+
+    display_frame = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS - (250, 200))
+    assert np.any(display_frame[:100, :100] != 100)
+
+    display_frame = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS + (1000, 1000))
+    assert np.array_equal(display_frame, video_frame)
+
+
+def test_composite_overlay_with_buffers_matches_allocating():
+    asset = create_asset()
+    video_frame = np.full(FRAME_SHAPE, 100, dtype=np.uint8)
+    buffers = OverlayBuffers(FRAME_SHAPE)
+
+    expected = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS)
+    for corners in (MARKER_CORNERS, MARKER_CORNERS - (250, 200)):
+        composite_overlay(video_frame.copy(), asset, corners, buffers)
+    display_frame = composite_overlay(video_frame.copy(), asset, MARKER_CORNERS, buffers)
+
+    assert np.array_equal(display_frame, expected)
@@ -0,0 +1,84 @@
+import sys
+sys.path.append('.')
+import multiprocessing
+from functools import partial
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from common.pipeline import SharedFrameSlots, run_pipeline
+from common.markers import get_marker_center
+
+FRAME_SHAPE = (240, 320, 3)
+MARKER_ID = 0
+MARKER_POSITION = (100, 60)
+MARKER_SIZE = 80
+
+
+class MarkerCapture:
+    '''
+    Fake video capture returning a white frame with a single ArUco marker
+    '''
+
+    def __init__(self):
+        dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+        marker = aruco.drawMarker(dictionary, MARKER_ID, MARKER_SIZE)
+        self.frame = np.full(FRAME_SHAPE, 255, dtype=np.uint8)
+        x, y = MARKER_POSITION
+        self.frame[y:y + MARKER_SIZE, x:x + MARKER_SIZE] = cv2.cvtColor(marker, cv2.COLOR_GRAY2BGR)
+
+    def read(self):
+        return True, self.frame.copy()
+
+    def release(self):
+        pass
+
+
+def create_controller(results):
+    def control(marker_corners, marker_ids, timestamp):
+        if marker_ids is not None:
+            results.put((int(marker_ids[0][0]), get_marker_center(marker_corners[0])))
+        return None
+    control.close = lambda: results.put('closed')
+    return control
+
+
+def create_renderer():
+    def render(video_frame, marker_corners, marker_ids, control_output):
+        pass
+    return render
+
+
+def test_shared_frame_slots_attach():
+    slots = SharedFrameSlots(FRAME_SHAPE, num_slots=2)
+    attached = SharedFrameSlots.attach(slots.describe())
+
+    slots.frames[1][...] = 7
+    assert attached.frames[1].sum() == 7 * np.prod(FRAME_SHAPE)
+    assert attached.frames[0].sum() == 0
+
+    attached.close()
+    slots.close()
+
+
+def test_run_pipeline():
+    results = multiprocessing.Queue()
+
+    stats = run_pipeline(capture_factory=MarkerCapture,
+        controller_factory=partial(create_controller, results),
+        renderer_factory=create_renderer,
+        frame_shape=FRAME_SHAPE,
+        desired_time=1.5)
+
+    for stage in ('capture', 'detect', 'control', 'render'):
+        assert stats[stage]['processed'] > 0
+
+    marker_id, marker_center = results.get(timeout=1)
+    assert marker_id == MARKER_ID
+    assert abs(marker_center[0] - (MARKER_POSITION[0] + MARKER_SIZE // 2)) <= 1
+    assert abs(marker_center[1] - (MARKER_POSITION[1] + MARKER_SIZE // 2)) <= 1
+
+    # the controller is closed when the control stage stops
+    while True:
+        result = results.get(timeout=1)
+        if result == 'closed':
+            break
@@ -0,0 +1,72 @@
+import sys
+sys.path.append('.')
+import csv
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from replay.replay import replay
+
+FRAME_SHAPE = (240, 320, 3)
+NUM_FRAMES = 20
+MARKER_SIZE = 60
+
+
+def create_frame(frame_idx):
+    # foe marker moving to the right
+    dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+    marker = cv2.cvtColor(aruco.drawMarker(dictionary, 0, MARKER_SIZE), cv2.COLOR_GRAY2BGR)
+    video_frame = np.full(FRAME_SHAPE, 255, dtype=np.uint8)
+    x = 20 + 10 * frame_idx
+    video_frame[80:80 + MARKER_SIZE, x:x + MARKER_SIZE] = marker
+    return video_frame
+
+
+def test_replay_image_directory_and_video(tmp_path):
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    for frame_idx in range(NUM_FRAMES):
+        cv2.imwrite(str(image_dir / f'frame_{frame_idx:04d}.png'), create_frame(frame_idx))
+
+    video_path = str(tmp_path / 'video.avi')
+    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (FRAME_SHAPE[1], FRAME_SHAPE[0]))
+    for frame_idx in range(NUM_FRAMES):
+        video_writer.write(create_frame(frame_idx))
+    video_writer.release()
+
+    output_path = str(tmp_path / 'replay.csv')
+    rows = replay([str(image_dir), video_path], output_path, jobs=2, chunk_size=7)
+
+    assert len(rows) == 2 * NUM_FRAMES
+    with open(output_path, newline='') as output_file:
+        csv_rows = list(csv.DictReader(output_file))
+    assert len(csv_rows) == 2 * NUM_FRAMES
+
+    for source in (str(image_dir), video_path):
+        source_rows = [row for row in csv_rows if row['source'] == source]
+        assert [int(row['frame_idx']) for row in source_rows] == list(range(NUM_FRAMES))
+
+        for row in source_rows:
+            frame_idx = int(row['frame_idx'])
+            assert row['marker_ids'] == '0'
+            assert abs(int(row['target_x']) - (20 + 10 * frame_idx + MARKER_SIZE // 2)) <= 1
+            assert int(row['error_x']) == int(row['target_x']) - FRAME_SHAPE[1] // 2
+            assert row['motor_speed_x'] != ''
+
+
+def test_replay_engages_one_of_several_foes(tmp_path):
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+    marker = cv2.cvtColor(aruco.drawMarker(dictionary, 0, MARKER_SIZE), cv2.COLOR_GRAY2BGR)
+    for frame_idx in range(NUM_FRAMES):
+        # second foe marker in the bottom right corner
+        video_frame = create_frame(frame_idx)
+        video_frame[170:170 + MARKER_SIZE, 250:250 + MARKER_SIZE] = marker
+        cv2.imwrite(str(image_dir / f'frame_{frame_idx:04d}.png'), video_frame)
+
+    rows = replay([str(image_dir)], str(tmp_path / 'replay.csv'), jobs=1, chunk_size=NUM_FRAMES)
+    assert all(row['marker_ids'] == '0 0' for row in rows)
+    assert all('motor_speed_x' in row for row in rows)
+
+    rows = replay([str(image_dir)], str(tmp_path / 'replay.csv'), jobs=1, chunk_size=NUM_FRAMES, target_policy='none')
+    assert not any('motor_speed_x' in row for row in rows)
@@ -0,0 +1,83 @@
+import sys
+sys.path.append('.')
+import cv2
+import cv2.aruco as aruco
+import numpy as np
+from common.markers import create_detector, get_marker_center
+from common.roi_tracker import RoiTracker
+
+FRAME_SHAPE = (480, 640, 3)
+FOE_ID = 0
+MARKER_SIZE = 60
+
+
+def create_frame(marker_position):
+    dictionary = aruco.Dictionary_get(aruco.DICT_4X4_250)
+    marker = cv2.cvtColor(aruco.drawMarker(dictionary, FOE_ID, MARKER_SIZE), cv2.COLOR_GRAY2BGR)
+    video_frame = np.full(FRAME_SHAPE, 255, dtype=np.uint8)
+    x, y = marker_position
+    video_frame[y:y + MARKER_SIZE, x:x + MARKER_SIZE] = marker
+    return video_frame
+
+
+def test_roi_tracker_follows_moving_target():
+    roi_tracker = RoiTracker(create_detector(), FOE_ID, refresh_period=10)
+    detect = create_detector()
+
+    for i in range(40):
+        video_frame = create_frame((100 + 8 * i, 100 + 4 * i))
+
+        marker_corners, marker_ids = roi_tracker.detect(video_frame)
+        expected_corners, expected_ids = detect(video_frame)
+
+        assert marker_ids is not None
+        assert marker_ids[0][0] == FOE_ID
+        assert get_marker_center(marker_corners[0]) == get_marker_center(expected_corners[0])
+
+    stats = roi_tracker.get_stats()
+    assert stats['roi_hit_rate'] == 1.0
+    # first frame plus a periodic refresh every 10 frames
+    assert stats['full_scans'] == 4
+    assert stats['roi_scans'] == 36
+
+
+def test_roi_tracker_falls_back_to_full_frame_when_target_lost():
+    roi_tracker = RoiTracker(create_detector(), FOE_ID)
+
+    roi_tracker.detect(create_frame((100, 100)))
+
+    # target jumps out of the search window
+    marker_corners, marker_ids = roi_tracker.detect(create_frame((500, 400)))
+    assert marker_ids is not None
+    assert get_marker_center(marker_corners[0])[0] > 500
+
+    stats = roi_tracker.get_stats()
+    assert stats['roi_scans'] == 1
+    assert stats['roi_hits'] == 0
+    assert stats['full_scans'] == 2
+
+    # no target at all
+    marker_corners, marker_ids = roi_tracker.detect(np.full(FRAME_SHAPE, 255, dtype=np.uint8))
+    assert marker_ids is None
+    assert roi_tracker.target_center is None
+
+
+def test_roi_tracker_locks_on_all_foes():
+    roi_tracker = RoiTracker(create_detector(), FOE_ID, refresh_period=10)
+
+    for i in range(20):
+        # two foes moving apart, the window covers both of them
+        video_frame = create_frame((200 - 4 * i, 100))
+        second_frame = create_frame((300 + 4 * i, 300))
+        video_frame[300:300 + MARKER_SIZE] = np.minimum(video_frame[300:300 + MARKER_SIZE],
+                                                        second_frame[300:300 + MARKER_SIZE])
+
+        marker_corners, marker_ids = roi_tracker.detect(video_frame)
+        assert marker_ids is not None
+        assert [marker_id[0] for marker_id in marker_ids] == [FOE_ID, FOE_ID]
+
+    stats = roi_tracker.get_stats()
+    assert roi_tracker.target_count == 2
+    assert stats['roi_hit_rate'] == 1.0
+    assert stats['full_scans'] == 2
+    assert stats['roi_scans'] == 18
@@ -0,0 +1,100 @@
+import sys
+sys.path.append('.')
+import time
+
+import pytest
+from common.serial_telemetry import TelemetryReader
+from pc_control.pc_control import open_arduino_serial_port, send_gun_on, send_motor_x_y_speed
+
+if sys.platform == 'win32':
+    pytest.skip('pseudo-terminals are not available on Windows', allow_module_level=True)
+
+from common.arduino_emulator import ArduinoEmulator
+
+
+EMULATOR_TIMEOUT_IN_SECONDS = 2.0
+
+
+def wait_for_replies(telemetry_reader, num_replies):
+    end_time = time.monotonic() + EMULATOR_TIMEOUT_IN_SECONDS
+    while len(telemetry_reader.get_events()) < num_replies and time.monotonic() < end_time:
+        time.sleep(0.005)
+    return telemetry_reader.get_events()
+
+
+def test_replies_are_parsed_and_matched():
+    telemetry_reader = TelemetryReader(serial_port=None, command_timeout=10.0)
+    telemetry_reader.record_sent(b'GUN_ON\n', 1.0)
+    telemetry_reader.record_sent(b'DC 120 -255\n', 2.0)
+    telemetry_reader.record_sent(b'DC 100 100\n', 3.0)
+    telemetry_reader.record_sent(b'FOO\n', 4.0)
+
+    # the first motor command is never answered
+    lines = ['CMD received', 'GUN_ON', 'Turn on gun motor',
+             'CMD received', 'DC 100 100', 'Motor control', '100', '100',
+             'CMD received', 'FOO', 'CMD unknown',
+             'garbage']
+    for i, line in enumerate(lines):
+        telemetry_reader.parse_line(line, 5.0 + i * 0.001)
+
+    events = telemetry_reader.get_events()
+    assert [event['command'] for event in events] == ['GUN_ON', 'DC 100 100', 'FOO']
+    assert [event['action'] for event in events] == ['Turn on gun motor', 'Motor control', 'CMD unknown']
+    assert events[1]['values'] == [100, 100]
+    assert events[0]['rtt'] == pytest.approx(4.001)
+
+    stats = telemetry_reader.get_stats()
+    assert stats['commands_matched'] == 3
+    assert stats['commands_lost'] == 1
+    assert stats['commands_unknown'] == 1
+    assert stats['unparsed_lines'] == 1
+    assert stats['commands_outstanding'] == 0
+
+
+def test_unanswered_commands_expire():
+    telemetry_reader = TelemetryReader(serial_port=None, command_timeout=1.0, max_outstanding=10)
+
+    # no echoes arrive, the outstanding commands stay bounded by the number and the timeout
+    for i in range(50):
+        telemetry_reader.record_sent(f'DC {i} {i}\n'.encode(), i * 0.01)
+    stats = telemetry_reader.get_stats()
+    assert stats['commands_outstanding'] == 10
+    assert stats['commands_lost'] == 40
+
+    telemetry_reader.record_sent(b'GUN_OFF\n', 10.0)
+    stats = telemetry_reader.get_stats()
+    assert stats['commands_outstanding'] == 1
+    assert stats['commands_lost'] == 50
+
+    # a late echo of an expired command is not matched
+    for line in ['CMD received', 'DC 49 49', 'Motor control', '49', '49']:
+        telemetry_reader.parse_line(line, 10.5)
+    stats = telemetry_reader.get_stats()
+    assert stats['commands_matched'] == 0
+    assert stats['unmatched_replies'] == 1
+    assert stats['commands_outstanding'] == 1
+
+
+def test_round_trip_time_on_emulated_device():
+    PROCESSING_DELAY_IN_SECONDS = 0.02
+
+    with ArduinoEmulator(processing_delay=PROCESSING_DELAY_IN_SECONDS) as emulator:
+        arduino_serial_port = open_arduino_serial_port(emulator.port)
+        telemetry_reader = arduino_serial_port.telemetry_reader
+
+        send_gun_on(arduino_serial_port)
+        for i in range(5):
+            send_motor_x_y_speed(arduino_serial_port, 100 + i, -100)
+            arduino_serial_port.flush()
+            time.sleep(0.05)
+
+        events = wait_for_replies(telemetry_reader, 6)
+        arduino_serial_port.close()
+
+    assert [event['command'] for event in events] == ['GUN_ON'] + [f'DC {100 + i} -100' for i in range(5)]
+    assert events[-1]['values'] == [104, -100]
+
+    stats = telemetry_reader.get_stats()
+    assert stats['commands_matched'] == 6
+    assert stats['commands_lost'] == 0
+    assert PROCESSING_DELAY_IN_SECONDS <= stats['rtt_p50'] <= stats['rtt_p95'] <= stats['rtt_p99'] < 1.0
@@ -0,0 +1,119 @@
+import sys
+sys.path.append('.')
+import threading
+import time
+
+from common.serial_telemetry import TelemetryReader
+from common.serial_writer import SerialCommandWriter
+from pc_control.pc_control import send_gun_off, send_gun_on, send_motor_x_y_speed, send_pull_trigger
+
+
+class SlowSerialPort:
+    '''
+    Serial port stand-in which records written commands and blocks for the given time per write
+    '''
+
+    def __init__(self, write_time=0.0, baudrate=9600):
+        self.write_time = write_time
+        self.baudrate = baudrate
+        self.written = []
+        self.write_started = threading.Event()
+        self.closed = False
+
+    def write(self, data):
+        self.write_started.set()
+        time.sleep(self.write_time)
+        self.written.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+
+def test_motor_commands_are_coalesced():
+    serial_port = SlowSerialPort(write_time=0.05)
+    writer = SerialCommandWriter(serial_port).start()
+
+    # first command occupies the link, the following ones are replaced by the newest one
+    send_motor_x_y_speed(writer, 100, 100)
+    serial_port.write_started.wait(1.0)
+    start_time = time.perf_counter()
+    for i in range(10):
+        send_motor_x_y_speed(writer, 101 + i, 100)
+    # writing does not block the caller
+    assert time.perf_counter() - start_time < 0.02
+
+    writer.close()
+    assert serial_port.closed
+    assert serial_port.written == [b'DC 100 100\n', b'DC 110 100\n']
+
+    stats = writer.get_stats()
+    assert stats['commands_sent'] == 2
+    assert stats['commands_coalesced'] == 9
+    assert stats['commands_dropped'] == 0
+
+
+def test_repeated_motor_commands_are_dropped():
+    serial_port = SlowSerialPort()
+    writer = SerialCommandWriter(serial_port).start()
+
+    send_motor_x_y_speed(writer, 120, -255)
+    writer.flush()
+    send_motor_x_y_speed(writer, 120, -255)
+    send_motor_x_y_speed(writer, 120, -255)
+    writer.close()
+
+    assert serial_port.written == [b'DC 120 -255\n']
+    assert writer.get_stats()['commands_dropped'] == 2
+
+
+def test_gun_commands_are_sent_in_order_ahead_of_motor_commands():
+    serial_port = SlowSerialPort(write_time=0.02)
+    writer = SerialCommandWriter(serial_port).start()
+
+    send_motor_x_y_speed(writer, 100, 100)
+    serial_port.write_started.wait(1.0)
+    send_motor_x_y_speed(writer, 200, 200)
+    send_gun_on(writer)
+    send_pull_trigger(writer)
+    send_gun_off(writer)
+    writer.close()
+
+    assert serial_port.written == [b'DC 100 100\n', b'GUN_ON\n', b'TRG\n', b'GUN_OFF\n', b'DC 200 200\n']
+
+
+def test_motor_commands_are_paced_to_link_bandwidth():
+    BAUD_RATE = 9600
+
+    serial_port = SlowSerialPort(baudrate=BAUD_RATE)
+    writer = SerialCommandWriter(serial_port).start()
+
+    # simulate a frame loop running much faster than the link
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < 0.2:
+        send_motor_x_y_speed(writer, 100 + len(serial_port.written) % 2, 100)
+        time.sleep(0.001)
+    writer.close()
+    elapsed_time = time.perf_counter() - start_time
+
+    # ~11 bytes per command at 960 bytes/s
+    max_commands = elapsed_time * BAUD_RATE / 10 / len(b'DC 100 100\n') + 2
+    assert 2 <= len(serial_port.written) <= max_commands
+    assert writer.get_stats()['commands_coalesced'] > 0
+
+
+def test_failed_writes_are_not_recorded_as_sent():
+    class FailingSerialPort(SlowSerialPort):
+        def write(self, data):
+            if data == b'GUN_OFF\n':
+                raise OSError('write failed')
+            return super().write(data)
+
+    telemetry_reader = TelemetryReader(serial_port=None)
+    writer = SerialCommandWriter(FailingSerialPort(), telemetry_reader=telemetry_reader).start()
+    send_gun_on(writer)
+    send_gun_off(writer)
+    writer.close()
+
+    assert [command for command, timestamp in telemetry_reader.sent_commands] == ['GUN_ON']
+    assert telemetry_reader.get_stats()['commands_lost'] == 0
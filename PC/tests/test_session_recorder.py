@@ -0,0 +1,106 @@
+import sys
+sys.path.append('.')
+import time
+
+import numpy as np
+import pytest
+from common.session_recorder import SessionReader, SessionRecorder
+
+FRAME_SHAPE = (240, 320, 3)
+NUM_FRAMES = 30
+
+
+def create_frame(frame_idx):
+    # frame index is encoded in the pixel values
+    return np.full(FRAME_SHAPE, frame_idx * 8, dtype=np.uint8)
+
+
+def record(recorder, num_frames):
+    put_times = []
+    for frame_idx in range(num_frames):
+        corners = [np.array([[[10, 10], [50, 10], [50, 50], [10, 50]]], dtype=np.float32) + frame_idx]
+        control = {'target': (30 + frame_idx, 30), 'motor_speed_x': np.int64(-100), 'motor_speed_y': 0}
+
+        start_time = time.perf_counter()
+        recorder.record_frame(create_frame(frame_idx), frame_idx / 30, corners, np.array([[0]]), control)
+        put_times.append(time.perf_counter() - start_time)
+    return put_times
+
+
+@pytest.mark.parametrize('encoding', ['raw', 'png', 'jpg', 'none'])
+def test_session_round_trip(tmp_path, encoding):
+    path = str(tmp_path / 'session')
+    recorder = SessionRecorder(path, encoding, metadata={'camera_idx': 0}).start()
+    recorder.record_event('session_start', frame_center=(160, 120))
+    record(recorder, NUM_FRAMES)
+    recorder.close()
+
+    with SessionReader(path) as session:
+        assert session.metadata['camera_idx'] == 0
+        assert session.metadata['stats']['frames_dropped'] == 0
+        assert session.events[0]['name'] == 'session_start'
+        assert session.events[0]['frame_center'] == [160, 120]
+        assert len(session.frames) == NUM_FRAMES
+
+        for frame_idx, (record_, frame) in enumerate(session):
+            assert record_['timestamp'] == frame_idx / 30
+            assert record_['marker_ids'] == [0]
+            assert record_['marker_corners'][0][0] == [10 + frame_idx, 10 + frame_idx]
+            assert record_['control']['motor_speed_x'] == -100
+
+            if encoding == 'none':
+                assert frame is None
+            elif encoding == 'jpg':
+                assert np.abs(frame.astype(int) - create_frame(frame_idx)).max() <= 2
+            else:
+                assert np.array_equal(frame, create_frame(frame_idx))
+
+
+@pytest.mark.parametrize('drop_policy', ['drop_newest', 'drop_oldest'])
+def test_slow_disk_drops_frames(tmp_path, drop_policy):
+    path = str(tmp_path / 'session')
+    recorder = SessionRecorder(path, 'raw', max_queued_frames=4, drop_policy=drop_policy)
+
+    # simulate slow disk
+    encode = recorder._encode
+    recorder._encode = lambda frame: time.sleep(0.02) or encode(frame)
+    recorder.start()
+
+    put_times = record(recorder, NUM_FRAMES)
+    recorder.close()
+
+    # recording never stalls the processing loop
+    assert max(put_times) < 0.01
+
+    stats = recorder.get_stats()
+    assert stats['frames_dropped'] > 0
+    assert stats['frames_recorded'] + stats['frames_dropped'] == NUM_FRAMES
+
+    with SessionReader(path) as session:
+        # telemetry of dropped frames is recorded as well
+        assert len(session.frames) == NUM_FRAMES
+        recorded = [frame_idx for frame_idx, (record_, frame) in enumerate(session) if frame is not None]
+
+    assert len(recorded) == stats['frames_recorded']
+    if drop_policy == 'drop_newest':
+        assert recorded[-1] < NUM_FRAMES - 1
+    else:
+        # newest frames are kept
+        assert recorded[-4:] == list(range(NUM_FRAMES - 4, NUM_FRAMES))
+
+
+def test_dropped_frames_are_not_copied(tmp_path):
+    class CountingFrame:
+        copies = 0
+
+        def copy(self):
+            CountingFrame.copies += 1
+            return create_frame(0)
+
+    # the writer is not started, so the frame queue stays full
+    recorder = SessionRecorder(str(tmp_path / 'session'), 'raw', max_queued_frames=2, drop_policy='drop_newest')
+    for frame_idx in range(10):
+        recorder.record_frame(CountingFrame(), frame_idx / 30, [], None, None)
+
+    assert CountingFrame.copies == 2
+    assert recorder.get_stats()['frames_dropped'] == 8
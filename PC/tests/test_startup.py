@@ -0,0 +1,43 @@
+import sys
+sys.path.append('.')
+import time
+
+import pytest
+from common.startup import StartupTimer, run_startup_steps
+
+
+def slow_step(duration, result):
+    time.sleep(duration)
+    return result
+
+
+def failing_step():
+    raise OSError('port not found')
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_startup_steps(concurrent):
+    timer = StartupTimer()
+
+    start_time = time.perf_counter()
+    steps = run_startup_steps({
+        'a': lambda: slow_step(0.2, 1),
+        'b': lambda: slow_step(0.2, 2),
+        'c': failing_step,
+    }, timer, concurrent=concurrent)
+    results = steps['a'].result(), steps['b'].result()
+    elapsed_time = time.perf_counter() - start_time
+
+    assert results == (1, 2)
+    with pytest.raises(OSError):
+        steps['c'].result()
+
+    # concurrent steps take as long as the slowest one
+    assert elapsed_time < 0.35 if concurrent else elapsed_time >= 0.4
+
+    assert timer.mark_first_frame()
+    assert not timer.mark_first_frame()
+    breakdown = timer.get_breakdown()
+    assert set(breakdown) == {'a', 'b', 'c', 'time_to_first_frame'}
+    assert breakdown['a'] >= 0.2
+    assert breakdown['time_to_first_frame'] >= elapsed_time
@@ -0,0 +1,74 @@
+import sys
+sys.path.append('.')
+import cv2
+import numpy as np
+from common.frame_grabber import LatestFrameGrabber
+from common.markers import create_detector
+from common.synthetic_camera import (SyntheticCamera, SyntheticMarker, create_default_scene, linear_trajectory,
+    waypoint_trajectory)
+
+WIDTH = 640
+HEIGHT = 480
+
+
+def test_synthetic_camera_video_capture_interface():
+    NUM_FRAMES = 5
+    FPS = 60
+
+    synthetic_camera = create_default_scene(WIDTH, HEIGHT, fps=FPS, num_frames=NUM_FRAMES)
+    assert synthetic_camera.get(cv2.CAP_PROP_FRAME_WIDTH) == WIDTH
+    assert synthetic_camera.get(cv2.CAP_PROP_FRAME_HEIGHT) == HEIGHT
+    assert synthetic_camera.get(cv2.CAP_PROP_FPS) == FPS
+
+    for i in range(NUM_FRAMES):
+        ret, video_frame = synthetic_camera.read()
+        assert ret
+        assert video_frame.shape == (HEIGHT, WIDTH, 3)
+        assert video_frame.dtype == np.uint8
+
+    ret, video_frame = synthetic_camera.read()
+    assert not ret
+    assert video_frame is None
+    assert synthetic_camera.get(cv2.CAP_PROP_POS_FRAMES) == NUM_FRAMES
+
+    synthetic_camera.release()
+    assert not synthetic_camera.isOpened()
+
+
+def test_synthetic_camera_is_deterministic():
+    video_frame_1 = create_default_scene(WIDTH, HEIGHT, seed=7).render(42)
+    video_frame_2 = create_default_scene(WIDTH, HEIGHT, seed=7).render(42)
+    video_frame_3 = create_default_scene(WIDTH, HEIGHT, seed=8).render(42)
+
+    assert np.array_equal(video_frame_1, video_frame_2)
+    assert not np.array_equal(video_frame_1, video_frame_3)
+
+
+def test_synthetic_markers_are_detected_at_ground_truth():
+    markers = [
+        SyntheticMarker(0, 100, linear_trajectory((150, 150), (60, 0)), tilt=20.0),
+        SyntheticMarker(1, 80, waypoint_trajectory([(0, 450, 350), (1, 400, 300)]), rotation_speed=30.0),
+    ]
+    synthetic_camera = SyntheticCamera(markers, WIDTH, HEIGHT, fps=10, blur=0.7, noise=2.0, lighting_amplitude=0.2)
+    detect_markers = create_detector()
+
+    for i in range(10):
+        ret, video_frame = synthetic_camera.read()
+        marker_corners, marker_ids = detect_markers(video_frame)
+
+        assert sorted(marker_ids.ravel()) == [0, 1]
+        for marker_id, corners in synthetic_camera.ground_truth:
+            detected_corners = marker_corners[list(marker_ids.ravel()).index(marker_id)]
+            assert np.abs(detected_corners.reshape(-1, 2) - corners).max() < 2.0
+
+
+def test_unthreaded_frame_grabber_reads_every_frame():
+    NUM_FRAMES = 5
+
+    video_capture = LatestFrameGrabber(create_default_scene(WIDTH, HEIGHT, num_frames=NUM_FRAMES), threaded=False)
+    video_capture.start()
+    while video_capture.read()[0]:
+        pass
+
+    assert video_capture.get_stats()['frames_delivered'] == NUM_FRAMES
+    assert video_capture.frames_dropped == 0
@@ -0,0 +1,99 @@
+import sys
+sys.path.append('.')
+import numpy as np
+from common.target_predictor import KalmanTracker
+from common.targeting import FOE_ID, calculate_control, calculate_predicted_control
+
+
+FPS = 30
+LATENCY_IN_SECONDS = 0.1
+
+
+def track(tracker, trajectory, num_frames, noise=1.0, dropouts=(), seed=0):
+    rng = np.random.default_rng(seed)
+    for frame_idx in range(num_frames):
+        t = frame_idx / FPS
+        measurement = None if frame_idx in dropouts else trajectory(t) + rng.normal(0, noise, 2)
+        tracking = tracker.update(measurement, t)
+    return tracking, (num_frames - 1) / FPS
+
+
+def test_constant_velocity_prediction_leads_target():
+    trajectory = lambda t: np.array([100.0, 200.0]) + np.array([300.0, -150.0]) * t
+
+    tracker = KalmanTracker('cv')
+    tracking, t = track(tracker, trajectory, 60)
+    assert tracking
+
+    predicted = np.array(tracker.predict(t + LATENCY_IN_SECONDS))
+    truth = trajectory(t + LATENCY_IN_SECONDS)
+
+    # the last observation lags the target by velocity * latency (~33 px)
+    assert np.linalg.norm(predicted - truth) < 5
+    assert np.linalg.norm(trajectory(t) - truth) > 30
+    assert np.allclose(tracker.get_velocity(), (300, -150), atol=20)
+
+
+def test_constant_acceleration_prediction():
+    trajectory = lambda t: np.array([100.0, 100.0]) + np.array([50.0, 0.0]) * t + 0.5 * np.array([400.0, 200.0]) * t**2
+
+    errors = {'cv': [], 'ca': []}
+    for model in errors:
+        for seed in range(5):
+            tracker = KalmanTracker(model)
+            tracking, t = track(tracker, trajectory, 60, seed=seed)
+            assert tracking
+            errors[model].append(np.linalg.norm(np.array(tracker.predict(t + LATENCY_IN_SECONDS)) -
+                                                trajectory(t + LATENCY_IN_SECONDS)))
+
+    assert np.mean(errors['ca']) < 3
+    assert np.mean(errors['ca']) < np.mean(errors['cv'])
+
+
+def test_coasting_through_dropouts():
+    trajectory = lambda t: np.array([640.0, 360.0]) + np.array([200.0, 0.0]) * t
+
+    # short dropout at the end - the target is still tracked and predicted along its path
+    tracker = KalmanTracker('cv')
+    tracking, t = track(tracker, trajectory, 40, dropouts=range(35, 40))
+    assert tracking
+    assert tracker.get_stats()['coasted'] == 5
+    assert np.linalg.norm(np.array(tracker.predict(t)) - trajectory(t)) < 5
+
+    # dropout longer than max. coast time - the track is dropped
+    tracker = KalmanTracker('cv', max_coast_time=0.2)
+    tracking, t = track(tracker, trajectory, 40, dropouts=range(30, 40))
+    assert not tracking
+    assert tracker.predict(t) is None
+
+
+def test_track_restarts_on_jump():
+    tracker = KalmanTracker('cv')
+    for frame_idx in range(10):
+        tracker.update((100.0, 100.0), frame_idx / FPS)
+
+    # a different foe appears on the other side of the frame
+    tracker.update((1000.0, 600.0), 10 / FPS)
+    assert tracker.get_stats()['restarts'] == 1
+    assert np.allclose(tracker.predict(10 / FPS), (1000, 600))
+
+
+def test_predicted_control():
+    FRAME_CENTER = (640, 360)
+
+    tracker = KalmanTracker('cv')
+    for frame_idx in range(30):
+        t = frame_idx / FPS
+        foe_markers = {FOE_ID: (int(400 + 300 * t), 360)}
+        control = calculate_predicted_control(foe_markers, FRAME_CENTER, tracker, t, LATENCY_IN_SECONDS)
+
+    # aims ahead of the observed position
+    assert control['observed'] == foe_markers[FOE_ID]
+    assert control['target'][0] > foe_markers[FOE_ID][0] + 20
+    assert control['error_x'] > calculate_control(foe_markers, FRAME_CENTER)['error_x']
+
+    # foe lost for a frame - control keeps running on the prediction
+    control = calculate_predicted_control({}, FRAME_CENTER, tracker, 30 / FPS, LATENCY_IN_SECONDS)
+    assert control is not None
+    assert control['observed'] is None
+    assert control['motor_speed_x'] != 0
@@ -0,0 +1,53 @@
+import sys
+sys.path.append('.')
+from pc_control.pc_control import send_motor_x_y_speed, send_gun_on
+from simulator.turret_simulator import (MOTOR_DEADBAND_PWM, SimulatedTurret, get_default_controller_settings,
+    simulate, sweep)
+
+
+def test_simulated_turret_consumes_serial_commands():
+    turret = SimulatedTurret(baud_rate=9600)
+
+    send_gun_on(turret)
+    send_motor_x_y_speed(turret, 255, MOTOR_DEADBAND_PWM - 1)
+    assert turret.commands_received == 2
+
+    # commands take effect only after they have been transmitted over the serial link
+    turret.step(0.001)
+    assert not turret.gun_on
+    turret.step(1.0)
+    assert turret.gun_on
+
+    # X motor at full speed, Y motor within deadband
+    assert turret.pose[0] > 0
+    assert turret.pose[1] == 0
+
+
+def test_simulated_turret_pwm_saturation():
+    turret = SimulatedTurret()
+    send_motor_x_y_speed(turret, 1000, -1000)
+    turret.step(1.0)
+    assert list(turret.pwm) == [255, -255]
+
+
+def test_simulate_stationary_target_locks():
+    metrics = simulate(get_default_controller_settings(), {'target_start': [10, -5], 'target_velocity': [0, 0]})
+
+    assert metrics['time_to_lock'] is not None
+    assert metrics['settling_time'] is not None
+    assert metrics['command_rate'] > 0
+
+
+def test_sweep_ranks_settings():
+    settings_grid = {
+        'deadzone': [50],
+        'min_motor_speed': [100],
+        'max_motor_speed': [255],
+        'k': [0.5, 1.0],
+    }
+
+    results = sweep(settings_grid, num_scenarios=3, jobs=1)
+
+    assert len(results) == 2
+    assert {result['settings']['k'] for result in results} == {0.5, 1.0}
+    assert results[0]['settled_ratio'] >= results[1]['settled_ratio']